@@ -0,0 +1,300 @@
+"""This Python module contains the benchmarks used to measure the performance of this project.
+
+Running this file times the computation of compatibility scores and recommendations on the bundled dataset with an
+increasing number of worker processes, compares the memory used to store the ratings by the User and Movie classes
+with the memory used by plain dicts, compares the heap-based recommendation scoring with the sort-based scoring it
+replaced, measures the speedup and recall of the approximate 'lsh' compat engine on the bundled dataset and on a
+larger synthetic one, compares the item-based engine with the user-based one on both datasets, and measures the peak
+memory of the 'out_of_core' compat engine with several memory budgets on the synthetic one.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import csv
+import os
+import time
+import tracemalloc
+from typing import Callable, Container, Mapping
+
+from graph import Graph, compute_recommendations
+from item_similarity import ItemIndex
+from lsh import recall
+from movie_user_classes import Movie, User
+from parallel import process_compat_users_parallel, process_recommends_parallel
+from read_data import import_movies, import_ratings
+from synthetic_data import build_graph
+
+MOVIES_FILE = 'data/movies.csv'
+RATINGS_FILE = 'data/ratings.csv'
+LSH_PARAMS = [(32, 1), (64, 1), (32, 2)]
+REQUEST_SAMPLE = 100
+MAX_NEIGHBOURS = 100
+MIN_SHARED_MOVIES = 3
+MIN_COMPAT_SCORE = 4.0
+MIN_RATING_SCORE = 4.0
+RECOMMENDATION_LENGTH = 10
+MEMORY_BUDGETS = [16 * 2 ** 20, 64 * 2 ** 20, 256 * 2 ** 20]
+
+
+def load_graph(movie_file: str, rating_file: str) -> Graph:
+    """Return a new graph populated with the movies in movie_file and the ratings in rating_file
+    """
+    graph = Graph()
+    import_movies(movie_file, graph)
+    import_ratings(rating_file, graph)
+    return graph
+
+
+def bench_parallel(graph: Graph, worker_counts: list[int]) -> list[tuple[int, float, float]]:
+    """Time the computation of compatibility scores and recommendations for all users in graph, first on a single
+    process with the Graph methods (reported as 0 workers), then with each number of workers in worker_counts.
+
+    Return a list of (workers, compat seconds, recommends seconds) tuples.
+    """
+    results = []
+    start = time.perf_counter()
+    graph.process_compat_users()
+    compat_time = time.perf_counter() - start
+    start = time.perf_counter()
+    graph.process_movie_recommends(MIN_COMPAT_SCORE, MIN_RATING_SCORE, RECOMMENDATION_LENGTH)
+    results.append((0, compat_time, time.perf_counter() - start))
+
+    for workers in worker_counts:
+        start = time.perf_counter()
+        process_compat_users_parallel(graph, workers)
+        compat_time = time.perf_counter() - start
+        start = time.perf_counter()
+        process_recommends_parallel(graph, (MIN_COMPAT_SCORE, MIN_RATING_SCORE, RECOMMENDATION_LENGTH), workers)
+        results.append((workers, compat_time, time.perf_counter() - start))
+    return results
+
+
+def print_parallel_results(results: list[tuple[int, float, float]]) -> None:
+    """Print the results of bench_parallel as a table, with the speedup of each row over the first one
+    """
+    base_total = results[0][1] + results[0][2]
+    print(f"{'workers':>8} {'compat (s)':>11} {'recommend (s)':>14} {'speedup':>8}")
+    for workers, compat_time, recommend_time in results:
+        label = 'serial' if workers == 0 else str(workers)
+        speedup = base_total / (compat_time + recommend_time)
+        print(f"{label:>8} {compat_time:>11.2f} {recommend_time:>14.2f} {speedup:>7.2f}x")
+
+
+def bench_recommends(graph: Graph) -> dict[str, float]:
+    """Return the number of seconds taken to compute the recommendations of every user in graph from their current
+    user_compats, with compute_recommendations ('heap') and with the sort-based scoring it replaced ('sort')
+    """
+    results = {}
+    for name, recommend in (('sort', _sorted_recommendations), ('heap', compute_recommendations)):
+        start = time.perf_counter()
+        for user in graph.get_all_users():
+            recommend(user.user_compats, lambda uid: graph.get_user(uid).movie_ratings, user.get_movies(),
+                      (MIN_COMPAT_SCORE, MIN_RATING_SCORE, RECOMMENDATION_LENGTH))
+        results[name] = time.perf_counter() - start
+    return results
+
+
+def _sorted_recommendations(user_compats: dict[int, float], get_movie_ratings: Callable[[int], Mapping[int, float]],
+                            _: Container[int], recommend_params: tuple[float, float, int]) -> list[int]:
+    """The recommendation scoring used before compute_recommendations: every (movie id, score) tuple of every
+    compatible user is collected in one list, which is sorted before the duplicates are removed.
+    """
+    min_score, min_rating, recommends_length = recommend_params
+    recommendation_list = []
+    for uid, comp_score in sorted(user_compats.items(), key=lambda x: x[1], reverse=True):
+        if comp_score < min_score:
+            continue
+        recommendation_list.extend((k, rating * comp_score) for k, rating in get_movie_ratings(uid).items()
+                                   if rating >= min_rating)
+    sorted_tuples = sorted(recommendation_list, key=lambda x: x[1], reverse=True)
+    seen = set()
+    unique_list = []
+    for movie_id, _ in sorted_tuples:
+        if movie_id not in seen:
+            seen.add(movie_id)
+            unique_list.append(movie_id)
+    return unique_list[:recommends_length]
+
+
+def print_recommends_results(results: dict[str, float]) -> None:
+    """Print the results of bench_recommends
+    """
+    for name, seconds in results.items():
+        print(f"{name:>8}: {seconds:8.2f} s ({results['sort'] / seconds:.2f}x)")
+
+
+def bench_lsh(graph: Graph, lsh_params: list[tuple[int, int]]) -> list[tuple[str, float, float]]:
+    """Time the exact 'sparse' compat engine on graph, then the 'lsh' engine with each (bands, rows) in lsh_params,
+    using the neighbour limits MAX_NEIGHBOURS and MIN_SHARED_MOVIES.
+
+    Return a list of (engine, seconds, recall) tuples, where recall is the fraction of the exact user_compats entries
+    that the engine found.
+    """
+    graph.set_neighbour_limits(MAX_NEIGHBOURS, MIN_SHARED_MOVIES)
+    start = time.perf_counter()
+    graph.process_compat_users('sparse')
+    results = [('sparse', time.perf_counter() - start, 1.0)]
+    exact = {user.user_id: user.user_compats for user in graph.get_all_users()}
+
+    for bands, rows in lsh_params:
+        start = time.perf_counter()
+        graph.process_compat_users('lsh', (bands, rows))
+        seconds = time.perf_counter() - start
+        approximate = {user.user_id: user.user_compats for user in graph.get_all_users()}
+        results.append((f"lsh {bands}x{rows}", seconds, recall(exact, approximate)))
+    return results
+
+
+def print_lsh_results(name: str, results: list[tuple[str, float, float]]) -> None:
+    """Print the results of bench_lsh on the dataset called name
+    """
+    print(f"{name}: {'engine':>10} {'time (s)':>9} {'speedup':>8} {'recall':>7}")
+    for engine, seconds, engine_recall in results:
+        print(f"{'':>{len(name) + 1}} {engine:>10} {seconds:>9.2f} {results[0][1] / seconds:>7.2f}x "
+              f"{engine_recall:>7.1%}")
+
+
+def bench_item(graph: Graph) -> dict[str, tuple[float, float]]:
+    """Return the (seconds to precompute, mean seconds per user request) of the user-based engine ('user') and of the
+    item-based engine ('item') on graph.
+
+    For the user-based engine, the precomputation is the 'sparse' compat engine over all users, and a request computes
+    the compat scores and recommendations of one user in lazy mode. For the item-based engine, the precomputation
+    builds the ItemIndex, and a request merges the neighbour lists of the movies the user rated. Requests are timed
+    over the first REQUEST_SAMPLE users.
+    """
+    graph.set_neighbour_limits(MAX_NEIGHBOURS, MIN_SHARED_MOVIES)
+    users = graph.get_all_users()[:REQUEST_SAMPLE]
+    start = time.perf_counter()
+    graph.process_compat_users('sparse')
+    user_build = time.perf_counter() - start
+
+    graph.enable_lazy(MIN_COMPAT_SCORE, MIN_RATING_SCORE, RECOMMENDATION_LENGTH, len(users))
+    start = time.perf_counter()
+    for user in users:
+        graph.get_recommendations(user)
+    user_request = (time.perf_counter() - start) / len(users)
+
+    start = time.perf_counter()
+    index = ItemIndex(graph.get_all_movies())
+    item_build = time.perf_counter() - start
+    start = time.perf_counter()
+    for user in users:
+        index.recommend(user, MIN_RATING_SCORE, MIN_COMPAT_SCORE, RECOMMENDATION_LENGTH)
+    item_request = (time.perf_counter() - start) / len(users)
+    return {'user': (user_build, user_request), 'item': (item_build, item_request)}
+
+
+def print_item_results(name: str, results: dict[str, tuple[float, float]]) -> None:
+    """Print the results of bench_item on the dataset called name
+    """
+    print(f"{name}: {'engine':>6} {'build (s)':>10} {'request (ms)':>13}")
+    for engine, (build, request) in results.items():
+        print(f"{'':>{len(name) + 1}} {engine:>6} {build:>10.2f} {request * 1000:>13.2f}")
+
+
+def bench_out_of_core(graph: Graph, memory_budgets: list[int]) -> list[tuple[str, float, int]]:
+    """Measure the 'sparse' compat engine on graph, then the 'out_of_core' engine with each memory budget in
+    memory_budgets, using the neighbour limits MAX_NEIGHBOURS and MIN_SHARED_MOVIES and keeping the scores of at least
+    MIN_COMPAT_SCORE.
+
+    Return a list of (engine, seconds, peak bytes) tuples, where peak bytes is the most memory allocated at once while
+    the scores were computed, including the user_compats kept.
+    """
+    graph.set_neighbour_limits(MAX_NEIGHBOURS, MIN_SHARED_MOVIES)
+    results = []
+    for memory_budget in [None] + memory_budgets:
+        tracemalloc.start()
+        start = time.perf_counter()
+        if memory_budget is None:
+            graph.process_compat_users('sparse')
+        else:
+            graph.process_compat_users('out_of_core', out_of_core_params=(memory_budget, MIN_COMPAT_SCORE))
+        seconds = time.perf_counter() - start
+        engine = 'sparse' if memory_budget is None else f"{memory_budget / 2 ** 20:.0f} MiB"
+        results.append((engine, seconds, tracemalloc.get_traced_memory()[1]))
+        tracemalloc.stop()
+    return results
+
+
+def print_out_of_core_results(name: str, results: list[tuple[str, float, int]]) -> None:
+    """Print the results of bench_out_of_core on the dataset called name
+    """
+    print(f"{name}: {'engine':>10} {'time (s)':>9} {'peak (MiB)':>11}")
+    for engine, seconds, peak in results:
+        print(f"{'':>{len(name) + 1}} {engine:>10} {seconds:>9.2f} {peak / 2 ** 20:>11.2f}")
+
+
+class _DictUser:
+    """ A user storing its ratings in a dict, as User did before it used SortedRatings
+    """
+    user_id: int
+    movie_ratings: dict[int, float]
+    user_compats: dict[int, float]
+    recommendations: list[int]
+
+    def __init__(self, user_id: int) -> None:
+        self.user_id = user_id
+        self.movie_ratings = {}
+        self.user_compats = {}
+        self.recommendations = []
+
+
+class _DictMovie:
+    """ A movie storing its ratings in a dict, as Movie did before it used SortedRatings
+    """
+    movie_id: int
+    title: str
+    user_ratings: dict[int, float]
+
+    def __init__(self, movie_id: int, title: str) -> None:
+        self.movie_id = movie_id
+        self.title = title
+        self.user_ratings = {}
+
+
+def bench_memory(rating_file: str) -> dict[str, int]:
+    """Return the number of bytes allocated to store every rating in rating_file twice (once per user and once per
+    movie), with the User and Movie classes ('compact') and with the dict-based classes they replaced ('dicts').
+    """
+    with open(rating_file, 'r', encoding='utf8') as file:
+        reader = csv.reader(file)
+        next(reader)
+        rows = [(int(row[0]), int(row[1]), float(row[2])) for row in reader]
+
+    results = {}
+    for name, user_class, movie_class in (('dicts', _DictUser, _DictMovie), ('compact', User, Movie)):
+        tracemalloc.start()
+        users, movies = {}, {}
+        for user_id, movie_id, rating in rows:
+            if user_id not in users:
+                users[user_id] = user_class(user_id)
+            if movie_id not in movies:
+                movies[movie_id] = movie_class(movie_id, '')
+            users[user_id].movie_ratings[movie_id] = rating
+            movies[movie_id].user_ratings[user_id] = rating
+        results[name] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del users, movies
+    return results
+
+
+def print_memory_results(results: dict[str, int]) -> None:
+    """Print the results of bench_memory
+    """
+    for name, size in results.items():
+        print(f"{name:>8}: {size / 2 ** 20:8.2f} MiB ({size / results['dicts']:.0%} of dicts)")
+
+
+if __name__ == '__main__':
+    cpus = os.cpu_count() or 1
+    counts = sorted({1, 2, 4, cpus} | set(range(8, cpus + 1, 8)))
+    print_parallel_results(bench_parallel(load_graph(MOVIES_FILE, RATINGS_FILE), counts))
+    print_memory_results(bench_memory(RATINGS_FILE))
+    bundled_graph = load_graph(MOVIES_FILE, RATINGS_FILE)
+    bundled_graph.process_compat_users('sparse')
+    print_recommends_results(bench_recommends(bundled_graph))
+    print_lsh_results('bundled', bench_lsh(bundled_graph, LSH_PARAMS))
+    print_lsh_results('synthetic', bench_lsh(build_graph(300_000, 6_000, 20_000), LSH_PARAMS))
+    print_item_results('bundled', bench_item(load_graph(MOVIES_FILE, RATINGS_FILE)))
+    print_item_results('synthetic', bench_item(build_graph(1_000_000, 20_000, 2_000)))
+    print_out_of_core_results('synthetic', bench_out_of_core(build_graph(1_000_000, 20_000, 2_000), MEMORY_BUDGETS))
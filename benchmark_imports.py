@@ -0,0 +1,99 @@
+"""This Python module contains the benchmark used to catch regressions in how long the core modules take to import,
+which is most of the cold start time of the pipeline, the server and the workers:
+
+    python benchmark_imports.py --runs 5
+
+Each module is imported in a fresh interpreter run with -X importtime, which reports the cumulative time spent
+importing every module. The best time over the runs is compared against the budget of the module in IMPORT_BUDGETS,
+and the core modules must not import any of the GUI or linting modules in FORBIDDEN_MODULES. The exit status is 1 if
+any module is over its budget or imports a forbidden module, and 0 otherwise.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import argparse
+import subprocess
+import sys
+
+# Most seconds each core module may take to import, including the modules it imports
+IMPORT_BUDGETS = {
+    'movie_user_classes': 0.02,
+    'graph': 0.25,
+    'read_data': 0.25,
+    'snapshot': 0.25,
+    'pipeline': 0.3,
+    'shared_graph': 0.25,
+}
+FORBIDDEN_MODULES = ('tkinter', 'python_ta', 'pylint', 'doctest')
+RUNS = 5
+
+
+def parse_importtime(output: str) -> dict[str, float]:
+    """Return a mapping from the name of each module imported to the cumulative seconds it took to import, given the
+    output of an interpreter run with -X importtime
+
+    >>> parse_importtime('import time: self [us] | cumulative | imported package\\n'
+    ...                  'import time:       120 |        120 |   lru\\n'
+    ...                  'import time:      2000 |       2120 | graph\\n')
+    {'lru': 0.00012, 'graph': 0.00212}
+    """
+    times = {}
+    for line in output.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        times[parts[2].strip()] = int(parts[1]) / 1_000_000
+    return times
+
+
+def measure_import(module: str, runs: int = RUNS) -> tuple[float, set[str]]:
+    """Return the best cumulative seconds module took to import over runs fresh interpreters, and the names of the
+    modules it imported
+
+    Preconditions:
+    - runs > 0
+    """
+    best, imported = None, set()
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"], capture_output=True,
+                                text=True, check=True)
+        times = parse_importtime(result.stderr)
+        imported = set(times)
+        if best is None or times[module] < best:
+            best = times[module]
+    return best, imported
+
+
+def check_budgets(budgets: dict[str, float], runs: int = RUNS) -> tuple[dict[str, float], list[str]]:
+    """Measure the import time of every module in budgets, and return a tuple (times, failures): the best import
+    time of each module, and a description of every module over its budget or importing a forbidden module
+    """
+    times, failures = {}, []
+    for module, budget in budgets.items():
+        times[module], imported = measure_import(module, runs)
+        if times[module] > budget:
+            failures.append(f"{module}: imported in {times[module] * 1000:.1f} ms, over its budget of "
+                            f"{budget * 1000:.0f} ms")
+        forbidden = sorted(name for name in imported if name.split('.')[0] in FORBIDDEN_MODULES)
+        if forbidden:
+            failures.append(f"{module}: imports {', '.join(forbidden)}")
+    return times, failures
+
+
+def main(argv: list[str]) -> int:
+    """Check the import time budgets with the command line arguments in argv, and return the exit status
+    """
+    parser = argparse.ArgumentParser(description='Check how long the core modules take to import.')
+    parser.add_argument('--runs', type=int, default=RUNS, help='fresh interpreters each module is imported in')
+    args = parser.parse_args(argv)
+
+    times, failures = check_budgets(IMPORT_BUDGETS, args.runs)
+    print(f"{'module':<20}{'import ms':>12}{'budget ms':>12}")
+    for module, seconds in times.items():
+        print(f"{module:<20}{seconds * 1000:>12.1f}{IMPORT_BUDGETS[module] * 1000:>12.0f}")
+    for failure in failures:
+        print('REGRESSION:', failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
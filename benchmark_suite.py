@@ -0,0 +1,125 @@
+"""This Python module contains the benchmark suite used to measure how the loading and recommendation pipeline scales
+with the size of the dataset.
+
+For each requested size, a synthetic dataset is generated (see synthetic_data.py), and import_movies, import_ratings,
+process_compat_users and process_movie_recommends are timed separately, with the peak memory allocated during each
+phase. The results are written as JSON, and can be compared against the results of an earlier run to catch
+regressions:
+
+    python benchmark_suite.py --sizes 100000 1000000 --output results.json --baseline previous.json
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+from graph import Graph
+from instrumentation import Instrumentation
+from out_of_core import DEFAULT_MEMORY_BUDGET
+from read_data import import_movies, import_ratings
+from synthetic_data import SCALES, write_dataset
+
+DATA_DIR = 'data/synthetic'
+MIN_COMPAT_SCORE = 4.0
+MIN_RATING_SCORE = 4.0
+RECOMMENDATION_LENGTH = 10
+MAX_NEIGHBOURS = 100
+MIN_SHARED_MOVIES = 3
+REGRESSION_THRESHOLD = 1.25
+
+
+def run_suite(sizes: list[int], engine: str, data_dir: str = DATA_DIR) -> dict:
+    """Run the pipeline on a synthetic dataset of each size in sizes, computing compat scores with engine, and
+    return the results as a JSON-compatible dict
+    """
+    results = []
+    for size in sizes:
+        movie_file, rating_file = write_dataset(data_dir, size)
+        graph = Graph()
+        graph.set_neighbour_limits(MAX_NEIGHBOURS, MIN_SHARED_MOVIES)
+        instrumentation = Instrumentation(trace_memory=True)
+        with instrumentation.phase('import_movies') as progress:
+            import_movies(movie_file, graph, progress)
+        with instrumentation.phase('import_ratings') as progress:
+            import_ratings(rating_file, graph, progress)
+        # The generator drops repeated (user, movie) pairs, so fewer than size ratings may have been written
+        num_ratings = sum(len(user.movie_ratings) for user in graph.get_all_users())
+        with instrumentation.phase('process_compat_users') as progress:
+            graph.process_compat_users(engine, progress=progress,
+                                       out_of_core_params=(DEFAULT_MEMORY_BUDGET, MIN_COMPAT_SCORE))
+        with instrumentation.phase('process_movie_recommends') as progress:
+            graph.process_movie_recommends(MIN_COMPAT_SCORE, MIN_RATING_SCORE, RECOMMENDATION_LENGTH, progress)
+        for stats in instrumentation.phases:
+            results.append({'size': size, 'phase': stats.name, 'seconds': stats.seconds, 'ratings': num_ratings,
+                            'rows_per_second': num_ratings / stats.seconds, 'peak_bytes': stats.memory_peak,
+                            'users': len(graph.get_all_users())})
+    return {
+        'meta': {'engine': engine, 'python': platform.python_version(), 'platform': platform.platform(),
+                 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'results': results,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list[str]:
+    """Return a description of every (size, phase) whose time or peak memory in results is more than threshold times
+    its value in baseline
+
+    >>> old = {'results': [{'size': 10, 'phase': 'a', 'seconds': 1.0, 'peak_bytes': 100}]}
+    >>> new = {'results': [{'size': 10, 'phase': 'a', 'seconds': 2.0, 'peak_bytes': 100}]}
+    >>> compare(new, old)
+    ['a @ 10 rows: seconds 1 -> 2 (2.00x)']
+    """
+    previous = {(entry['size'], entry['phase']): entry for entry in baseline['results']}
+    regressions = []
+    for row in results['results']:
+        old_row = previous.get((row['size'], row['phase']))
+        if old_row is None:
+            continue
+        for metric in ('seconds', 'peak_bytes'):
+            if old_row[metric] > 0 and row[metric] / old_row[metric] > threshold:
+                regressions.append(f"{row['phase']} @ {row['size']} rows: {metric} {old_row[metric]:.3g} -> "
+                                   f"{row[metric]:.3g} ({row[metric] / old_row[metric]:.2f}x)")
+    return regressions
+
+
+def print_results(results: dict) -> None:
+    """Print results as a table
+    """
+    print(f"{'rows':>10} {'phase':>25} {'time (s)':>9} {'rows/s':>11} {'peak MiB':>9}")
+    for row in results['results']:
+        print(f"{row['size']:>10} {row['phase']:>25} {row['seconds']:>9.2f} {row['rows_per_second']:>11.0f} "
+              f"{row['peak_bytes'] / 2 ** 20:>9.1f}")
+
+
+def main(argv: list[str]) -> int:
+    """Run the suite with the command line arguments in argv, and return the exit status: 1 if a regression against
+    the baseline was found, and 0 otherwise
+    """
+    parser = argparse.ArgumentParser(description='Time the loading and recommendation pipeline at several scales.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[min(SCALES)],
+                        help=f"number of ratings of each dataset (MovieLens-like scales: {sorted(SCALES)})")
+    parser.add_argument('--engine', default='sparse', choices=['python', 'sparse', 'lsh', 'out_of_core'])
+    parser.add_argument('--data-dir', default=DATA_DIR, help='where the synthetic datasets are written')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.sizes, args.engine, args.data_dir)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf8') as file:
+            regressions = compare(results, json.load(file))
+        for regression in regressions:
+            print('REGRESSION:', regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,146 @@
+"""This Python module contains the bulk export of the recommendations and most compatible users of every user, run
+without the graphical user interface:
+
+    python export.py recommendations.jsonl.gz --top-compats 10
+
+The graph is loaded in lazy mode (see pipeline.py), and the users are exported in ascending order of id, each one as
+soon as its results are computed. Only the results of the last CACHE_SIZE users stay in memory.
+
+The output is written in chunks of CHECKPOINT_USERS users. After each chunk, the id of the last user written and the
+size of the output are saved to a progress file next to it, so an interrupted export can be resumed with --resume:
+the output is cut back to the last chunk saved, and the export continues from the next user. If the output is missing
+or shorter than the progress file says, the export starts again from the first user. When the output is compressed,
+each chunk is a separate gzip member, and the members of a gzip file are read back as one stream.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+from typing import BinaryIO, Optional
+
+from graph import Graph
+from instrumentation import Instrumentation, JsonLogSink, ProgressFn
+from movie_user_classes import User
+from pipeline import load
+
+CHECKPOINT_USERS = 100
+TOP_COMPATS = 10
+CSV_HEADER = ['user_id', 'recommendations', 'compats']
+
+
+def export_all(graph: Graph, path: str, output_format: tuple[str, bool, int] = ('jsonl', False, TOP_COMPATS),
+               resume: bool = False, progress: Optional[ProgressFn] = None) -> int:
+    """Write the recommendations and top_compats most compatible users of every user in graph to path, in the format
+    fmt, compressed if compress, where output_format is (fmt, compress, top_compats), and return the number of users
+    written. If resume, the export continues from the progress file of path, if there is one and path still holds the
+    chunks it lists. If progress is not None, it is called with the number of users exported so far.
+
+    Preconditions:
+    - output_format[0] in {'csv', 'jsonl'}
+    - output_format[2] >= 0
+    """
+    fmt, compress, top_compats = output_format
+    progress_path = path + '.progress'
+    state = _read_progress(progress_path) if resume else {}
+    if state and (not os.path.exists(path) or os.path.getsize(path) < state['offset']):
+        state = {}
+    users = sorted(graph.get_all_users(), key=lambda u: u.user_id)
+    if state:
+        users = [user for user in users if user.user_id > state['last_user_id']]
+
+    written = 0
+    with open(path, 'r+b' if state else 'wb') as raw:
+        if state:
+            raw.truncate(state['offset'])
+            raw.seek(state['offset'])
+        elif fmt == 'csv':
+            _write_chunk(raw, compress, fmt, [CSV_HEADER])
+        for start in range(0, len(users), CHECKPOINT_USERS):
+            chunk = users[start:start + CHECKPOINT_USERS]
+            _write_chunk(raw, compress, fmt, [_user_row(graph, user, fmt, top_compats) for user in chunk])
+            raw.flush()
+            os.fsync(raw.fileno())
+            _write_progress(progress_path, {'last_user_id': chunk[-1].user_id, 'offset': raw.tell()})
+            written += len(chunk)
+            if progress is not None:
+                progress(written, len(users))
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    return written
+
+
+def _user_row(graph: Graph, user: User, fmt: str, top_compats: int) -> list | dict:
+    """Return the row of user in the given format: a list of CSV cells, or a dict to write as JSON
+    """
+    user_compats = graph.get_user_compats(user)
+    ranked = sorted(user_compats.items(), key=lambda item: item[1], reverse=True)[:top_compats]
+    recommendations = graph.get_recommendations(user)
+    if fmt == 'csv':
+        return [user.user_id, ' '.join(str(movie_id) for movie_id in recommendations),
+                ' '.join(f"{uid}:{score:.4f}" for uid, score in ranked)]
+    return {'user_id': user.user_id, 'recommendations': recommendations,
+            'compats': [{'user_id': uid, 'score': score} for uid, score in ranked]}
+
+
+def _write_chunk(raw: BinaryIO, compress: bool, fmt: str, rows: list) -> None:
+    """Append rows to raw in the given format, as a separate gzip member if compress
+    """
+    stream = gzip.GzipFile(fileobj=raw, mode='wb') if compress else raw
+    text = io.TextIOWrapper(stream, encoding='utf8', newline='')
+    if fmt == 'csv':
+        csv.writer(text).writerows(rows)
+    else:
+        text.writelines(json.dumps(row) + '\n' for row in rows)
+    text.flush()
+    text.detach()
+    if compress:
+        stream.close()
+
+
+def _read_progress(progress_path: str) -> dict:
+    """Return the state saved in progress_path, or an empty dict if there is no saved state
+    """
+    try:
+        with open(progress_path, 'r', encoding='utf8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_progress(progress_path: str, state: dict) -> None:
+    """Save state to progress_path, replacing its previous contents at once
+    """
+    partial_path = progress_path + '.partial'
+    with open(partial_path, 'w', encoding='utf8') as file:
+        json.dump(state, file)
+    os.replace(partial_path, progress_path)
+
+
+def main(argv: list[str]) -> None:
+    """Run the export with the command line arguments in argv
+    """
+    parser = argparse.ArgumentParser(description='Export the recommendations of every user.')
+    parser.add_argument('output', help='file to write; .csv or .jsonl, optionally followed by .gz')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='output format (default: from the file name)')
+    parser.add_argument('--gzip', action='store_true', help='compress the output (default: if it ends in .gz)')
+    parser.add_argument('--top-compats', type=int, default=TOP_COMPATS, help='compatible users written per user')
+    parser.add_argument('--resume', action='store_true', help='continue an interrupted export of the same file')
+    args = parser.parse_args(argv)
+
+    name = args.output[:-3] if args.output.endswith('.gz') else args.output
+    fmt = args.format or ('csv' if name.endswith('.csv') else 'jsonl')
+    instrumentation = Instrumentation([JsonLogSink(sys.stderr)])
+    graph = Graph()
+    load(graph, instrumentation, lazy=True)
+    with instrumentation.phase('export') as progress:
+        export_all(graph, args.output, (fmt, args.gzip or args.output.endswith('.gz'), args.top_compats), args.resume,
+                   progress)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
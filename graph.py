@@ -2,9 +2,116 @@
 
 This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
 """
-import doctest
-import python_ta
-from movie_user_classes import User, Movie
+import heapq
+from bisect import bisect_left
+from typing import Callable, Container, Iterable, Iterator, Mapping, Optional
+
+from instrumentation import ProgressFn
+from lru import LRUCache
+from lsh import DEFAULT_BANDS, DEFAULT_ROWS, process_compat_users_lsh
+from movie_user_classes import GENRES, User, Movie, SortedRatings
+from out_of_core import DEFAULT_MEMORY_BUDGET, process_compat_users_on_disk
+from sparse_compat import DEFAULT_BLOCK_SIZE, RatingMatrix, process_compat_users_sparse, select_neighbours_sparse
+from title_index import DEFAULT_LIMIT, TitleIndex
+
+DEFAULT_CACHE_SIZE = 256
+
+
+class _MovieCatalog:
+    """ A class that holds the movies of a graph, indexed by id, by genre and by title
+
+    Instance Attributes:
+    - movies:
+        A mapping of the movies in this catalog. Each key is a movie id and each value is a Movie object
+    - genre_movies:
+        The inverted genre index: a mapping from the name of each genre to the ids of the movies in this catalog that
+        are in that genre
+    - titles:
+        The index of the titles of the movies in this catalog, used to search them by title
+
+    Representation Invariants:
+    - all({m == self.movies[m].movie_id for m in self.movies})
+    - all({g in self.movies[m].get_genres() for g in self.genre_movies for m in self.genre_movies[g]})
+    """
+    movies: dict[int, Movie]
+    genre_movies: dict[str, set[int]]
+    titles: TitleIndex
+
+    def __init__(self) -> None:
+        self.movies = {}
+        self.genre_movies = {genre: set() for genre in GENRES}
+        self.titles = TitleIndex()
+
+    def add(self, movie: Movie) -> None:
+        """ Adds movie to this catalog, replacing the movie with the same id if there is one
+        """
+        if movie.movie_id in self.movies:
+            for genre in self.movies[movie.movie_id].get_genres():
+                self.genre_movies[genre].discard(movie.movie_id)
+        self.movies[movie.movie_id] = movie
+        for genre in movie.get_genres():
+            self.genre_movies[genre].add(movie.movie_id)
+        self.titles.add(movie.movie_id, movie.title)
+
+
+class _StaleTracker:
+    """ A class that tracks the users whose recommendations are out of date, and the users who have each user as a
+    compatible user, whose recommendations go out of date when that user rates a movie
+
+    Neighbour limits make user_compats asymmetric: a user can be in the user_compats of another who is not in theirs.
+    So the users who have a user as a compatible user are found through the reverse index held here, and not through
+    the user_compats of that user.
+
+    Instance Attributes:
+    - stale_ids:
+        The ids of the users whose recommendations are out of date because of ratings added since they were computed
+    - _holders:
+        None if it must be built again from the user_compats of every user. Otherwise, a mapping from the id of each
+        user to the ids of the users who have them in their user_compats
+
+    >>> user1, user2 = User(1), User(2)
+    >>> user1.user_compats = {2: 4.0}
+    >>> tracker = _StaleTracker()
+    >>> tracker.holders_of(2, [user1, user2])
+    {1}
+    >>> tracker.update_holder(1, [2], [3])
+    >>> (tracker.holders_of(2, []), tracker.holders_of(3, []))
+    (set(), {1})
+    """
+    stale_ids: set[int]
+    _holders: Optional[dict[int, set[int]]]
+
+    def __init__(self) -> None:
+        self.stale_ids = set()
+        self._holders = None
+
+    def reset_holders(self) -> None:
+        """ Drops the reverse index, after the user_compats of any user may have been set without update_holder, so
+        it is built again the next time it is needed
+        """
+        self._holders = None
+
+    def holders_of(self, user_id: int, users: Iterable[User]) -> set[int]:
+        """ Returns the ids of the users who have the user with id user_id in their user_compats, building the reverse
+        index from the user_compats of users first if it was reset
+        """
+        if self._holders is None:
+            self._holders = {}
+            for holder in users:
+                self.update_holder(holder.user_id, (), holder.user_compats)
+        return self._holders.get(user_id, set())
+
+    def update_holder(self, holder_id: int, removed: Iterable[int], added: Iterable[int]) -> None:
+        """ Records that the users with ids in removed were removed from the user_compats of the user with id
+        holder_id, and then that the users with ids in added were added to them. Does nothing if the reverse index was
+        reset, since it is built from the user_compats of every user when it is next needed.
+        """
+        if self._holders is None:
+            return
+        for user_id in removed:
+            self._holders.get(user_id, set()).discard(holder_id)
+        for user_id in added:
+            self._holders.setdefault(user_id, set()).add(holder_id)
 
 
 class Graph:
@@ -12,31 +119,67 @@ class Graph:
 
     Instance Attributes:
     - _movies:
-        A mapping of the movies stored in this graph. Each key is a movie id and each value is a Movie object
+        The movies stored in this graph, indexed by id, by genre and by title
     - _users:
         A mapping of the users stored in this graph. Each key is a user id and each value is a User object
+    - _recommend_params:
+        The (min_score, min_rating, recommends_length) used to compute recommendations, as given to the last call
+        of process_movie_recommends, set_recommend_params or enable_lazy, or None if none of them has been called
+    - _results:
+        None unless this graph is in lazy mode. Otherwise, the cache of users whose user_compats and recommendations
+        are currently computed
+    - _pair_stats:
+        None unless incremental updates are enabled. Otherwise, a mapping from the id of each user to a mapping from
+        the id of every user they have rated at least one common movie with to a list [sum, count], where sum is the
+        sum of the absolute differences between their ratings of the count movies they have both rated. Both users of
+        a pair share the same list.
+    - _stale:
+        The users whose recommendations are out of date because of ratings added since they were computed, and the
+        reverse index used to find them
+    - _neighbour_limits:
+        A tuple (max_neighbours, min_shared). Only users who share at least min_shared rated movies are stored in each
+        other's user_compats, and if max_neighbours is not None, only the max_neighbours users with the highest scores
 
     Representation Invariants:
-    - all({m == self._movies[m].movie_id for m in self._movies})
     - all({u == self._users[u].user_id for u in self._users})
+    - self._results is None or self._recommend_params is not None
+    - self._pair_stats is None or all({self._pair_stats[u1][u2] is self._pair_stats[u2][u1] for u1 in self._pair_stats
+                                       for u2 in self._pair_stats[u1]})
+    - self._neighbour_limits[0] is None or self._neighbour_limits[0] > 0
+    - self._neighbour_limits[1] > 0
     """
-    _movies: dict[int, Movie]
+    _movies: _MovieCatalog
     _users: dict[int, User]
+    _recommend_params: Optional[tuple[float, float, int]]
+    _results: Optional[LRUCache]
+    _pair_stats: Optional[dict[int, dict[int, list]]]
+    _stale: _StaleTracker
+    _neighbour_limits: tuple[Optional[int], int]
 
     def __init__(self) -> None:
-        self._movies = {}
+        self._movies = _MovieCatalog()
         self._users = {}
+        self._recommend_params = None
+        self._results = None
+        self._pair_stats = None
+        self._stale = _StaleTracker()
+        self._neighbour_limits = (None, 1)
 
     def get_all_users(self) -> list[User]:
         """ Returns all users in this graph
         """
         return list(self._users.values())
 
+    def get_all_movies(self) -> list[Movie]:
+        """ Returns all movies in this graph
+        """
+        return list(self._movies.movies.values())
+
     def add_movie(self, movie: Movie) -> None:
-        """ Adds movie to self._movies. If movie.movie_id is already a key in self._movies, the value stored at that
-        key is replaced by movie instead.
+        """ Adds movie to self._movies. If a movie with id movie.movie_id is already in self._movies, it is replaced
+        by movie instead. The movie is added to the genre index under each of its genres, and to the title index.
         """
-        self._movies[movie.movie_id] = movie
+        self._movies.add(movie)
 
     def add_user(self, user: User) -> None:
         """ Adds user to self._users. If user.user_id is already a key in self._users, the value stored at that key
@@ -48,9 +191,9 @@ class Graph:
         """ Returns the movie in this graph with id == movie_id
 
         Preconditions:
-        - movie_id in self._movies
+        - self.movie_exists(movie_id)
         """
-        return self._movies[movie_id]
+        return self._movies.movies[movie_id]
 
     def get_user(self, user_id: int) -> User:
         """ Returns the user in this graph with id == user_id
@@ -60,75 +203,275 @@ class Graph:
         """
         return self._users[user_id]
 
+    def movie_exists(self, movie_id: int) -> bool:
+        """ Returns whether the movie with id == movie_id is in this graph
+        """
+        return movie_id in self._movies.movies
+
+    def get_genre_movies(self, genre: str) -> set[int]:
+        """ Returns the ids of the movies in this graph that are in genre
+
+        Preconditions:
+        - genre in GENRES
+        """
+        return set(self._movies.genre_movies[genre])
+
+    def search_titles(self, query: str, limit: int = DEFAULT_LIMIT) -> list[int]:
+        """ Returns the ids of at most limit movies in this graph whose titles best match query, best match first.
+        Each word of query matches the words of a title that are equal to it, that start with it, or that are a typo
+        or two away from it (see title_index.py).
+
+        Preconditions:
+        - limit > 0
+        """
+        return self._movies.titles.search(query, limit)
+
     def user_exists(self, user_id: int) -> bool:
         """ Returns whether the user with id == user_id is in this graph
         """
         return user_id in self._users
 
-    def process_compat_users(self) -> None:
+    def set_neighbour_limits(self, max_neighbours: Optional[int], min_shared: int = 1) -> None:
+        """Limits the users stored in user_compats by the compat computations that follow: a user only keeps the users
+        they share at least min_shared rated movies with, and if max_neighbours is not None, only the max_neighbours
+        of those with the highest compatability scores (ties broken by lowest user id).
+
+        Preconditions:
+        - max_neighbours is None or max_neighbours > 0
+        - min_shared > 0
+        """
+        self._neighbour_limits = (max_neighbours, min_shared)
+
+    def enable_lazy(self, min_score: float, min_rating: float, recommends_length: int,
+                    cache_size: int = DEFAULT_CACHE_SIZE) -> None:
+        """Switches this graph to lazy mode: instead of calling process_compat_users and process_movie_recommends for
+        every user, the compat scores and recommendations of a user are computed the first time they are requested
+        through get_user_compats or get_recommendations.
+
+        The results of at most cache_size users are kept at once. When a user is evicted from the cache, their
+        user_compats and recommendations are emptied until they are requested again.
+
+        Preconditions:
+        - min_rating <= 5.0
+        - min_score <= 5.0
+        - recommends_length > 0
+        - cache_size > 0
+        """
+        self._recommend_params = (min_score, min_rating, recommends_length)
+        self._results = LRUCache(cache_size, on_evict=self._clear_results)
+        self._stale.reset_holders()
+
+    def get_user_compats(self, user: User) -> dict[int, float]:
+        """Returns the user_compats of user, computing them first if this graph is in lazy mode and they are not
+        cached
+
+        Preconditions:
+        - self.user_exists(user.user_id)
+        """
+        self._ensure_results(user)
+        return user.user_compats
+
+    def get_recommendations(self, user: User) -> list[int]:
+        """Returns the recommendations of user, computing them first if this graph is in lazy mode and they are not
+        cached, or if they are stale because of ratings added since they were computed
+
+        Preconditions:
+        - self.user_exists(user.user_id)
+        """
+        self._ensure_results(user)
+        if user.user_id in self._stale.stale_ids:
+            self._stale.stale_ids.remove(user.user_id)
+            self._recommend(user)
+        return user.recommendations
+
+    def get_genre_recommendations(self, user: User, genre: str) -> list[int]:
+        """Returns the recommendations of user among the movies in genre only, computed like get_recommendations.
+        Movies outside of genre are skipped while the recommendation scores are aggregated, so only movies in genre
+        are scored and ranked.
+
+        Preconditions:
+        - self.user_exists(user.user_id)
+        - self._recommend_params is not None
+        - genre in GENRES
+        """
+        return compute_recommendations(self.get_user_compats(user),
+                                       lambda uid: self.find_or_add_user(uid).movie_ratings,
+                                       user.get_movies(), self._recommend_params, self._movies.genre_movies[genre])
+
+    def has_results(self, user: User) -> bool:
+        """Returns whether the user_compats and recommendations of user are available: they have been computed, or are
+        computed when they are requested in lazy mode, and are not stale. While process_movie_recommends runs on
+        another thread, this is True for the users whose recommendations it has computed so far.
+
+        Preconditions:
+        - self.user_exists(user.user_id)
+        """
+        return self._recommend_params is not None and user.user_id not in self._stale.stale_ids
+
+    def get_stale_users(self) -> set[int]:
+        """Returns the ids of the users whose recommendations are out of date because of ratings added since they
+        were computed
+        """
+        return set(self._stale.stale_ids)
+
+    def refresh_recommendations(self) -> None:
+        """Recomputes the recommendations of only the users whose recommendations are stale
+
+        Preconditions:
+        - self._recommend_params is not None
+        """
+        while self._stale.stale_ids:
+            self._recommend(self.get_user(self._stale.stale_ids.pop()))
+
+    def set_recommend_params(self, min_score: float, min_rating: float, recommends_length: int) -> None:
+        """Records that the recommendations of every user in this graph are up to date and were computed with
+        min_score, min_rating and recommends_length, so the recommendations made stale by ratings added later are
+        recomputed with them. Called once the recommendations are computed, or set from elsewhere (such as by
+        another process or from a cache).
+
+        Preconditions:
+        - min_rating <= 5.0
+        - min_score <= 5.0
+        - recommends_length > 0
+        """
+        self._recommend_params = (min_score, min_rating, recommends_length)
+        self._stale.stale_ids.clear()
+        self._stale.reset_holders()
+
+    def get_recommend_params(self) -> Optional[tuple[float, float, int]]:
+        """Returns the (min_score, min_rating, recommends_length) recommendations are computed with, or None if they
+        have not been computed yet
+        """
+        return self._recommend_params
+
+    def get_cache_stats(self) -> dict[str, int]:
+        """Returns the hits, misses, size and capacity of the lazy mode result cache, or an empty dict if this graph
+        is not in lazy mode
+        """
+        if self._results is None:
+            return {}
+        return {'hits': self._results.hits, 'misses': self._results.misses,
+                'size': len(self._results), 'capacity': self._results.capacity}
+
+    def _ensure_results(self, user: User) -> None:
+        """In lazy mode, computes the user_compats and recommendations of user if they are not cached
+        """
+        if self._results is None or self._results.get(user.user_id) is not None:
+            return
+        self._set_user_compats(user, select_neighbours(self._rated_pair_stats(user), *self._neighbour_limits))
+        self._recommend(user)
+        self._stale.stale_ids.discard(user.user_id)
+        self._results.put(user.user_id, user)
+
+    def _recommend(self, user: User) -> None:
+        """Computes the recommendations of user from their current user_compats, using self._recommend_params
+
+        Preconditions:
+        - self._recommend_params is not None
+        """
+        user.recommendations = compute_recommendations(user.user_compats,
+                                                       lambda uid: self.find_or_add_user(uid).movie_ratings,
+                                                       user.get_movies(), self._recommend_params)
+
+    def enable_incremental(self) -> None:
+        """Enables incremental updates: computes the compat scores of all users in this graph, and keeps the running
+        sums and co-rated counts of every pair of compatible users. From then on, add_rating and add_ratings update
+        the compat scores of only the users who share the rated movie, and mark only the affected users'
+        recommendations as stale.
+        """
+        users = self.get_all_users()
+        matrix = RatingMatrix(users)
+        user_ids = matrix.user_ids.tolist()
+        self._pair_stats = {}
+        self._stale.reset_holders()
+        for start in range(0, matrix.num_users(), DEFAULT_BLOCK_SIZE):
+            stop = min(start + DEFAULT_BLOCK_SIZE, matrix.num_users())
+            sums, counts = matrix.block_pair_stats((start, stop))
+            for i in range(start, stop):
+                row_sums, row_counts = sums[i - start], counts[i - start]
+                row_counts[i] = 0
+                users[i].user_compats = select_neighbours_sparse(matrix.user_ids, row_sums, row_counts,
+                                                                 *self._neighbour_limits)
+                partners = self._pair_stats.setdefault(user_ids[i], {})
+                for j in row_counts[i + 1:].nonzero()[0].tolist():
+                    stats = [float(row_sums[i + 1 + j]), int(row_counts[i + 1 + j])]
+                    partners[user_ids[i + 1 + j]] = stats
+                    self._pair_stats.setdefault(user_ids[i + 1 + j], {})[user_ids[i]] = stats
+
+    def process_compat_users(self, engine: str = 'python',
+                             lsh_params: tuple[int, int] = (DEFAULT_BANDS, DEFAULT_ROWS),
+                             progress: Optional[ProgressFn] = None,
+                             out_of_core_params: tuple[int, Optional[float]] = (DEFAULT_MEMORY_BUDGET, None)) -> None:
         """Finds compatible users for each user in graph, calculates their compatability score as outlined in the
         written report, and then updates their user_compats attribute accordingly.
+
+        engine selects how the scores are computed: 'python' walks the users who rated each movie a user has rated,
+        while 'sparse' computes the same scores for all pairs at once from a sparse rating matrix (see
+        sparse_compat.py). 'lsh' is approximate: it only scores the pairs of users proposed by MinHash LSH (see lsh.py)
+        with the (bands, rows) in lsh_params. These pairs are likely to have a high overlap in rated movies, but some
+        compatible users may be missed. 'out_of_core' computes the same scores as 'sparse' in about memory_budget bytes,
+        spilling intermediate results to disk (see out_of_core.py), where out_of_core_params is (memory_budget,
+        min_score). It only keeps what process_movie_recommends needs: the scores of at least min_score (all of them if
+        min_score is None), of at most max_neighbours users, so a max_neighbours limit must be set for the user_compats
+        kept to fit in memory whatever the number of users. Whichever the engine, only the neighbours allowed by
+        set_neighbour_limits are kept. If progress is not None, it is called with the number of users processed so far.
+
+        Raises ValueError if engine is 'out_of_core' and no max_neighbours limit was set with set_neighbour_limits.
+
+        Preconditions:
+        - engine in {'python', 'sparse', 'lsh', 'out_of_core'}
+        - lsh_params[0] > 0 and lsh_params[1] > 0
+        - out_of_core_params[0] > 0
+        """
+        users = self.get_all_users()
+        self._stale.reset_holders()
+        if engine == 'out_of_core':
+            if self._neighbour_limits[0] is None:
+                raise ValueError("the 'out_of_core' engine needs a max_neighbours limit, see set_neighbour_limits")
+            memory_budget, min_score = out_of_core_params
+            process_compat_users_on_disk(users, memory_budget, self._neighbour_limits, min_score, progress)
+            return
+        if engine == 'sparse':
+            process_compat_users_sparse(users, DEFAULT_BLOCK_SIZE, *self._neighbour_limits, progress=progress)
+            return
+        if engine == 'lsh':
+            process_compat_users_lsh(users, lsh_params, self._neighbour_limits, progress=progress)
+            return
+
+        for i, user in enumerate(users, 1):
+            user.user_compats = select_neighbours(self._rated_pair_stats(user), *self._neighbour_limits)
+            if progress is not None:
+                progress(i, len(users))
+
+    def _rated_pair_stats(self, user: User) -> Iterator[tuple[int, tuple[float, int]]]:
+        """Return the (user id, (sum, count)) shared rating stats between user and every other user who has rated a
+        movie user has rated, computed by rated_pair_stats
         """
-        total_compat_users = 0
-        for user in self.get_all_users():
-            user_rated_movies = user.get_movies()
-            compat_user_ids = self.get_movie_users(user_rated_movies)
-            compat_user_ids.remove(user.user_id)
-            total_compat_users += len(compat_user_ids)
-            self._process_compat_score(user, compat_user_ids)
-
-    def _process_compat_score(self, user: User, compat_user_ids: set[int]) -> None:
-        """Compute the compatability scores between user, and all users with ids in compat_user_ids, and update
-        user.user_compats accordingly
-
-        Preconditions:
-        - graph.user_exists(user.user_id)
-        - all({graph.user_exists(id) for id in compat_user_ids})
-        """
-        for user_id in compat_user_ids:
-            user2 = self.get_user(user_id)
-            user1_movies = user.get_movies()
-            user2_movies = user2.get_movies()
-            shared_movies = user1_movies.intersection(user2_movies)
-            compat_score_so_far = 0.0
-            for movie_id in shared_movies:
-                user1_rating = user.get_rating(movie_id)
-                user2_rating = user2.get_rating(movie_id)
-                compat_score_so_far += abs(user1_rating - user2_rating)
-            compat_score_so_far = compat_score_so_far / len(shared_movies)
-            compat_score_so_far = 5.0 - compat_score_so_far
-            user.user_compats[user_id] = compat_score_so_far
-
-    def process_movie_recommends(self, min_score: float, min_rating: float, recommends_length: int) -> None:
+        return rated_pair_stats(user.user_id, user.movie_ratings,
+                                lambda movie_id: self.get_movie(movie_id).user_ratings)
+
+    def process_movie_recommends(self, min_score: float, min_rating: float, recommends_length: int,
+                                 progress: Optional[ProgressFn] = None) -> None:
         """Generates a list of recommends_length movie reccommendations for each user in graph, using the strategy
         outlined in the written report and updates their recommended attribute
-        accordingly
+        accordingly. If progress is not None, it is called with the number of users processed so far.
 
         Preconditions:
         - min_rating <= 5.0
         - min_score <= 5.0
         - recommends_length > 0
         """
-        for user in self.get_all_users():  # loops through all users
-            recommendation_list = []
-            compat_list = sorted(user.user_compats.items(), key=lambda x: x[1], reverse=True)
-            for compat in compat_list:
-                uid = compat[0]
-                comp_score = compat[1]
-
-                if comp_score < min_score:
-                    continue
-
-                compat_user = self.find_or_add_user(uid)
-                score_list = _get_recommendation_scores(comp_score, compat_user.movie_ratings, min_rating)
-                recommendation_list.extend(score_list)
-            sorted_tuples = sorted(recommendation_list, key=lambda x: x[1], reverse=True)
-            final_list = [x[0] for x in sorted_tuples]
-            unique_list = _remove_duplicates(final_list)
-            if len(unique_list) > recommends_length:
-                user.recommendations = unique_list[:recommends_length]
-            else:
-                user.recommendations = unique_list
+        # Every user is stale until their recommendations are computed below, so has_results is only True for the users
+        # computed so far. They are marked before the parameters are set, so no user is ever reported as computed early
+        self._stale.stale_ids.update(self._users)
+        self._recommend_params = (min_score, min_rating, recommends_length)
+        self._stale.reset_holders()
+        users = self.get_all_users()
+        for i, user in enumerate(users, 1):  # loops through all users
+            self._recommend(user)
+            self._stale.stale_ids.discard(user.user_id)
+            if progress is not None:
+                progress(i, len(users))
 
     def find_or_add_user(self, user_id: int) -> User:
         """Returns the user in graph.users with user_id == id. If such a user does not exist in graph.users,
@@ -145,13 +488,127 @@ class Graph:
         """Adds a rating with movie id and rating to the user's movie_ratings attribute
         and adds a user and its user rating to the movie's user_ratings attribute
 
+        If incremental updates are enabled, the compat scores between user and the other users who rated the movie
+        are updated in O(1) per pair, and the user_compats of every user stay the ones a full recompute would give.
+        With a max_neighbours limit, a user is only left out of the user_compats of another when enough users have a
+        higher score, so when a score among those kept falls, the kept users are selected again from the running
+        sums and counts of the pairs. Once recommendations have been computed, the recommendations of user, of the
+        other users who rated the movie and of the users who have user as a compatible user are marked as stale (in
+        lazy mode, their cached results are dropped).
+
         Preconditions:
         - 0.5 <= rating <= 5.0
         """
-        user.movie_ratings[movie_id] = rating
         movie = self.get_movie(movie_id)
+        if self._pair_stats is not None or self._recommend_params is not None:
+            self._update_compats(user, movie, rating)
+        user.movie_ratings[movie_id] = rating
         movie.user_ratings[user.user_id] = rating
 
+    def add_ratings(self, ratings: Iterable[tuple[int, int, float]]) -> None:
+        """Adds each (user id, movie id, rating) in ratings to this graph as in add_rating, creating the users that do
+        not exist yet
+
+        Preconditions:
+        - all({0.5 <= rating[2] <= 5.0 for rating in ratings})
+        """
+        for user_id, movie_id, rating in ratings:
+            self.add_rating(self.find_or_add_user(user_id), movie_id, rating)
+
+    def _update_compats(self, user: User, movie: Movie, rating: float) -> None:
+        """Updates the compat scores and stale recommendations affected by user giving movie the given rating,
+        before the rating is stored
+        """
+        affected = [user_id for user_id in movie.user_ratings if user_id != user.user_id]
+        if self._pair_stats is not None:
+            self._update_pair_stats(user, movie, rating, affected)
+
+        if self._recommend_params is not None:
+            # Users who have user as a compatible user may now be recommended this movie. A user only has this
+            # rating change their score with user if they rated the movie too, so they are already in affected
+            min_score = self._recommend_params[0]
+            affected.extend(uid for uid in self._stale.holders_of(user.user_id, self._users.values())
+                            if self._users[uid].user_compats.get(user.user_id, min_score) >= min_score)
+            affected.append(user.user_id)
+            self._mark_stale(affected)
+
+    def _update_pair_stats(self, user: User, movie: Movie, rating: float, other_ids: list[int]) -> None:
+        """Updates the running sums and counts of the pairs of user and each user with id in other_ids, who rated
+        movie, and their user_compats, for user giving movie the given rating before the rating is stored
+
+        Preconditions:
+        - self._pair_stats is not None
+        """
+        old_rating = movie.user_ratings.get(user.user_id)
+        partners = self._pair_stats.setdefault(user.user_id, {})
+        reselect = False
+        for other_id in other_ids:
+            if other_id not in partners:
+                partners[other_id] = [0.0, 0]
+                self._pair_stats.setdefault(other_id, {})[user.user_id] = partners[other_id]
+            stats = partners[other_id]
+            other_rating = movie.user_ratings[other_id]
+            if old_rating is None:
+                stats[1] += 1
+            else:
+                stats[0] -= abs(old_rating - other_rating)
+            stats[0] += abs(rating - other_rating)
+            if stats[1] >= self._neighbour_limits[1]:
+                score = 5.0 - stats[0] / stats[1]
+                reselect = self._set_neighbour(user, other_id, score) or reselect
+                other = self.get_user(other_id)
+                if self._set_neighbour(other, user.user_id, score):
+                    self._reselect_neighbours(other)
+        if reselect:
+            self._reselect_neighbours(user)
+
+    def _set_neighbour(self, user: User, other_id: int, score: float) -> bool:
+        """Sets the compat score of user with the user with id other_id to score in user.user_compats, dropping the
+        lowest one if user then has more than max_neighbours of them. Returns whether the user_compats of user must be
+        selected again with _reselect_neighbours: when the score of a user kept in them fell while user has
+        max_neighbours of them, since a user left out before may now have a higher score.
+        """
+        max_neighbours = self._neighbour_limits[0]
+        fell = score < user.user_compats.get(other_id, score)
+        dropped = _set_compat(user.user_compats, other_id, score, max_neighbours)
+        self._stale.update_holder(user.user_id, [] if dropped is None else [dropped],
+                                  [other_id] if other_id in user.user_compats else [])
+        return fell and max_neighbours is not None and len(user.user_compats) >= max_neighbours
+
+    def _reselect_neighbours(self, user: User) -> None:
+        """Sets the user_compats of user to the ones allowed by set_neighbour_limits among all the users user has
+        rated a movie in common with, from the running sums and counts of the pairs
+
+        Preconditions:
+        - self._pair_stats is not None
+        """
+        self._set_user_compats(user, select_neighbours(self._pair_stats.get(user.user_id, {}).items(),
+                                                       *self._neighbour_limits))
+
+    def _set_user_compats(self, user: User, user_compats: dict[int, float]) -> None:
+        """Sets the user_compats of user to user_compats, keeping the reverse index of self._stale up to date
+        """
+        self._stale.update_holder(user.user_id, user.user_compats, user_compats)
+        user.user_compats = user_compats
+
+    def _clear_results(self, _: int, user: User) -> None:
+        """Empties the user_compats and recommendations of a user evicted from the lazy mode result cache
+        """
+        self._set_user_compats(user, {})
+        user.recommendations = []
+
+    def _mark_stale(self, user_ids: list[int]) -> None:
+        """Marks the recommendations of the users with ids in user_ids as stale. In lazy mode, their cached results
+        are dropped instead, so they are recomputed the next time they are requested
+        """
+        if self._results is None:
+            self._stale.stale_ids.update(user_ids)
+            return
+        for user_id in user_ids:
+            if user_id in self._results:
+                self._results.discard(user_id)
+                self._clear_results(user_id, self.get_user(user_id))
+
     def get_movie_users(self, movies: set[int]) -> set[int]:
         """Returns a set of ids for users in graph who have a rating for at least one movie whose id is in movies
 
@@ -164,45 +621,172 @@ class Graph:
         return set(user_ids_so_far)
 
 
-def _remove_duplicates(lst: list[str]) -> list[str]:
-    """Remove duplicates from lst, but keep the first occurrence of each item."""
-    seen = set()
-    result = []
-    for item in lst:
-        if item not in seen:
-            seen.add(item)
-            result.append(item)
-    return result
+def compat_score(ratings1: SortedRatings, ratings2: SortedRatings) -> float:
+    """Return the compatability score between two users with movie ratings ratings1 and ratings2: 5.0 minus the
+    mean absolute difference between their ratings over the movies they have both rated.
+
+    Preconditions:
+    - set(ratings1).intersection(ratings2) != set()
+
+    >>> compat_score(SortedRatings({1: 4.0, 2: 3.0}), SortedRatings({1: 5.0, 2: 1.0, 3: 2.0}))
+    3.5
+    """
+    compat_score_so_far, shared_movies = shared_rating_stats(ratings1, ratings2)
+    compat_score_so_far = compat_score_so_far / shared_movies
+    return 5.0 - compat_score_so_far
+
 
+def shared_rating_stats(ratings1: SortedRatings, ratings2: SortedRatings) -> tuple[float, int]:
+    """Return a tuple (sum, count), where count is the number of movies rated in both ratings1 and ratings2, and sum
+    is the sum of the absolute differences between their ratings of those movies.
 
-def _get_recommendation_scores(comp_score: float, movie_ratings: dict[int, float], min_rating: float)\
-        -> list[(int, float)]:
+    >>> shared_rating_stats(SortedRatings({1: 4.0, 2: 3.0}), SortedRatings({1: 5.0, 2: 1.0, 3: 2.0}))
+    (3.0, 2)
     """
-    Given the user rating between a user and its compatible user, and the movie_dict of that compatible user, calculate
-    the recommendation scores for each movie in the movie_dict by multiplying the ratings in the dict by the given user
-    rating. Return a list of tuples containing the movie ID and its recommendation score.
+    ids1, scores1, ids2, scores2 = ratings1.ids, ratings1.scores, ratings2.ids, ratings2.scores
+    if len(ids1) > len(ids2):
+        ids1, scores1, ids2, scores2 = ids2, scores2, ids1, scores1
+    # Both id arrays are sorted, so they are merged: the shorter one is walked, and the position of each of its ids in
+    # the longer one is searched for from the position of the previous one
+    sum_so_far, shared_movies, j = 0.0, 0, 0
+    for i, movie_id in enumerate(ids1):
+        j = bisect_left(ids2, movie_id, j)
+        if j == len(ids2):
+            break
+        if ids2[j] == movie_id:
+            sum_so_far += abs(scores1[i] - scores2[j])
+            shared_movies += 1
+    return sum_so_far, shared_movies
+
+
+def rated_pair_stats(user_id: int, ratings: SortedRatings,
+                     get_user_ratings: Callable[[int], SortedRatings]) -> Iterator[tuple[int, tuple[float, int]]]:
+    """Return the (user id, (sum, count)) shared rating stats (see shared_rating_stats) between the user with id
+    user_id and movie_ratings ratings, and every other user who has rated a movie in ratings. get_user_ratings returns
+    the user_ratings of the movie with the given id.
+
+    The users who rated each movie in ratings are walked once, adding the difference between their rating and the
+    rating in ratings to their stats, so the ratings of each pair of users are never matched movie by movie.
+
+    >>> user_ratings = {1: SortedRatings({1: 4.0, 2: 5.0}), 2: SortedRatings({1: 3.0, 2: 1.0})}
+    >>> list(rated_pair_stats(1, SortedRatings({1: 4.0, 2: 3.0}), user_ratings.get))
+    [(2, (3.0, 2))]
+    """
+    sums, counts = {}, {}
+    for movie_id, rating in ratings.items():
+        user_ratings = get_user_ratings(movie_id)
+        for other_id, other_rating in zip(user_ratings.ids, user_ratings.scores):
+            sums[other_id] = sums.get(other_id, 0.0) + abs(rating - other_rating)
+            counts[other_id] = counts.get(other_id, 0) + 1
+    sums.pop(user_id, None)
+    return ((uid, (total, counts[uid])) for uid, total in sums.items())
+
+
+def select_neighbours(pair_stats: Iterable[tuple[int, tuple[float, int]]], max_neighbours: Optional[int],
+                      min_shared: int) -> dict[int, float]:
+    """Return the user_compats of a user, given the (user id, (sum, count)) shared rating stats between them and each
+    candidate user. Only candidates that share at least min_shared movies are kept, and if max_neighbours is not None,
+    only the max_neighbours of them with the highest scores, in descending order of score. Ties are broken by lowest
+    user id.
+
+    The candidates are kept in a heap of at most max_neighbours entries while they are scored, so the scores of all
+    candidates are never stored at once.
 
     Preconditions:
-    - 0.5 <= comp_score <= 5.0
-    - min_rating <= 5.0
-    - all({0.5 <= movie_ratings[m] <= 5.0 for m in movie_ratings})
+    - max_neighbours is None or max_neighbours > 0
+    - min_shared > 0
+
+    >>> select_neighbours([(2, (1.0, 1)), (3, (0.0, 2)), (4, (2.0, 2)), (5, (0.0, 2))], 2, 2)
+    {3: 5.0, 5: 5.0}
+    """
+    user_compats = {}
+    heap = []
+    for user_id, (sum_so_far, shared_movies) in pair_stats:
+        if shared_movies < min_shared:
+            continue
+        score = 5.0 - sum_so_far / shared_movies
+        if max_neighbours is None:
+            user_compats[user_id] = score
+        elif len(heap) < max_neighbours:
+            heapq.heappush(heap, (score, -user_id))
+        elif (score, -user_id) > heap[0]:
+            heapq.heapreplace(heap, (score, -user_id))
+    if max_neighbours is None:
+        return user_compats
+    return {-neg_id: compat for compat, neg_id in sorted(heap, reverse=True)}
+
+
+def _set_compat(user_compats: dict[int, float], user_id: int, score: float,
+                max_neighbours: Optional[int]) -> Optional[int]:
+    """Set user_compats[user_id] to score, then if user_compats holds more than max_neighbours users, remove the one
+    with the lowest score (ties broken by highest user id). Return the id of the user removed, or None if no user was.
+
+    >>> compats = {1: 4.0, 2: 3.0}
+    >>> _set_compat(compats, 3, 3.5, 2)
+    2
+    >>> compats
+    {1: 4.0, 3: 3.5}
     """
-    rec_list = []
-    for k in movie_ratings:
-        rating_value = movie_ratings[k]
+    user_compats[user_id] = score
+    if max_neighbours is None or len(user_compats) <= max_neighbours:
+        return None
+    dropped = min(user_compats, key=lambda uid: (user_compats[uid], -uid))
+    del user_compats[dropped]
+    return dropped
+
+
+def compute_recommendations(user_compats: dict[int, float], get_movie_ratings: Callable[[int], Mapping[int, float]],
+                            rated_movies: Container[int], recommend_params: tuple[float, float, int],
+                            allowed_movies: Optional[Container[int]] = None) -> list[int]:
+    """Return a list of at most recommends_length movie ids recommended to a user with the given user_compats, using
+    the strategy outlined in the written report, where recommend_params is (min_score, min_rating, recommends_length).
+    get_movie_ratings returns the movie_ratings of the user with the given id, and movies in rated_movies (the ones
+    the user has already rated) are never recommended. If allowed_movies is not None, only movies in allowed_movies
+    are recommended.
+
+    Each movie is scored by the best (compat score * rating) over the compatible users who rated it, kept in a dict
+    while the compatible users are visited; movies that are not allowed are skipped there, so they are never scored.
+    The top recommends_length movies are then selected with a bounded heap, in descending order of score, ties broken
+    by lowest movie id.
 
-        if rating_value < min_rating:
+    Preconditions:
+    - recommend_params[0] <= 5.0
+    - recommend_params[1] <= 5.0
+    - recommend_params[2] > 0
+
+    >>> ratings = {2: {10: 5.0, 11: 4.0, 12: 2.0}, 3: {11: 5.0, 13: 5.0}}
+    >>> compute_recommendations({2: 4.0, 3: 4.0}, ratings.get, {10}, (4.0, 4.0, 10))
+    [11, 13]
+    >>> compute_recommendations({2: 4.0, 3: 4.0}, ratings.get, {10}, (4.0, 4.0, 10), allowed_movies={13})
+    [13]
+    """
+    min_score, min_rating, recommends_length = recommend_params
+    best_scores = {}
+    for uid, comp_score in user_compats.items():
+        if comp_score < min_score:
             continue
 
-        rec_score = rating_value * comp_score
-        rec_list.append((k, rec_score))
-    return rec_list
+        for movie_id, rating in get_movie_ratings(uid).items():
+            if rating < min_rating or movie_id in rated_movies:
+                continue
+            if allowed_movies is not None and movie_id not in allowed_movies:
+                continue
+            rec_score = rating * comp_score
+            if rec_score > best_scores.get(movie_id, 0.0):
+                best_scores[movie_id] = rec_score
+
+    top = heapq.nlargest(recommends_length, best_scores.items(), key=lambda x: (x[1], -x[0]))
+    return [mid for mid, _ in top]
 
 
 if __name__ == '__main__':
+    import doctest
+    import python_ta
+
     doctest.testmod()
     python_ta.check_all(config={
-        'extra-imports': ['movie_user_classes', 'doctest'],
+        'extra-imports': ['instrumentation', 'lru', 'lsh', 'movie_user_classes', 'out_of_core', 'sparse_compat',
+                          'title_index', 'doctest', 'heapq', 'bisect', 'typing'],
         'allowed-io': [],
         'max-line-length': 120
     })
@@ -0,0 +1,395 @@
+"""This Python module contains the streaming ingestion of new ratings into a live graph, run without reloading the
+datasets:
+
+    python ingest.py data/ratings_log.csv --state-file data/ingest.json
+
+The ratings log is an append-only file in the format of ratings.csv. A RatingTailer follows it like `tail -f`: every
+poll reads the complete lines appended since the last one, by byte offset, and buffers their ratings. The buffered
+ratings are applied to the graph in micro-batches through Graph.add_ratings, as soon as batch_size of them are
+buffered, or flush_interval seconds after the oldest of them was read.
+
+The ratings already in the log when it is first read may have been loaded with the datasets, so while catching up on
+them, the ones older than the high-water mark the tailer was started with (such as the largest timestamp of the
+datasets) are skipped. The ratings appended after that are all applied, whatever their timestamp, since a rating from
+one of several writers may arrive late.
+
+The offset of the last rating applied can be saved to a state file after every batch, with the extent of the catch-up.
+A process that keeps its graph across restarts of its tailer resumes reading from the saved offset. A process that
+loads its graph again from the datasets, like main below, has lost the ratings applied from the log, so it reads the
+log again from its start instead: only the saved catch-up is used, so the same rows are skipped as when they were first
+read, and every rating applied before the restart is applied again. Only the ratings of a log that was truncated or
+replaced are lost, since they are neither in the datasets nor in the log anymore.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable, Optional
+
+from graph import Graph
+from pipeline import RATINGS_FILE, load
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_FLUSH_INTERVAL = 1.0  # Most seconds a rating is buffered before it is applied
+POLL_INTERVAL = 0.2  # Seconds between two polls of the ratings log when nothing new was read
+HEADER_PREFIX = b'userId'
+
+
+class LogCursor:
+    """ A class that holds the position of a RatingTailer in its ratings log, which can be saved to a state file so
+    that a restarted tailer resumes from it
+
+    Instance Attributes:
+    - log_file:
+        The path of the ratings log
+    - state_file:
+        If not None, the file this position is saved to by save
+    - read_offset:
+        The offset up to which the complete lines of the log have been read
+    - applied_offset:
+        The offset of the end of the last row of the log applied, or skipped before every row still buffered. It is
+        the offset a restarted tailer resumes reading from.
+    - high_water_mark:
+        The largest timestamp of the ratings applied so far, or None if none were
+    - catch_up_end:
+        None until the log is first read. Otherwise, the size of the log when it was first read, or when it was last
+        found truncated: the rows ending at or before this offset are skipped if they are older than catch_up_mark
+    - catch_up_mark:
+        The high-water mark the tailer was started with, or had when the log was last found truncated, or None
+
+    Representation Invariants:
+    - 0 <= self.applied_offset <= self.read_offset
+    - self.catch_up_end is None or self.catch_up_end >= 0
+    """
+    log_file: str
+    state_file: Optional[str]
+    read_offset: int
+    applied_offset: int
+    high_water_mark: Optional[int]
+    catch_up_end: Optional[int]
+    catch_up_mark: Optional[int]
+
+    def __init__(self, log_file: str, high_water_mark: Optional[int] = None, state_file: Optional[str] = None,
+                 resume: bool = True) -> None:
+        """Initialize a cursor at the start of log_file, that skips the ratings already in log_file when it is first
+        read that are older than high_water_mark.
+
+        If state_file is not None and holds a saved position, the cursor instead resumes from the position saved in
+        it if resume is True, which is only right if the ratings applied before were kept. Otherwise, the cursor
+        starts again from the start of log_file, but with the catch-up saved in state_file, so that the ratings
+        applied before are applied again and the ones skipped before are skipped again.
+        """
+        self.log_file = log_file
+        self.state_file = state_file
+        state = {} if state_file is None else _read_state(state_file)
+        self.catch_up_end = state.get('catch_up_end')
+        self.catch_up_mark = state.get('catch_up_mark', high_water_mark)
+        if resume:
+            self.high_water_mark = state.get('high_water_mark', high_water_mark)
+            self.read_offset = self.applied_offset = state.get('offset', 0)
+        else:
+            self.high_water_mark = high_water_mark
+            self.read_offset = self.applied_offset = 0
+
+    def restart(self, size: int) -> None:
+        """Move this cursor back to the start of the log, which is now size bytes long, catching up on its current
+        contents with the current high-water mark
+        """
+        self.read_offset = self.applied_offset = 0
+        self.catch_up_end, self.catch_up_mark = size, self.high_water_mark
+
+    def skips(self, timestamp: int, line_end: int) -> bool:
+        """Return whether the rating with the given timestamp, in a row of the log ending at offset line_end, is
+        skipped because it was in the log while catching up and is older than catch_up_mark
+
+        Preconditions:
+        - self.catch_up_end is not None
+        """
+        return line_end <= self.catch_up_end and self.catch_up_mark is not None and timestamp < self.catch_up_mark
+
+    def save(self) -> None:
+        """Save this position to state_file, if it is not None
+        """
+        if self.state_file is not None:
+            _write_state(self.state_file, {'offset': self.applied_offset, 'high_water_mark': self.high_water_mark,
+                                           'catch_up_end': self.catch_up_end, 'catch_up_mark': self.catch_up_mark})
+
+
+class IngestStats:
+    """ A class that holds the counters of a RatingTailer
+
+    Instance Attributes:
+    - rows_applied:
+        The number of ratings applied to the graph
+    - rows_skipped:
+        The number of rows of the log that were skipped: malformed, for an unknown movie, or older than the catch-up
+        mark while catching up
+    - batches:
+        The number of batches applied
+    - apply_seconds:
+        The total wall time spent applying batches
+    - started:
+        The time.monotonic() time the tailer was started at
+
+    Representation Invariants:
+    - self.rows_applied >= 0 and self.rows_skipped >= 0 and self.batches >= 0
+    - self.apply_seconds >= 0
+    """
+    rows_applied: int
+    rows_skipped: int
+    batches: int
+    apply_seconds: float
+    started: float
+
+    def __init__(self) -> None:
+        self.rows_applied = 0
+        self.rows_skipped = 0
+        self.batches = 0
+        self.apply_seconds = 0.0
+        self.started = time.monotonic()
+
+
+class RatingTailer:
+    """ A class that applies the ratings appended to a ratings log to a graph, in micro-batches
+
+    Instance Attributes:
+    - graph:
+        The graph the ratings are applied to
+    - cursor:
+        The position of this tailer in the ratings log
+    - batch_size:
+        The number of buffered ratings that are applied at once
+    - flush_interval:
+        The most seconds a rating stays buffered before it is applied
+    - stats:
+        The counters of this tailer
+
+    Representation Invariants:
+    - self.batch_size > 0
+    - self.flush_interval >= 0
+
+    >>> from movie_user_classes import Movie
+    >>> import tempfile
+    >>> graph = Graph()
+    >>> graph.add_movie(Movie(1, 'A'))
+    >>> directory = tempfile.mkdtemp()
+    >>> log, state = os.path.join(directory, 'log.csv'), os.path.join(directory, 'state.json')
+    >>> with open(log, 'w', encoding='utf8') as file:
+    ...     _ = file.write('userId,movieId,rating,timestamp\\n1,1,4.0,90\\n2,1,3.0,100\\n3,1,')
+    >>> tailer = RatingTailer(graph, LogCursor(log, 95, state), batch_size=10, flush_interval=0.0)
+    >>> tailer.poll()
+    1
+    >>> with open(log, 'a', encoding='utf8') as file:
+    ...     _ = file.write('2.0,99\\n4,2,5.0,102\\n')
+    >>> tailer.poll()
+    1
+    >>> (graph.user_exists(1), graph.get_user(3).movie_ratings[1], tailer.cursor.high_water_mark,
+    ...  tailer.stats.rows_skipped)
+    (False, 2.0, 100, 2)
+    >>> RatingTailer(graph, LogCursor(log, state_file=state), flush_interval=0.0).poll()
+    0
+    """
+    graph: Graph
+    cursor: LogCursor
+    batch_size: int
+    flush_interval: float
+    stats: IngestStats
+    _pending: list[tuple[int, int, float, int, int]]
+    _pending_since: float
+
+    def __init__(self, graph: Graph, cursor: LogCursor, batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL) -> None:
+        """Initialize a tailer that reads the log of cursor from the position of cursor and applies its ratings to
+        graph
+
+        Preconditions:
+        - batch_size > 0
+        - flush_interval >= 0
+        """
+        self.graph = graph
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = IngestStats()
+        self._pending = []
+        self._pending_since = 0.0
+
+    def poll(self) -> int:
+        """Read the complete lines appended to the log since the last poll, then apply the buffered ratings if a batch
+        is full or due. Return the number of ratings applied.
+
+        If the log is shorter than what was already read, it was truncated or replaced, and it is read again from its
+        start, catching up on its current contents: the ratings older than the high-water mark are then skipped.
+        """
+        cursor = self.cursor
+        try:
+            size = os.path.getsize(cursor.log_file)
+        except OSError:
+            size = 0
+        if size < cursor.read_offset:
+            if self._pending:
+                self.flush()
+            cursor.restart(size)
+        if cursor.catch_up_end is None:
+            cursor.catch_up_end = size
+        if size > cursor.read_offset:
+            with open(cursor.log_file, 'rb') as file:
+                file.seek(cursor.read_offset)
+                data = file.read(size - cursor.read_offset)
+            # A line without its newline may still be being written, so it is left for the next poll
+            end = data.rfind(b'\n') + 1
+            line_end = cursor.read_offset
+            for line in data[:end].split(b'\n')[:-1]:
+                line_end += len(line) + 1
+                self._buffer(line, line_end)
+            cursor.read_offset += end
+
+        applied = 0
+        while len(self._pending) >= self.batch_size:
+            applied += self.flush(self.batch_size)
+        if self._pending and time.monotonic() - self._pending_since >= self.flush_interval:
+            applied += self.flush()
+        return applied
+
+    def _buffer(self, line: bytes, line_end: int) -> None:
+        """Buffer the rating in line, a row of the log ending at offset line_end, unless it must be skipped
+        """
+        if not line.strip() or line.startswith(HEADER_PREFIX):
+            return
+        try:
+            user_id, movie_id, rating, timestamp = line.split(b',')
+            row = (int(user_id), int(movie_id), float(rating), int(timestamp))
+        except ValueError:
+            self.stats.rows_skipped += 1
+            return
+        if self.cursor.skips(row[3], line_end):
+            self.stats.rows_skipped += 1
+            return
+        if not self._pending:
+            self._pending_since = time.monotonic()
+        self._pending.append(row + (line_end,))
+
+    def flush(self, limit: Optional[int] = None) -> int:
+        """Apply the first limit buffered ratings to the graph (all of them if limit is None), save the position of
+        this tailer, and return the number of ratings applied
+        """
+        batch = self._pending if limit is None else self._pending[:limit]
+        self._pending = [] if limit is None else self._pending[limit:]
+        if self._pending:
+            self._pending_since = time.monotonic()
+        start = time.perf_counter()
+        ratings = []
+        for user_id, movie_id, rating, timestamp, line_end in batch:
+            self.cursor.applied_offset = line_end
+            if not self.graph.movie_exists(movie_id):
+                self.stats.rows_skipped += 1
+                continue
+            ratings.append((user_id, movie_id, rating))
+            if self.cursor.high_water_mark is None or timestamp > self.cursor.high_water_mark:
+                self.cursor.high_water_mark = timestamp
+        self.graph.add_ratings(ratings)
+        self.stats.apply_seconds += time.perf_counter() - start
+        self.stats.rows_applied += len(ratings)
+        self.stats.batches += 1
+        self.cursor.save()
+        return len(ratings)
+
+    def metrics(self) -> dict:
+        """Return the ingestion metrics of this tailer as a JSON-compatible dict: the counters of stats, the ratings
+        applied per second of applying and per second since this tailer started, the ratings buffered, the bytes of the
+        log not read yet, the high-water mark, and the lag: the seconds between now and the timestamp of the newest
+        rating applied
+        """
+        try:
+            unread = max(os.path.getsize(self.cursor.log_file) - self.cursor.read_offset, 0)
+        except OSError:
+            unread = 0
+        stats, high_water_mark = self.stats, self.cursor.high_water_mark
+        return {
+            'rows_applied': stats.rows_applied,
+            'rows_skipped': stats.rows_skipped,
+            'rows_pending': len(self._pending),
+            'bytes_unread': unread,
+            'batches': stats.batches,
+            'apply_rows_per_second': stats.rows_applied / stats.apply_seconds if stats.apply_seconds > 0 else None,
+            'rows_per_second': stats.rows_applied / max(time.monotonic() - stats.started, 1e-9),
+            'high_water_mark': high_water_mark,
+            'lag_seconds': None if high_water_mark is None else time.time() - high_water_mark
+        }
+
+    def run(self, duration: Optional[float] = None, on_batch: Optional[Callable[[dict], None]] = None) -> None:
+        """Poll the log until duration seconds have passed (forever if duration is None), sleeping POLL_INTERVAL
+        seconds whenever a poll reads nothing new. If on_batch is not None, it is called with the metrics of this
+        tailer after every poll that applied ratings. The buffered ratings are applied before returning.
+        """
+        stop = None if duration is None else time.monotonic() + duration
+        while stop is None or time.monotonic() < stop:
+            offset = self.cursor.read_offset
+            if self.poll() > 0 and on_batch is not None:
+                on_batch(self.metrics())
+            if self.cursor.read_offset == offset:
+                time.sleep(POLL_INTERVAL)
+        if self._pending:
+            self.flush()
+
+
+def max_timestamp(rating_file: str) -> Optional[int]:
+    """Return the largest timestamp in rating_file, a file in the format of ratings.csv, or None if it holds no
+    ratings. A tailer started with this high-water mark skips the ratings already loaded from rating_file.
+    """
+    latest = None
+    with open(rating_file, 'rb') as file:
+        next(file, None)
+        for line in file:
+            timestamp = int(line.rsplit(b',', 1)[1])
+            if latest is None or timestamp > latest:
+                latest = timestamp
+    return latest
+
+
+def _read_state(state_file: str) -> dict:
+    """Return the state saved in state_file, or an empty dict if there is no saved state
+    """
+    try:
+        with open(state_file, 'r', encoding='utf8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_state(state_file: str, state: dict) -> None:
+    """Save state to state_file, replacing its previous contents at once
+    """
+    partial_file = state_file + '.partial'
+    with open(partial_file, 'w', encoding='utf8') as file:
+        json.dump(state, file)
+    os.replace(partial_file, state_file)
+
+
+def main(argv: list[str]) -> None:
+    """Load the graph, then apply the ratings of the log in the command line arguments in argv as they are appended,
+    writing the ingestion metrics as JSON lines to standard error
+    """
+    parser = argparse.ArgumentParser(description='Apply the ratings appended to a ratings log to the graph.')
+    parser.add_argument('log', help='append-only ratings log, in the format of ratings.csv')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='ratings applied at once')
+    parser.add_argument('--flush-interval', type=float, default=DEFAULT_FLUSH_INTERVAL,
+                        help='most seconds a rating is buffered')
+    parser.add_argument('--state-file', help='file the offset read up to and the catch-up are saved to, so that a '
+                                             'restart skips the same rows of the log')
+    parser.add_argument('--duration', type=float, help='seconds to run for (default: forever)')
+    args = parser.parse_args(argv)
+
+    graph = Graph()
+    load(graph)
+    # The graph was loaded again from the datasets, so the ratings applied before a restart are applied again
+    cursor = LogCursor(args.log, max_timestamp(RATINGS_FILE), args.state_file, resume=False)
+    tailer = RatingTailer(graph, cursor, args.batch_size, args.flush_interval)
+    tailer.run(args.duration, lambda metrics: print(json.dumps(metrics), file=sys.stderr, flush=True))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,237 @@
+"""This Python module contains the classes used to measure the phases of the loading pipeline, and to report their
+progress.
+
+Each phase (reading the datasets, computing compatibility scores, computing recommendations...) is run inside
+Instrumentation.phase, which times it, optionally traces the memory it allocates, and hands it a progress callback.
+The functions of the pipeline call that callback as progress(done, total) every so often. Every event is forwarded to
+the sinks of the instrumentation, such as a progress bar in the user interface or a JSON log file.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import json
+import queue
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Iterator, Optional, Protocol, TextIO
+
+# Fewest seconds between two progress events forwarded to the sinks, except for the last event of a phase
+PROGRESS_INTERVAL = 0.05
+
+
+class ProgressFn(Protocol):
+    """ The type of a progress callback, called as progress(done, total) with the number of rows processed so far and
+    the total number of rows, or None if it is not known in advance
+    """
+
+    def __call__(self, done: int, total: Optional[int]) -> None:
+        """Report that done rows out of total have been processed
+        """
+
+
+class PhaseStats:
+    """ A class that holds the measurements of one phase of the loading pipeline
+
+    Instance Attributes:
+    - name:
+        The name of the phase
+    - seconds:
+        The wall time the phase took
+    - rows:
+        The number of rows (ratings, users...) the phase processed, as last reported to its progress callback
+    - memory_delta:
+        The number of bytes allocated during the phase and not yet freed at its end, or None if memory was not traced
+    - memory_peak:
+        The largest number of bytes allocated at once during the phase, or None if memory was not traced
+
+    Representation Invariants:
+    - self.seconds >= 0
+    - self.rows >= 0
+    """
+    name: str
+    seconds: float
+    rows: int
+    memory_delta: Optional[int]
+    memory_peak: Optional[int]
+
+    def __init__(self, name: str, seconds: float, rows: int) -> None:
+        self.name = name
+        self.seconds = seconds
+        self.rows = rows
+        self.memory_delta = None
+        self.memory_peak = None
+
+    def rows_per_second(self) -> float:
+        """Return the number of rows processed per second during this phase
+
+        >>> PhaseStats('import_ratings', 2.0, 1000).rows_per_second()
+        500.0
+        """
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        """Return the measurements of this phase as a JSON-compatible dict
+        """
+        return {'phase': self.name, 'seconds': self.seconds, 'rows': self.rows,
+                'rows_per_second': self.rows_per_second(), 'memory_delta': self.memory_delta,
+                'memory_peak': self.memory_peak}
+
+
+class Sink:
+    """ A class that receives the events of an Instrumentation. This class ignores every event, and is meant to be
+    subclassed by sinks that only handle some of them.
+    """
+
+    def phase_started(self, phase: str) -> None:
+        """Called when the phase called phase starts
+        """
+
+    def progress(self, phase: str, done: int, total: Optional[int]) -> None:
+        """Called when the phase called phase has processed done rows out of total (None if unknown)
+        """
+
+    def phase_finished(self, stats: PhaseStats) -> None:
+        """Called with the measurements of a phase when it ends
+        """
+
+
+class JsonLogSink(Sink):
+    """ A sink that writes every event as one line of JSON to a text file
+
+    Instance Attributes:
+    - file:
+        The file the events are written to
+    """
+    file: TextIO
+
+    def __init__(self, file: TextIO) -> None:
+        self.file = file
+
+    def phase_started(self, phase: str) -> None:
+        self._write({'event': 'phase_started', 'phase': phase})
+
+    def progress(self, phase: str, done: int, total: Optional[int]) -> None:
+        self._write({'event': 'progress', 'phase': phase, 'done': done, 'total': total})
+
+    def phase_finished(self, stats: PhaseStats) -> None:
+        self._write({'event': 'phase_finished', **stats.to_dict()})
+
+    def _write(self, event: dict) -> None:
+        """Write event to self.file, with the time it happened
+        """
+        self.file.write(json.dumps({'time': time.time(), **event}) + '\n')
+        self.file.flush()
+
+
+class QueueSink(Sink):
+    """ A sink that puts every event in a queue, so that the events of phases run on one thread can be handled on
+    another. Each event is a tuple holding the name of the Sink method it corresponds to, followed by its arguments,
+    and is handled by passing it to replay.
+
+    Instance Attributes:
+    - events:
+        The queue the events are put in
+    """
+    events: queue.Queue
+
+    def __init__(self, events: queue.Queue) -> None:
+        self.events = events
+
+    def phase_started(self, phase: str) -> None:
+        self.events.put(('phase_started', phase))
+
+    def progress(self, phase: str, done: int, total: Optional[int]) -> None:
+        self.events.put(('progress', phase, done, total))
+
+    def phase_finished(self, stats: PhaseStats) -> None:
+        self.events.put(('phase_finished', stats))
+
+
+def replay(event: tuple, sink: Sink) -> None:
+    """Call the method of sink corresponding to event, an event put in a queue by a QueueSink
+
+    >>> import sys
+    >>> events = queue.Queue()
+    >>> QueueSink(events).phase_started('import_ratings')
+    >>> replay(events.get(), JsonLogSink(sys.stdout))  # doctest: +ELLIPSIS
+    {"time": ..., "event": "phase_started", "phase": "import_ratings"}
+    """
+    getattr(sink, event[0])(*event[1:])
+
+
+class Instrumentation:
+    """ A class that measures the phases of the loading pipeline, and forwards their progress to a list of sinks
+
+    Instance Attributes:
+    - sinks:
+        The sinks that receive the events of every phase
+    - trace_memory:
+        Whether the memory allocated during each phase is traced with tracemalloc, which slows down pure Python code
+    - phases:
+        The measurements of every phase that has ended, in the order they ended
+
+    >>> instrumentation = Instrumentation()
+    >>> with instrumentation.phase('count') as progress:
+    ...     for i in range(1, 11):
+    ...         progress(i, 10)
+    >>> [(stats.name, stats.rows) for stats in instrumentation.phases]
+    [('count', 10)]
+    """
+    sinks: list[Sink]
+    trace_memory: bool
+    phases: list[PhaseStats]
+
+    def __init__(self, sinks: Optional[list[Sink]] = None, trace_memory: bool = False) -> None:
+        self.sinks = sinks if sinks is not None else []
+        self.trace_memory = trace_memory
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[ProgressFn]:
+        """Measure the phase called name, run in the body of a with statement, and yield the progress callback the
+        phase reports its progress to. Progress events are forwarded to the sinks at most once every
+        PROGRESS_INTERVAL seconds, except when a phase reports that it is done.
+        """
+        for sink in self.sinks:
+            sink.phase_started(name)
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        memory_before = 0
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        rows, last_report = 0, 0.0
+
+        def progress(done: int, total: Optional[int]) -> None:
+            nonlocal rows, last_report
+            rows = done
+            now = time.perf_counter()
+            if now - last_report >= PROGRESS_INTERVAL or done == total:
+                last_report = now
+                for sink in self.sinks:
+                    sink.progress(name, done, total)
+
+        start = time.perf_counter()
+        yield progress
+        stats = PhaseStats(name, time.perf_counter() - start, rows)
+        if self.trace_memory:
+            memory_after, stats.memory_peak = tracemalloc.get_traced_memory()
+            stats.memory_delta = memory_after - memory_before
+        if started_tracing:
+            tracemalloc.stop()
+        self.phases.append(stats)
+        for sink in self.sinks:
+            sink.phase_finished(stats)
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod()
+    python_ta.check_all(config={
+        'extra-imports': ['doctest', 'json', 'queue', 'time', 'tracemalloc', 'contextlib', 'typing'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
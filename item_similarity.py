@@ -0,0 +1,127 @@
+"""This Python module contains the item-based recommendation engine, an alternative to the user-based one of
+Graph.process_compat_users and Graph.process_movie_recommends.
+
+The similarity of two movies is computed like the compatibility score of two users, with the roles of users and movies
+swapped: 5.0 minus the mean absolute difference between the ratings the two movies received from the users who rated
+both. The most similar movies of every movie are computed once, from the transposed rating matrix (see
+sparse_compat.py). A user is then recommended the unrated movies most similar to the movies they rated highly, scored
+by (similarity * rating) like the user-based engine, so the cost of recommending to one user depends on the number of
+movies they rated, not on the number of users.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+from typing import Optional
+
+from graph import Graph, compute_recommendations
+from instrumentation import ProgressFn
+from movie_user_classes import Movie, User
+from sparse_compat import DEFAULT_BLOCK_SIZE, RatingMatrix, select_neighbours_sparse
+
+DEFAULT_MAX_NEIGHBOURS = 50
+DEFAULT_MIN_SHARED_USERS = 3
+
+
+class ItemIndex:
+    """ A class that holds the most similar movies of every movie
+
+    Instance Attributes:
+    - neighbours:
+        A mapping from the id of each movie to the most similar movies, as a mapping from movie id to similarity, in
+        descending order of similarity
+
+    Representation Invariants:
+    - all({m not in self.neighbours[m] for m in self.neighbours})
+    - all({0.0 <= s <= 5.0 for m in self.neighbours for s in self.neighbours[m].values()})
+
+    >>> m1, m2, m3 = Movie(1, 'A'), Movie(2, 'B'), Movie(3, 'C')
+    >>> m1.user_ratings = {1: 4.0, 2: 3.0}
+    >>> m2.user_ratings = {1: 5.0, 2: 3.0}
+    >>> m3.user_ratings = {3: 1.0}
+    >>> ItemIndex([m1, m2, m3], neighbour_limits=(None, 1)).neighbours
+    {1: {2: 4.5}, 2: {1: 4.5}, 3: {}}
+    """
+    neighbours: dict[int, dict[int, float]]
+
+    def __init__(self, movies: list[Movie],
+                 neighbour_limits: tuple[Optional[int], int] = (DEFAULT_MAX_NEIGHBOURS, DEFAULT_MIN_SHARED_USERS),
+                 block_size: int = DEFAULT_BLOCK_SIZE, progress: Optional[ProgressFn] = None) -> None:
+        """Compute the max_neighbours most similar movies of each movie in movies (all of them if max_neighbours is
+        None), among the movies rated by at least min_shared of the same users, where neighbour_limits is
+        (max_neighbours, min_shared). Movies are processed block_size at a time. If progress is not None, it is called
+        with the number of movies processed after each block.
+
+        Preconditions:
+        - neighbour_limits[0] is None or neighbour_limits[0] > 0
+        - neighbour_limits[1] > 0
+        - block_size > 0
+        """
+        matrix = RatingMatrix.from_movies(movies)
+        num_movies = matrix.num_users()
+        self.neighbours = {}
+        for start in range(0, num_movies, block_size):
+            stop = min(start + block_size, num_movies)
+            sums, counts = matrix.block_pair_stats((start, stop))
+            for i in range(start, stop):
+                counts[i - start, i] = 0
+                self.neighbours[movies[i].movie_id] = select_neighbours_sparse(
+                    matrix.user_ids, sums[i - start], counts[i - start], *neighbour_limits)
+            if progress is not None:
+                progress(stop, num_movies)
+
+    def recommend(self, user: User, min_rating: float, min_similarity: float, recommends_length: int) -> list[int]:
+        """Return a list of at most recommends_length movie ids recommended to user: the movies the user has not rated
+        that are most similar to a movie the user rated at least min_rating. Each movie is scored by the best
+        (similarity * rating) over the movies it is similar to with a similarity of at least min_similarity, ties
+        broken by lowest movie id.
+
+        Preconditions:
+        - min_rating <= 5.0
+        - min_similarity <= 5.0
+        - recommends_length > 0
+
+        >>> index = ItemIndex([])
+        >>> index.neighbours = {1: {2: 4.5, 3: 4.0}, 2: {1: 4.5}, 4: {3: 5.0, 5: 4.0}}
+        >>> user = User(1)
+        >>> user.movie_ratings = {1: 4.0, 4: 4.0, 6: 1.0}
+        >>> index.recommend(user, 4.0, 4.5, 10)
+        [3, 2]
+        """
+        # The user's highly rated movies play the part of the compatible users of the user-based engine
+        return compute_recommendations(user.movie_ratings, self._neighbours_of, user.movie_ratings,
+                                       (min_rating, min_similarity, recommends_length))
+
+    def _neighbours_of(self, movie_id: int) -> dict[int, float]:
+        """Return the most similar movies of the movie with id movie_id
+        """
+        return self.neighbours.get(movie_id, {})
+
+
+def process_item_recommends(graph: Graph, index: ItemIndex, recommend_params: tuple[float, float, int],
+                            progress: Optional[ProgressFn] = None) -> None:
+    """Update the recommendations of every user in graph with the item-based engine, using index, where
+    recommend_params is the (min_rating, min_similarity, recommends_length) given to ItemIndex.recommend. If progress
+    is not None, it is called with the number of users processed so far.
+
+    Preconditions:
+    - index was built from the movies of graph
+    - recommend_params[0] <= 5.0
+    - recommend_params[1] <= 5.0
+    - recommend_params[2] > 0
+    """
+    users = graph.get_all_users()
+    for i, user in enumerate(users, 1):
+        user.recommendations = index.recommend(user, *recommend_params)
+        if progress is not None:
+            progress(i, len(users))
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod()
+    python_ta.check_all(config={
+        'extra-imports': ['graph', 'instrumentation', 'movie_user_classes', 'sparse_compat', 'doctest', 'typing'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
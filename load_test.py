@@ -0,0 +1,147 @@
+"""This Python module contains the load test of the recommendation server in server.py.
+
+Running this file starts a server on a free local port (or uses one already running, given with --port), served by
+--workers processes sharing one graph in shared memory if more than one is given. It then sends requests for random
+users from several concurrent keep-alive connections, and reports the throughput and the p50 and p99 latency of each
+kind of request.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import random
+import socket
+import sys
+import time
+
+from server import HOST, read_message, run
+
+STARTUP_TIMEOUT = 120.0
+BATCH_SIZE = 20
+
+
+def percentile(latencies: list[float], fraction: float) -> float:
+    """Return the value below which the given fraction of latencies fall (nearest-rank method)
+
+    Preconditions:
+    - latencies != []
+    - 0.0 < fraction <= 1.0
+
+    >>> percentile([4.0, 1.0, 3.0, 2.0], 0.5)
+    2.0
+    >>> percentile(list(range(1, 101)), 0.99)
+    99
+    """
+    ordered = sorted(latencies)
+    return ordered[max(0, math.ceil(len(ordered) * fraction) - 1)]
+
+
+async def run_client(port: int, user_ids: list[int], requests: int, latencies: dict[str, list[float]]) -> None:
+    """Send requests requests for random users in user_ids on one keep-alive connection to the server on port, and
+    append the latency of each one to latencies[kind], where kind is the kind of request
+    """
+    reader, writer = await asyncio.open_connection(HOST, port)
+    try:
+        for _ in range(requests):
+            kind = random.choice(('recommendations', 'compats', 'batch'))
+            if kind == 'batch':
+                body = json.dumps({'user_ids': random.sample(user_ids, min(BATCH_SIZE, len(user_ids)))}).encode()
+                head = f"POST /users/recommendations HTTP/1.1\r\nHost: {HOST}\r\nContent-Length: {len(body)}\r\n\r\n"
+            else:
+                body = b''
+                head = f"GET /users/{random.choice(user_ids)}/{kind} HTTP/1.1\r\nHost: {HOST}\r\n\r\n"
+            start = time.perf_counter()
+            writer.write(head.encode('latin-1') + body)
+            await writer.drain()
+            response = await read_message(reader)
+            latencies[kind].append(time.perf_counter() - start)
+            if response is None or not response[0].startswith('HTTP/1.1 200'):
+                raise ConnectionError(f"unexpected response to {head.splitlines()[0]}: {response}")
+    finally:
+        writer.close()
+
+
+async def run_load(port: int, user_ids: list[int], connections: int, requests: int) -> tuple[dict, float]:
+    """Run connections clients at once, each sending requests requests, and return the latencies of each kind of
+    request with the total number of seconds taken
+    """
+    latencies = {'recommendations': [], 'compats': [], 'batch': []}
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(port, user_ids, requests, latencies) for _ in range(connections)))
+    return latencies, time.perf_counter() - start
+
+
+def print_results(latencies: dict[str, list[float]], seconds: float) -> None:
+    """Print the throughput and latency percentiles of a load test
+    """
+    total = sum(map(len, latencies.values()))
+    print(f"{total} requests in {seconds:.2f}s: {total / seconds:.0f} requests/s")
+    print(f"{'request':>16} {'count':>6} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    for kind, values in latencies.items():
+        if values:
+            print(f"{kind:>16} {len(values):>6} {percentile(values, 0.5) * 1000:>9.2f} "
+                  f"{percentile(values, 0.99) * 1000:>9.2f}")
+
+
+def wait_for_server(port: int, timeout: float = STARTUP_TIMEOUT) -> None:
+    """Wait until the server on port accepts connections, or raise TimeoutError after timeout seconds
+    """
+    deadline = time.monotonic() + timeout
+    while not accepts_connections(port):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"no server on port {port} after {timeout}s")
+        time.sleep(0.2)
+
+
+def accepts_connections(port: int) -> bool:
+    """Return whether a server on port accepts connections
+    """
+    try:
+        with socket.create_connection((HOST, port), timeout=1.0):
+            return True
+    except OSError:
+        return False
+
+
+def free_port() -> int:
+    """Return a local port that is free
+    """
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def main(argv: list[str]) -> None:
+    """Run the load test with the command line arguments in argv
+    """
+    parser = argparse.ArgumentParser(description='Load test the recommendation server.')
+    parser.add_argument('--port', type=int, help='port of a server already running (default: start one)')
+    parser.add_argument('--connections', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='requests sent on each connection')
+    parser.add_argument('--max-user-id', type=int, default=610, help='user ids are drawn from 1 to this id')
+    parser.add_argument('--workers', type=int, default=1, help='processes serving the started server')
+    args = parser.parse_args(argv)
+
+    server_process = None
+    port = args.port
+    if port is None:
+        port = free_port()
+        # A daemonic process cannot start the worker processes, so it is only daemonic when it serves alone
+        server_process = multiprocessing.Process(target=run, args=(HOST, port, args.workers),
+                                                 daemon=args.workers == 1)
+        server_process.start()
+    try:
+        wait_for_server(port)
+        user_ids = list(range(1, args.max_user_id + 1))
+        print_results(*asyncio.run(run_load(port, user_ids, args.connections, args.requests)))
+    finally:
+        if server_process is not None:
+            server_process.terminate()
+            server_process.join()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
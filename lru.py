@@ -0,0 +1,116 @@
+"""This Python module contains the LRUCache class used to bound the number of results kept in memory.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+
+class LRUCache:
+    """ A mapping that holds at most capacity entries. When a new entry would go over capacity, the least recently
+    used entry is evicted first.
+
+    Instance Attributes:
+    - capacity:
+        The maximum number of entries stored in this cache
+    - hits:
+        The number of calls to get that found their key in this cache
+    - misses:
+        The number of calls to get that did not find their key in this cache
+    - on_evict:
+        If not None, a function called with the key and value of every evicted entry
+
+    Representation Invariants:
+    - self.capacity > 0
+    - len(self._entries) <= self.capacity
+    - self.hits >= 0 and self.misses >= 0
+
+    >>> evicted = []
+    >>> cache = LRUCache(2, on_evict=lambda key, _: evicted.append(key))
+    >>> cache.put(1, 'a')
+    >>> cache.put(2, 'b')
+    >>> cache.get(1)
+    'a'
+    >>> cache.put(3, 'c')
+    >>> evicted
+    [2]
+    >>> cache.get(2) is None
+    True
+    >>> (cache.hits, cache.misses)
+    (1, 1)
+    """
+    capacity: int
+    hits: int
+    misses: int
+    on_evict: Optional[Callable[[Any, Any], None]]
+    _entries: OrderedDict
+
+    def __init__(self, capacity: int, on_evict: Optional[Callable[[Any, Any], None]] = None) -> None:
+        """Initialize an empty cache holding at most capacity entries
+
+        Preconditions:
+        - capacity > 0
+        """
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of entries in this cache
+        """
+        return len(self._entries)
+
+    def __contains__(self, key: Any) -> bool:
+        """Return whether key is in this cache, without counting a hit or miss or changing its recency
+        """
+        return key in self._entries
+
+    def get(self, key: Any) -> Optional[Any]:
+        """Return the value stored at key and mark it as the most recently used entry, or None if key is not in
+        this cache
+        """
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def put(self, key: Any, value: Any) -> None:
+        """Store value at key as the most recently used entry, evicting the least recently used entry if this cache
+        is full
+        """
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.capacity:
+            old_key, old_value = self._entries.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(old_key, old_value)
+
+    def discard(self, key: Any) -> None:
+        """Remove key from this cache if it is present, without calling on_evict
+        """
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove every entry from this cache, calling on_evict on each of them
+        """
+        while self._entries:
+            key, value = self._entries.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(key, value)
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod()
+    python_ta.check_all(config={
+        'extra-imports': ['__future__', 'doctest', 'collections', 'typing'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
@@ -0,0 +1,217 @@
+"""This Python module contains the MinHashLSH class used to find candidate compatible users without comparing every
+pair of users who share a movie.
+
+Each user's set of rated movies is summarized by a MinHash signature: the minimum of each of bands * rows random hash
+functions over the movie ids. Two users agree on one signature entry with probability equal to the Jaccard similarity
+of their movie sets. Users whose signatures agree on all the entries of at least one band become candidates, which
+proposes pairs with a high overlap with high probability while skipping most pairs with a low one. Only these pairs
+are scored, all at once with RatingMatrix.pair_stats, so the engine pays off when they are a small fraction of the pairs
+of users who share a movie; otherwise the exact 'sparse' engine is as fast or faster.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+from typing import Optional
+
+import numpy as np
+
+from instrumentation import ProgressFn
+from movie_user_classes import User
+from sparse_compat import RatingMatrix, select_neighbours_sparse
+
+# With 32 bands of 1 row, about 64% of the neighbours kept by the exact engines are found on the bundled dataset (at
+# most 100 neighbours sharing at least 3 movies), and about 75% on a synthetic dataset of 300,000 ratings (see
+# benchmark.py). Bands of 2 rows find fewer than 30% of them.
+DEFAULT_BANDS = 32
+DEFAULT_ROWS = 1
+_PRIME = (1 << 31) - 1
+_BLOCK_SIZE = 1024
+
+
+class MinHashLSH:
+    """ A class that proposes candidate compatible users from the MinHash signatures of their rated movies.
+
+    Instance Attributes:
+    - user_ids:
+        The ids of the users indexed, in the order of the rows of signatures
+    - bands:
+        The number of bands the signatures are split into
+    - rows:
+        The number of signature entries in each band
+    - signatures:
+        A len(user_ids) x (bands * rows) array. signatures[i, k] is the minimum of the k-th hash function over the
+        movies rated by the user with id user_ids[i]
+    - matrix:
+        The ratings of the users indexed, with one row per user in the order of user_ids
+
+    Representation Invariants:
+    - self.bands > 0 and self.rows > 0
+    - self.signatures.shape == (len(self.user_ids), self.bands * self.rows)
+    """
+    user_ids: list[int]
+    bands: int
+    rows: int
+    signatures: np.ndarray
+    matrix: RatingMatrix
+
+    def __init__(self, users: list[User], bands: int = DEFAULT_BANDS, rows: int = DEFAULT_ROWS,
+                 seed: Optional[int] = 0) -> None:
+        """Compute the signatures of users. seed initializes the random hash functions.
+
+        Preconditions:
+        - bands > 0 and rows > 0
+        """
+        self.bands = bands
+        self.rows = rows
+        self.matrix = RatingMatrix(users)
+        self.user_ids = self.matrix.user_ids.tolist()
+        self.signatures = _signatures(self.matrix, bands * rows, seed)
+
+    def candidate_pairs(self) -> np.ndarray:
+        """Return a k x 2 array of the distinct pairs of rows (i, j), with i < j, of the indexed users whose signatures
+        agree on every entry of at least one band, in ascending order
+
+        >>> users = [User(1), User(2), User(3)]
+        >>> users[0].movie_ratings = {1: 4.0, 2: 3.0, 3: 5.0}
+        >>> users[1].movie_ratings = {1: 2.0, 2: 3.0, 3: 1.0}
+        >>> users[2].movie_ratings = {7: 4.0}
+        >>> MinHashLSH(users).candidate_pairs().tolist()
+        [[0, 1]]
+        """
+        num_users = len(self.user_ids)
+        rated = np.flatnonzero(self.signatures.T[0] < _PRIME)
+        keys = [np.zeros(0, dtype=np.int64)]
+        for band in range(self.bands):
+            rows1, rows2 = _bucket_pairs(rated, self.signatures[rated, band * self.rows:(band + 1) * self.rows])
+            keys.append(np.minimum(rows1, rows2) * num_users + np.maximum(rows1, rows2))
+        # A pair is proposed at most once by each band, but may be proposed by several bands
+        keys = np.sort(np.concatenate(keys))
+        keys = keys[np.append(True, keys[1:] != keys[:-1])] if len(keys) else keys
+        return np.stack((keys // num_users, keys % num_users), axis=1)
+
+    def candidates(self) -> dict[int, set[int]]:
+        """Return a mapping from the id of each indexed user to the ids of the other users whose signatures agree with
+        theirs on every entry of at least one band
+
+        >>> users = [User(1), User(2), User(3)]
+        >>> users[0].movie_ratings = {1: 4.0, 2: 3.0, 3: 5.0}
+        >>> users[1].movie_ratings = {1: 2.0, 2: 3.0, 3: 1.0}
+        >>> users[2].movie_ratings = {7: 4.0}
+        >>> MinHashLSH(users).candidates()
+        {1: {2}, 2: {1}, 3: set()}
+        """
+        candidates = {user_id: set() for user_id in self.user_ids}
+        for i, j in self.candidate_pairs().tolist():
+            candidates[self.user_ids[i]].add(self.user_ids[j])
+            candidates[self.user_ids[j]].add(self.user_ids[i])
+        return candidates
+
+
+def _signatures(matrix: RatingMatrix, num_hashes: int, seed: Optional[int]) -> np.ndarray:
+    """Return the MinHash signatures of the rows of matrix: a matrix.num_users() x num_hashes array holding the
+    minimum of each of num_hashes random hash functions, initialized from seed, over the movies rated in each row.
+    The entries of rows without ratings are _PRIME.
+    """
+    rng = np.random.default_rng(seed)
+    coefficients = rng.integers(1, _PRIME, size=(num_hashes, 1), dtype=np.int64)
+    offsets = rng.integers(0, _PRIME, size=(num_hashes, 1), dtype=np.int64)
+    movie_ids = matrix.movie_ids[matrix.indices]
+
+    signatures = np.full((matrix.num_users(), num_hashes), _PRIME, dtype=np.int64)
+    non_empty = np.flatnonzero(np.diff(matrix.indptr))
+    for block in range(0, len(non_empty), _BLOCK_SIZE):
+        rows_in_block = non_empty[block:block + _BLOCK_SIZE]
+        first, last = matrix.indptr[rows_in_block[0]], matrix.indptr[rows_in_block[-1] + 1]
+        hashes = (coefficients * movie_ids[None, first:last] + offsets) % _PRIME
+        signatures[rows_in_block] = np.minimum.reduceat(hashes, matrix.indptr[rows_in_block] - first, axis=1).T
+    return signatures
+
+
+def _bucket_pairs(rows: np.ndarray, band_rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return the pairs of rows whose band of signature agrees on every entry, as two arrays (rows1, rows2), where
+    band_rows[i] is the band of row rows[i]
+
+    >>> _bucket_pairs(np.array([3, 5, 7]), np.array([[1, 2], [4, 4], [1, 2]]))
+    (array([3]), array([7]))
+    """
+    _, buckets = np.unique(band_rows, axis=0, return_inverse=True)
+    order = np.argsort(buckets.reshape(-1), kind='stable')
+    members = rows[order]
+    sorted_buckets = buckets.reshape(-1)[order]
+    # Pair each member of a bucket with every member after it in the same bucket
+    group_ends = np.append(np.flatnonzero(np.diff(sorted_buckets)) + 1, len(order))
+    num_partners = np.repeat(group_ends, np.diff(np.append(0, group_ends))) - np.arange(len(order)) - 1
+    firsts = np.repeat(np.arange(len(order), dtype=np.int64), num_partners)
+    offsets = np.arange(len(firsts), dtype=np.int64) - np.repeat(np.cumsum(num_partners) - num_partners, num_partners)
+    return members[firsts], members[firsts + 1 + offsets]
+
+
+def process_compat_users_lsh(users: list[User], lsh_params: tuple[int, int] = (DEFAULT_BANDS, DEFAULT_ROWS),
+                             neighbour_limits: tuple[Optional[int], int] = (None, 1),
+                             progress: Optional[ProgressFn] = None) -> None:
+    """Calculate the compatibility score between the pairs of users in users proposed by MinHashLSH with the
+    (bands, rows) in lsh_params, and update their user_compats attribute accordingly.
+
+    The scores of the candidate pairs are the same as the ones computed by Graph.process_compat_users, and are computed
+    all at once with RatingMatrix.pair_stats. neighbour_limits is (max_neighbours, min_shared), which limit the users
+    kept in user_compats as in select_neighbours_sparse. If progress is not None, it is called with the number of
+    users processed so far.
+
+    Preconditions:
+    - lsh_params[0] > 0 and lsh_params[1] > 0
+    - neighbour_limits[0] is None or neighbour_limits[0] > 0
+    - neighbour_limits[1] > 0
+
+    >>> u1, u2, u3 = User(1), User(2), User(3)
+    >>> u1.movie_ratings = {1: 4.0, 2: 3.0}
+    >>> u2.movie_ratings = {1: 5.0, 2: 1.0}
+    >>> u3.movie_ratings = {3: 2.0}
+    >>> process_compat_users_lsh([u1, u2, u3])
+    >>> u1.user_compats
+    {2: 3.5}
+    >>> u3.user_compats
+    {}
+    """
+    lsh = MinHashLSH(users, *lsh_params)
+    pairs = lsh.candidate_pairs()
+    sums, counts = lsh.matrix.pair_stats(*pairs.T)
+
+    # List each pair once for each of its users, grouped by user: owners holds the first row of every pair followed by
+    # the second row of every pair, so rolling it by one half gives the other row of the same pair
+    owners = pairs.T.ravel()
+    order = np.argsort(owners, kind='stable')
+    partners = np.roll(owners, len(pairs))[order]
+    sums, counts = np.tile(sums, 2)[order], np.tile(counts, 2)[order]
+    bounds = np.searchsorted(owners[order], np.arange(len(users) + 1)).tolist()
+    for i, user in enumerate(users):
+        group = slice(bounds[i], bounds[i + 1])
+        user.user_compats = select_neighbours_sparse(lsh.matrix.user_ids[partners[group]], sums[group], counts[group],
+                                                     *neighbour_limits)
+        if progress is not None:
+            progress(i + 1, len(users))
+
+
+def recall(exact: dict[int, dict[int, float]], approximate: dict[int, dict[int, float]]) -> float:
+    """Return the fraction of the (user, compatible user) pairs in exact that are also in approximate, where both map
+    each user id to the user_compats of that user
+
+    >>> recall({1: {2: 4.0, 3: 3.0}, 2: {1: 4.0}}, {1: {2: 4.0}, 2: {1: 4.0, 3: 2.0}})
+    0.6666666666666666
+    """
+    total = sum(len(user_compats) for user_compats in exact.values())
+    if total == 0:
+        return 1.0
+    found = sum(len(set(user_compats).intersection(approximate.get(user_id, {})))
+                for user_id, user_compats in exact.items())
+    return found / total
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod()
+    python_ta.check_all(config={
+        'extra-imports': ['instrumentation', 'movie_user_classes', 'sparse_compat', 'doctest', 'numpy', 'typing'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
@@ -1,27 +1,23 @@
 """This Python module contains the Code used to run the project.
 
+The settings used to load the datasets are in pipeline.py.
+
 This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
 """
 # Main File
-from ui import ui_main
-from read_data import import_movies, import_ratings
 from graph import Graph
-
-MIN_COMPAT_SCORE = 4.0
-MIN_RATING_SCORE = 4.0
-RECOMMENDATION_LENGTH = 10
+from instrumentation import Instrumentation, Sink
+from pipeline import load
 
 if __name__ == '__main__':
+    # tkinter is only imported once the user interface launches, so the modules above stay usable without a display
+    from ui import ui_main
+
     movie_user_graph = Graph()
-    movies_file = "data/movies.csv"
-    ratings_file = "data/ratings.csv"
 
-    def load() -> None:
-        """Draws loading screen while data is being processed and returned
+    def load_with_progress(sink: Sink) -> None:
+        """Loads the data, reporting the progress of each phase to sink. Called on a background thread by ui_main.
         """
-        import_movies(movies_file, movie_user_graph)
-        import_ratings(ratings_file, movie_user_graph)
-        movie_user_graph.process_compat_users()
-        movie_user_graph.process_movie_recommends(MIN_COMPAT_SCORE, MIN_RATING_SCORE, RECOMMENDATION_LENGTH)
+        load(movie_user_graph, Instrumentation([sink]))
 
-    ui_main(movie_user_graph, load_fn=load)
+    ui_main(movie_user_graph, load_fn=load_with_progress)
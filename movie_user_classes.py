@@ -1,11 +1,139 @@
 """ This Python module contains the User and Movies classes used in this project to represent a user and a movie
 in the datasets respectively.
 
+The ratings of users and movies are stored in SortedRatings objects: two parallel arrays of ids and float32 scores
+sorted by id, which take a fraction of the memory of a dict[int, float]. All ratings in the datasets are multiples of
+0.5, which float32 represents exactly. The genres of a movie are stored as a bitset, with bit i set if the movie is in
+GENRES[i].
+
 This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
 """
 from __future__ import annotations
-import doctest
-import python_ta
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterable, Iterator, Mapping, MutableMapping
+from typing import Optional
+
+# The genres used in the MovieLens datasets
+GENRES = ('Action', 'Adventure', 'Animation', 'Children', 'Comedy', 'Crime', 'Documentary', 'Drama', 'Fantasy',
+          'Film-Noir', 'Horror', 'IMAX', 'Musical', 'Mystery', 'Romance', 'Sci-Fi', 'Thriller', 'War', 'Western')
+_GENRE_BITS = {genre: 1 << i for i, genre in enumerate(GENRES)}
+
+
+class SortedRatings(MutableMapping):
+    """ A mapping from ids to ratings, stored as two parallel arrays sorted by id.
+
+    Lookups take O(log n) time. Adding a rating takes O(1) time when its id is larger than every id already stored
+    (as when reading the datasets, which are sorted by id), and O(n) time otherwise.
+
+    Instance Attributes:
+    - ids:
+        The ids in this mapping, in ascending order
+    - scores:
+        The rating of each id, so that scores[i] is the rating of ids[i]
+
+    Both are arrays, or read-only memoryviews for a mapping returned by view.
+
+    Representation Invariants:
+    - len(self.ids) == len(self.scores)
+    - all({self.ids[i] < self.ids[i + 1] for i in range(len(self.ids) - 1)})
+
+    >>> ratings = SortedRatings({3: 4.0, 1: 2.5})
+    >>> ratings[5] = 1.0
+    >>> ratings[3] = 3.5
+    >>> dict(ratings)
+    {1: 2.5, 3: 3.5, 5: 1.0}
+    >>> 2 in ratings
+    False
+    """
+    __slots__: tuple[str, ...] = ('ids', 'scores')
+    ids: array
+    scores: array
+
+    def __init__(self, ratings: Optional[Mapping[int, float]] = None) -> None:
+        """Initialize this mapping with the items in ratings, or with no items if ratings is None
+        """
+        self.ids = array('i')
+        self.scores = array('f')
+        if ratings is not None:
+            items = sorted(ratings.items())
+            self.ids.extend(item[0] for item in items)
+            self.scores.extend(item[1] for item in items)
+
+    def assign_sorted(self, ids: bytes, scores: bytes) -> None:
+        """Replace the contents of this mapping with the raw int32 ids and float32 scores in ids and scores
+
+        Preconditions:
+        - ids holds distinct ids in ascending order
+        - len(ids) == len(scores)
+        """
+        self.ids = array('i')
+        self.ids.frombytes(ids)
+        self.scores = array('f')
+        self.scores.frombytes(scores)
+
+    @classmethod
+    def view(cls, ids: memoryview, scores: memoryview) -> SortedRatings:
+        """Return a read-only mapping over ids and scores, memoryviews of int32 ids and float32 scores in the format
+        of the ids and scores attributes, without copying them. Modifying the mapping raises an error.
+
+        Preconditions:
+        - ids holds distinct ids in ascending order
+        - len(ids) == len(scores)
+
+        >>> ratings = SortedRatings.view(memoryview(array('i', [1, 3])), memoryview(array('f', [2.5, 4.0])))
+        >>> (ratings[3], 2 in ratings)
+        (4.0, False)
+        """
+        ratings = cls.__new__(cls)
+        ratings.ids = ids.toreadonly()
+        ratings.scores = scores.toreadonly()
+        return ratings
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.ids)
+
+    def __contains__(self, key: object) -> bool:
+        i = bisect_left(self.ids, key)
+        return i < len(self.ids) and self.ids[i] == key
+
+    def __getitem__(self, key: int) -> float:
+        i = bisect_left(self.ids, key)
+        if i < len(self.ids) and self.ids[i] == key:
+            return self.scores[i]
+        raise KeyError(key)
+
+    def __setitem__(self, key: int, value: float) -> None:
+        if not self.ids or key > self.ids[-1]:
+            self.ids.append(key)
+            self.scores.append(value)
+            return
+        i = bisect_left(self.ids, key)
+        if self.ids[i] == key:
+            self.scores[i] = value
+        else:
+            self.ids.insert(i, key)
+            self.scores.insert(i, value)
+
+    def __delitem__(self, key: int) -> None:
+        i = bisect_left(self.ids, key)
+        if i == len(self.ids) or self.ids[i] != key:
+            raise KeyError(key)
+        del self.ids[i]
+        del self.scores[i]
+
+    def items(self) -> Iterator[tuple[int, float]]:
+        """Return an iterator over the (id, rating) pairs of this mapping, in ascending order of id
+        """
+        return zip(self.ids, self.scores)
+
+    def values(self) -> Iterator[float]:
+        """Return an iterator over the ratings of this mapping, in ascending order of id
+        """
+        return iter(self.scores)
 
 
 class User:
@@ -16,7 +144,7 @@ class User:
         The id (unique identifier) for this user.
     - movie_ratings:
         A mapping containing the movies this user has rated. Each key is a movie id and each value is the
-        score the user gave.
+        score the user gave. Assigning any mapping to this attribute stores it as a SortedRatings.
     - user_compats:
         A mapping containing compatible users. Each key is a user id, and each value is the compatibility score for the
         user
@@ -28,8 +156,9 @@ class User:
     - all({0.5 <= self.movie_ratings[m] <= 5.0 for m in self.movie_ratings})
     - len(self.recommendations) == len(set(self.recommendations))
     """
+    __slots__: tuple[str, ...] = ('user_id', '_movie_ratings', 'user_compats', 'recommendations')
     user_id: int
-    movie_ratings: dict[int, float]
+    _movie_ratings: SortedRatings
     user_compats: dict[int, float]
     recommendations: list[int]
 
@@ -37,14 +166,24 @@ class User:
         """Initialize this user with the given user_id, and with empty movie_ratings,
         user_compats, and recommendations"""
         self.user_id = user_id
-        self.movie_ratings = {}
+        self._movie_ratings = SortedRatings()
         self.user_compats = {}
         self.recommendations = []
 
+    @property
+    def movie_ratings(self) -> SortedRatings:
+        """The ratings this user gave, as a mapping from movie id to score
+        """
+        return self._movie_ratings
+
+    @movie_ratings.setter
+    def movie_ratings(self, ratings: Mapping[int, float]) -> None:
+        self._movie_ratings = ratings if isinstance(ratings, SortedRatings) else SortedRatings(ratings)
+
     def get_movies(self) -> set[int]:
         """Return a set of movie ids for movies this user has rated
         """
-        return set(self.movie_ratings)
+        return set(self._movie_ratings.ids)
 
     def get_rating(self, movie_id: int) -> float:
         """ Return the score this user gave for the movie with id == movie_id
@@ -52,7 +191,7 @@ class User:
         Preconditions:
         - movie_id in self.movie_ratings
         """
-        return self.movie_ratings[movie_id]
+        return self._movie_ratings[movie_id]
 
 
 class Movie:
@@ -63,35 +202,77 @@ class Movie:
         The id (unique identifier) for this movie
     - title:
         The title of this movie
+    - genres:
+        The genres of this movie, as a bitset: bit i is set if this movie is in GENRES[i]
     - user_ratings:
         A mapping containing the users who have rated this movie. Each key is a user id and each value is the score
-        given by the user
+        given by the user. Assigning any mapping to this attribute stores it as a SortedRatings.
 
     Representation Invariants
     - self.movie_id > 0
+    - 0 <= self.genres < 2 ** len(GENRES)
     - all({0.5 <= self.user_ratings[u] <= 5.0 for u in self.user_ratings})
+
+    >>> Movie(1, 'Toy Story (1995)', genre_bits(['Animation', 'Comedy'])).get_genres()
+    ['Animation', 'Comedy']
     """
+    __slots__: tuple[str, ...] = ('movie_id', 'title', 'genres', '_user_ratings')
     movie_id: int
     title: str
-    user_ratings: dict[int, float]
+    genres: int
+    _user_ratings: SortedRatings
 
-    def __init__(self, movie_id: int, title: str) -> None:
-        """Initialize the given movie with the given movie_id and title, and with empty user_ratings
+    def __init__(self, movie_id: int, title: str, genres: int = 0) -> None:
+        """Initialize the given movie with the given movie_id, title and genres bitset, and with empty user_ratings
         """
         self.movie_id = movie_id
         self.title = title
-        self.user_ratings = {}
+        self.genres = genres
+        self._user_ratings = SortedRatings()
+
+    @property
+    def user_ratings(self) -> SortedRatings:
+        """The ratings given to this movie, as a mapping from user id to score
+        """
+        return self._user_ratings
+
+    @user_ratings.setter
+    def user_ratings(self, ratings: Mapping[int, float]) -> None:
+        self._user_ratings = ratings if isinstance(ratings, SortedRatings) else SortedRatings(ratings)
 
     def get_users(self) -> list[int]:
         """Return a list of user ids for users that have rated this movie
         """
-        return list(self.user_ratings)
+        return self._user_ratings.ids.tolist()
+
+    def get_genres(self) -> list[str]:
+        """Return the names of the genres of this movie, in the order of GENRES
+        """
+        return [genre for genre in GENRES if self.genres & _GENRE_BITS[genre]]
+
+
+def genre_bits(genres: Iterable[str]) -> int:
+    """Return the bitset of the genres named in genres. Names that are not in GENRES (such as the
+    "(no genres listed)" of the datasets) are ignored.
+
+    >>> genre_bits('Comedy|Drama|(no genres listed)'.split('|')) == genre_bits(['Drama', 'Comedy'])
+    True
+    >>> genre_bits(['Action'])
+    1
+    """
+    bits = 0
+    for genre in genres:
+        bits |= _GENRE_BITS.get(genre, 0)
+    return bits
 
 
 if __name__ == '__main__':
+    import doctest
+    import python_ta
+
     doctest.testmod()
     python_ta.check_all(config={
-        'extra-imports': ['__future__', 'doctest'],
+        'extra-imports': ['__future__', 'doctest', 'array', 'bisect', 'collections.abc', 'typing'],
         'allowed-io': [],
         'max-line-length': 120
     })
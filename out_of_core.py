@@ -0,0 +1,197 @@
+"""This Python module contains the out-of-core engine used to compute the compatibility scores between users when the
+scores of every pair of users do not fit in memory.
+
+The users are split into blocks, and the scores are computed one (block, block) pair at a time with
+RatingMatrix.block_pair_stats, so the pair statistics held at once are bounded by the square of the block size, and
+the ratings of a block are expanded a chunk at a time. A quarter of the memory budget goes to each of the pair
+statistics, the expanded ratings and the buffered neighbours, and the rest to merging the segments. The
+neighbours found for each user are buffered, and whenever the buffer grows past its share of the memory budget it is
+spilled to disk as a segment: three .npy arrays (user row, neighbour id, score), sorted by user and then by descending
+score, holding at most max_neighbours entries per user. Once every block pair is done, the segments are memory-mapped
+and merged a block of users at a time, and only the neighbours process_movie_recommends uses are kept in user_compats:
+the max_neighbours best ones, with a score of at least min_score.
+
+The memory budget bounds the memory used by the computation itself. The rating matrix and the resulting user_compats
+are not counted, since with a max_neighbours limit they are proportional to the ratings and to the number of users
+rather than to the number of pairs of users. Without one, every pair of users with a score of at least min_score is
+kept, so Graph.process_compat_users requires one for this engine.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import math
+import os
+import tempfile
+from typing import Optional
+
+import numpy as np
+
+from instrumentation import ProgressFn
+from movie_user_classes import User
+from sparse_compat import RatingMatrix
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+_PAIR_BYTES = 48  # Bytes used per pair of users of a block pair: sums, counts and the temporaries of bincount
+_EXPANDED_BYTES = 64  # Bytes used per expanded entry of RatingMatrix.block_pair_stats
+_ENTRY_BYTES = 24  # Bytes used per buffered neighbour: user row, neighbour id and score
+
+
+def block_size_for(memory_budget: int) -> int:
+    """Return the number of users per block for which the pair statistics of a block pair use at most a quarter of
+    memory_budget bytes
+
+    >>> block_size_for(4 * 48 * 100)
+    10
+    """
+    return max(1, math.isqrt(memory_budget // (4 * _PAIR_BYTES)))
+
+
+def process_compat_users_on_disk(users: list[User], memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                                 neighbour_limits: tuple[Optional[int], int] = (None, 1),
+                                 min_score: Optional[float] = None, progress: Optional[ProgressFn] = None) -> None:
+    """Calculate the compatibility score between every pair of users in users that have rated at least min_shared
+    common movies, and update their user_compats attribute accordingly, using about memory_budget bytes, where
+    neighbour_limits is (max_neighbours, min_shared).
+
+    The scores are the same as the ones of sparse_compat.process_compat_users_sparse, and only the max_neighbours
+    highest of each user are kept (all of them if max_neighbours is None), ties broken by lowest user id. If
+    min_score is not None, scores below min_score are dropped. The segments are spilled to a new directory in the
+    default temporary directory (see tempfile.gettempdir), removed before returning. If progress is not None, it is
+    called with the number of users processed after each block.
+
+    Preconditions:
+    - memory_budget > 0
+    - neighbour_limits[0] is None or neighbour_limits[0] > 0
+    - neighbour_limits[1] > 0
+
+    >>> u1, u2, u3 = User(1), User(2), User(3)
+    >>> u1.movie_ratings = {1: 4.0, 2: 3.0}
+    >>> u2.movie_ratings = {1: 5.0, 2: 1.0}
+    >>> u3.movie_ratings = {1: 4.0}
+    >>> process_compat_users_on_disk([u1, u2, u3], memory_budget=100)
+    >>> (u1.user_compats, u3.user_compats)
+    ({3: 5.0, 2: 3.5}, {1: 5.0, 2: 4.0})
+    """
+    matrix = RatingMatrix(users)
+    with tempfile.TemporaryDirectory() as directory:
+        segments = _spill_neighbours(matrix, directory, memory_budget, (*neighbour_limits, min_score), progress)
+        _merge_segments(users, segments, block_size_for(memory_budget), neighbour_limits[0])
+
+
+def _spill_neighbours(matrix: RatingMatrix, directory: str, memory_budget: int,
+                      limits: tuple[Optional[int], int, Optional[float]],
+                      progress: Optional[ProgressFn]) -> list[list[str]]:
+    """Find the best neighbours of every user in matrix one block pair at a time, spill them to segments in
+    directory whenever their buffer grows past its share of memory_budget, and return the paths of the arrays of each
+    segment. limits is (max_neighbours, min_shared, min_score), as in _block_neighbours.
+    """
+    num_users = matrix.num_users()
+    block_size = block_size_for(memory_budget)
+    max_expanded = max(1, memory_budget // (4 * _EXPANDED_BYTES))
+    buffer_limit = max(1, memory_budget // (4 * _ENTRY_BYTES))
+    segments = []
+    buffered = []
+    for start in range(0, num_users, block_size):
+        stop = min(start + block_size, num_users)
+        for col_start in range(0, num_users, block_size):
+            col_stop = min(col_start + block_size, num_users)
+            buffered.append(_block_neighbours(matrix, (start, stop, col_start, col_stop), max_expanded, limits))
+            if sum(len(rows) for rows, _, _ in buffered) >= buffer_limit:
+                segments.append(_write_segment(directory, len(segments), _concatenate(buffered), limits[0]))
+                buffered = []
+        if progress is not None:
+            progress(stop, num_users)
+    if buffered:
+        segments.append(_write_segment(directory, len(segments), _concatenate(buffered), limits[0]))
+    return segments
+
+
+def _block_neighbours(matrix: RatingMatrix, block_pair: tuple[int, int, int, int], max_expanded: int,
+                      limits: tuple[Optional[int], int, Optional[float]]) \
+        -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return the best neighbours among the users in rows col_start to col_stop - 1 of the users in rows start to
+    stop - 1 of matrix, where block_pair is (start, stop, col_start, col_stop), sorted as in _top_neighbours. limits
+    is (max_neighbours, min_shared, min_score): only pairs of users who share at least min_shared rated movies are
+    scored, and if min_score is not None, scores below min_score are dropped.
+    """
+    start, stop, col_start, col_stop = block_pair
+    sums, counts = matrix.block_pair_stats((start, stop), (col_start, col_stop), max_expanded)
+    if start == col_start:
+        np.fill_diagonal(counts, 0)
+    rows, cols = np.nonzero(counts >= limits[1])
+    scores = 5.0 - sums[rows, cols] / counts[rows, cols]
+    if limits[2] is not None:
+        kept = scores >= limits[2]
+        rows, cols, scores = rows[kept], cols[kept], scores[kept]
+    return _top_neighbours((rows + start, matrix.user_ids[cols + col_start], scores), limits[0])
+
+
+def _top_neighbours(neighbours: tuple[np.ndarray, np.ndarray, np.ndarray], max_neighbours: Optional[int]) \
+        -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return neighbours, the (rows, neighbour ids, scores) of a list of users, sorted by row, then by descending
+    score and ascending neighbour id, keeping only the first max_neighbours of each row (all of them if max_neighbours
+    is None)
+
+    >>> _top_neighbours((np.array([1, 0, 0, 0]), np.array([7, 5, 6, 4]), np.array([3.0, 4.0, 4.0, 2.0])), 2)
+    (array([0, 0, 1]), array([5, 6, 7]), array([4., 4., 3.]))
+    """
+    rows, partner_ids, scores = neighbours
+    order = np.lexsort((partner_ids, -scores, rows))
+    rows, partner_ids, scores = rows[order], partner_ids[order], scores[order]
+    if max_neighbours is not None:
+        ranks = np.arange(len(rows)) - np.searchsorted(rows, rows)
+        kept = ranks < max_neighbours
+        rows, partner_ids, scores = rows[kept], partner_ids[kept], scores[kept]
+    return rows, partner_ids, scores
+
+
+def _concatenate(parts: list[tuple[np.ndarray, np.ndarray, np.ndarray]]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return the neighbours in parts as one (rows, neighbour ids, scores) tuple
+    """
+    return (np.concatenate([part[0] for part in parts]), np.concatenate([part[1] for part in parts]),
+            np.concatenate([part[2] for part in parts]))
+
+
+def _write_segment(directory: str, index: int, neighbours: tuple[np.ndarray, np.ndarray, np.ndarray],
+                   max_neighbours: Optional[int]) -> list[str]:
+    """Write neighbours to the segment with the given index in directory, sorted and truncated as in _top_neighbours,
+    and return the paths of its arrays
+    """
+    paths = []
+    for name, values in zip(('rows', 'partners', 'scores'), _top_neighbours(neighbours, max_neighbours)):
+        paths.append(os.path.join(directory, f"segment_{index}_{name}.npy"))
+        np.save(paths[-1], values)
+    return paths
+
+
+def _merge_segments(users: list[User], segments: list[list[str]], block_size: int,
+                    max_neighbours: Optional[int]) -> None:
+    """Set the user_compats of every user in users to their best neighbours over all segments, merging the segments
+    block_size users at a time
+    """
+    arrays = [[np.load(path, mmap_mode='r') for path in paths] for paths in segments]
+    for start in range(0, len(users), block_size):
+        stop = min(start + block_size, len(users))
+        parts = [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0))]
+        for rows, partner_ids, scores in arrays:
+            first, last = np.searchsorted(rows, [start, stop])
+            parts.append((np.array(rows[first:last]), np.array(partner_ids[first:last]),
+                          np.array(scores[first:last])))
+        rows, partner_ids, scores = _top_neighbours(_concatenate(parts), max_neighbours)
+        bounds = np.searchsorted(rows, np.arange(start, stop + 1)).tolist()
+        partner_ids, scores = partner_ids.tolist(), scores.tolist()
+        for i in range(start, stop):
+            first, last = bounds[i - start], bounds[i - start + 1]
+            users[i].user_compats = dict(zip(partner_ids[first:last], scores[first:last]))
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod()
+    python_ta.check_all(config={
+        'extra-imports': ['instrumentation', 'movie_user_classes', 'sparse_compat', 'doctest', 'math', 'os',
+                          'tempfile', 'typing', 'numpy'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
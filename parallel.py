@@ -0,0 +1,152 @@
+"""This Python module contains the functions used to compute compatibility scores and recommendations for the users
+of a graph on several processes at once.
+
+The users are split into shards that are handed to a pool of worker processes. The movie ratings are given to each
+worker once, when the worker starts, so that a task only carries the ids of the users in its shard.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import multiprocessing
+import multiprocessing.pool
+import os
+from typing import Optional
+
+from graph import Graph, compute_recommendations, rated_pair_stats, select_neighbours
+from instrumentation import ProgressFn
+
+SHARDS_PER_WORKER = 4
+
+
+class _WorkerRatings:
+    """ A class whose class attributes hold the ratings visible to a worker process, set once by _init_worker
+
+    Class Attributes:
+    - user_ratings:
+        A mapping from the id of each user to their movie_ratings
+    - movie_ratings:
+        A mapping from the id of each rated movie to its user_ratings
+    """
+    user_ratings: dict[int, dict[int, float]] = {}
+    movie_ratings: dict[int, dict[int, float]] = {}
+
+
+def process_compat_users_parallel(graph: Graph, workers: Optional[int] = None, max_neighbours: Optional[int] = None,
+                                  min_shared: int = 1, progress: Optional[ProgressFn] = None) -> None:
+    """Computes the same user_compats as graph.process_compat_users(), using a pool of workers processes.
+    If workers is None, one process is used per CPU. max_neighbours and min_shared limit the users kept in each
+    user_compats, as in Graph.set_neighbour_limits. If progress is not None, it is called with the number of users
+    processed after each shard.
+
+    Preconditions:
+    - workers is None or workers > 0
+    - max_neighbours is None or max_neighbours > 0
+    - min_shared > 0
+    """
+    workers = workers or os.cpu_count()
+    users = graph.get_all_users()
+    with _make_pool(graph, workers) as pool:
+        shards = _split([user.user_id for user in users], workers * SHARDS_PER_WORKER)
+        tasks = [(shard, max_neighbours, min_shared) for shard in shards]
+        done = 0
+        for shard_result in pool.imap_unordered(_compat_shard, tasks):
+            for user_id, user_compats in shard_result:
+                graph.get_user(user_id).user_compats = user_compats
+            done += len(shard_result)
+            if progress is not None:
+                progress(done, len(users))
+
+
+def process_recommends_parallel(graph: Graph, recommend_params: tuple[float, float, int],
+                                workers: Optional[int] = None, progress: Optional[ProgressFn] = None) -> None:
+    """Computes the same recommendations as graph.process_movie_recommends(*recommend_params), where
+    recommend_params is (min_score, min_rating, recommends_length), using a pool of workers processes. If workers is
+    None, one process is used per CPU. If progress is not None, it is called with the number of users processed after
+    each shard. As with graph.process_movie_recommends, the parameters are recorded in graph, so the recommendations
+    made stale by ratings added later are recomputed with them.
+
+    Preconditions:
+    - recommend_params[0] <= 5.0
+    - recommend_params[1] <= 5.0
+    - recommend_params[2] > 0
+    - workers is None or workers > 0
+    """
+    workers = workers or os.cpu_count()
+    users = graph.get_all_users()
+    with _make_pool(graph, workers) as pool:
+        shards = _split([(user.user_id, user.user_compats) for user in users], workers * SHARDS_PER_WORKER)
+        tasks = [(shard, recommend_params) for shard in shards]
+        done = 0
+        for shard_result in pool.imap_unordered(_recommend_shard, tasks):
+            for user_id, recommendations in shard_result:
+                graph.get_user(user_id).recommendations = recommendations
+            done += len(shard_result)
+            if progress is not None:
+                progress(done, len(users))
+    graph.set_recommend_params(*recommend_params)
+
+
+def _make_pool(graph: Graph, workers: int) -> multiprocessing.pool.Pool:
+    """Return a pool of workers processes that share the ratings stored in graph
+    """
+    user_ratings = {u.user_id: u.movie_ratings for u in graph.get_all_users()}
+    movie_ratings = {}
+    for user in graph.get_all_users():
+        for movie_id in user.movie_ratings:
+            if movie_id not in movie_ratings:
+                movie_ratings[movie_id] = graph.get_movie(movie_id).user_ratings
+    return multiprocessing.Pool(workers, initializer=_init_worker, initargs=(user_ratings, movie_ratings))
+
+
+def _split(items: list, num_shards: int) -> list[list]:
+    """Split items into at most num_shards shards of equal size
+
+    >>> _split([1, 2, 3, 4, 5], 3)
+    [[1, 2], [3, 4], [5]]
+    """
+    shard_size = max(1, -(-len(items) // num_shards))
+    return [items[i:i + shard_size] for i in range(0, len(items), shard_size)]
+
+
+def _init_worker(user_ratings: dict[int, dict[int, float]], movie_ratings: dict[int, dict[int, float]]) -> None:
+    """Store the ratings shared by all the tasks run in this worker process
+    """
+    _WorkerRatings.user_ratings = user_ratings
+    _WorkerRatings.movie_ratings = movie_ratings
+
+
+def _compat_shard(task: tuple[list[int], Optional[int], int]) -> list[tuple[int, dict[int, float]]]:
+    """Return the user_compats of each user in a shard, as a list of (user id, user_compats) tuples. task is a tuple
+    (user_ids, max_neighbours, min_shared), where user_ids holds the ids of the users in the shard.
+    """
+    user_ids, max_neighbours, min_shared = task
+    results = []
+    for user_id in user_ids:
+        pair_stats = rated_pair_stats(user_id, _WorkerRatings.user_ratings[user_id], _WorkerRatings.movie_ratings.get)
+        results.append((user_id, select_neighbours(pair_stats, max_neighbours, min_shared)))
+    return results
+
+
+def _recommend_shard(task: tuple[list[tuple[int, dict[int, float]]], tuple[float, float, int]]) \
+        -> list[tuple[int, list[int]]]:
+    """Return the recommendations of each user in a shard, as a list of (user id, recommendations) tuples.
+    task is a tuple (shard, recommend_params), where shard is a list of (user id, user_compats) tuples and
+    recommend_params is (min_score, min_rating, recommends_length).
+    """
+    shard, recommend_params = task
+    user_ratings = _WorkerRatings.user_ratings
+    return [(user_id, compute_recommendations(user_compats, user_ratings.get, set(user_ratings[user_id]),
+                                              recommend_params))
+            for user_id, user_compats in shard]
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod()
+    python_ta.check_all(config={
+        'extra-imports': ['graph', 'instrumentation', 'doctest', 'multiprocessing', 'multiprocessing.pool', 'os',
+                          'typing'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
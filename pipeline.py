@@ -0,0 +1,86 @@
+"""This Python module contains the pipeline used to load the datasets into a graph and compute the compatibility
+scores and recommendations of its users, without the graphical user interface.
+
+Running this file loads the bundled datasets, computes the results of every user and saves them to RESULT_CACHE_FILE,
+so that main.py starts from them, and writes the measurements of every phase as JSON lines to standard output.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import os
+import sys
+from typing import Optional
+
+from graph import Graph
+from instrumentation import Instrumentation, JsonLogSink
+from parallel import process_compat_users_parallel, process_recommends_parallel
+from result_cache import fingerprint, load_results, save_results
+from snapshot import import_dataset
+
+MOVIES_FILE = "data/movies.csv"
+RATINGS_FILE = "data/ratings.csv"
+SNAPSHOT_DIR = "data/snapshot"
+# Where computed results are kept between runs, or None to not keep them. They are written when the results of every
+# user are computed (when LAZY_RECOMMENDS is False, or by running this file), and read instead whenever they hold the
+# results of the same datasets and settings, in lazy mode too
+RESULT_CACHE_FILE = "data/cache/results.npz"
+MIN_COMPAT_SCORE = 4.0
+MIN_RATING_SCORE = 4.0
+RECOMMENDATION_LENGTH = 10
+COMPAT_ENGINE = 'sparse'  # 'python', 'sparse', 'lsh' or 'out_of_core', see Graph.process_compat_users
+MEMORY_BUDGET = 256 * 1024 * 1024  # Bytes the 'out_of_core' compat engine computes the scores in, see MAX_NEIGHBOURS
+WORKERS = 1  # Number of processes used for the 'python' compat engine and for recommendations
+LAZY_RECOMMENDS = True  # Compute a user's compat scores and recommendations only when they are first displayed
+CACHE_SIZE = 256  # Number of users whose results are kept in memory in lazy mode
+# Most compatible users kept per user, or None to keep them all, and fewest movies two users must both have rated to
+# be compatible. Limiting them (to 100 and 3, say) makes large datasets faster to process, but changes the
+# recommendations, so by default every user who shares a rated movie is kept, as the written report describes. The
+# 'out_of_core' compat engine needs MAX_NEIGHBOURS to be set, or the user_compats it keeps would not fit in memory.
+MAX_NEIGHBOURS = None
+MIN_SHARED_MOVIES = 1
+
+
+def load(graph: Graph, instrumentation: Optional[Instrumentation] = None, lazy: bool = LAZY_RECOMMENDS) -> None:
+    """Populates graph with the bundled datasets, and computes the compatibility scores and recommendations of its
+    users with the settings above (or prepares graph to compute them on demand, if lazy). Each phase is measured by
+    instrumentation, if it is not None.
+
+    The results are read from RESULT_CACHE_FILE instead if it holds the results of the same datasets and settings,
+    whether lazy or not, so main.py starts with the results of every user once they have been saved. When the results
+    are computed up front (lazy is False), they are then written to RESULT_CACHE_FILE.
+    """
+    instrumentation = instrumentation or Instrumentation()
+    import_dataset(MOVIES_FILE, RATINGS_FILE, graph, SNAPSHOT_DIR, instrumentation)
+    graph.set_neighbour_limits(MAX_NEIGHBOURS, MIN_SHARED_MOVIES)
+    key = None
+    # In lazy mode, the results are only read from the cache, so the datasets are not hashed when there is none
+    if RESULT_CACHE_FILE is not None and (not lazy or os.path.exists(RESULT_CACHE_FILE)):
+        with instrumentation.phase('load_results'):
+            key = fingerprint([MOVIES_FILE, RATINGS_FILE], {
+                'engine': COMPAT_ENGINE, 'min_compat_score': MIN_COMPAT_SCORE, 'min_rating_score': MIN_RATING_SCORE,
+                'recommendation_length': RECOMMENDATION_LENGTH, 'max_neighbours': MAX_NEIGHBOURS,
+                'min_shared_movies': MIN_SHARED_MOVIES})
+            if load_results(RESULT_CACHE_FILE, key, graph):
+                return
+    if lazy:
+        graph.enable_lazy(MIN_COMPAT_SCORE, MIN_RATING_SCORE, RECOMMENDATION_LENGTH, CACHE_SIZE)
+        return
+
+    with instrumentation.phase('process_compat_users') as progress:
+        if WORKERS > 1 and COMPAT_ENGINE == 'python':
+            process_compat_users_parallel(graph, WORKERS, MAX_NEIGHBOURS, MIN_SHARED_MOVIES, progress)
+        else:
+            graph.process_compat_users(COMPAT_ENGINE, progress=progress,
+                                       out_of_core_params=(MEMORY_BUDGET, MIN_COMPAT_SCORE))
+    with instrumentation.phase('process_movie_recommends') as progress:
+        if WORKERS > 1:
+            process_recommends_parallel(graph, (MIN_COMPAT_SCORE, MIN_RATING_SCORE, RECOMMENDATION_LENGTH), WORKERS,
+                                        progress)
+        else:
+            graph.process_movie_recommends(MIN_COMPAT_SCORE, MIN_RATING_SCORE, RECOMMENDATION_LENGTH, progress)
+    if key is not None:
+        with instrumentation.phase('save_results'):
+            save_results(RESULT_CACHE_FILE, key, graph)
+
+
+if __name__ == '__main__':
+    load(Graph(), Instrumentation([JsonLogSink(sys.stdout)], trace_memory=True), lazy=False)
@@ -3,15 +3,19 @@
 This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
 """
 import csv
-import doctest
-import python_ta
+from typing import Optional
 
 from graph import Graph
-from movie_user_classes import Movie
+from instrumentation import ProgressFn
+from movie_user_classes import Movie, genre_bits
 
+# Number of rows read between two calls to a progress callback
+PROGRESS_ROWS = 10000
 
-def import_movies(movie_file: str, graph: Graph) -> None:
-    """Reads the movie_file and populates graph._movies
+
+def import_movies(movie_file: str, graph: Graph, progress: Optional[ProgressFn] = None) -> None:
+    """Reads the movie_file and populates graph._movies. If progress is not None, it is called with the number of
+    movies read so far. The genres column is stored in each movie as a bitset (see movie_user_classes.genre_bits).
 
     Preconditions:
     - movie_file refers to a csv file with the format as described in the handout for "movies.csv"
@@ -19,15 +23,22 @@ def import_movies(movie_file: str, graph: Graph) -> None:
     with open(movie_file, 'r', encoding='utf8') as file:
         reader = csv.reader(file)
         next(reader)
+        rows_read = 0
         for row in reader:
             movie_id = int(row[0])
             title = row[1]
-            movie = Movie(movie_id, title)
+            movie = Movie(movie_id, title, genre_bits(row[2].split('|')))
             graph.add_movie(movie)
+            rows_read += 1
+            if progress is not None and rows_read % PROGRESS_ROWS == 0:
+                progress(rows_read, None)
+    if progress is not None:
+        progress(rows_read, rows_read)
 
 
-def import_ratings(rating_file: str, graph: Graph) -> None:
-    """Reads the ratings_file and creates new users, populates graph._users and modifies Movie.ratings and User.ratings
+def import_ratings(rating_file: str, graph: Graph, progress: Optional[ProgressFn] = None) -> None:
+    """Reads the ratings_file and creates new users, populates graph._users and modifies Movie.ratings and User.ratings.
+    If progress is not None, it is called with the number of ratings read so far.
 
     Preconditions:
      - rating_file refers to a csv file with the format as described in the handout for "ratings.csv"
@@ -35,18 +46,28 @@ def import_ratings(rating_file: str, graph: Graph) -> None:
     with open(rating_file, 'r') as file:
         reader = csv.reader(file)
         next(reader)
+        rows_read = 0
         for row in reader:
             curr_userid = int(row[0])
             movie_id = int(row[1])
             rating = float(row[2])
             curr_user = graph.find_or_add_user(curr_userid)  # Does our dict allocation for us
             graph.add_rating(curr_user, movie_id, rating)
+            rows_read += 1
+            if progress is not None and rows_read % PROGRESS_ROWS == 0:
+                progress(rows_read, None)
+    if progress is not None:
+        progress(rows_read, rows_read)
 
 
 if __name__ == '__main__':
+    import doctest
+    import python_ta
+
     doctest.testmod()
     python_ta.check_all(config={
-        'extra-imports': ['tkinter', 'movie_user_classes', 'graph', 'doctest', 'random', 'csv'],
+        'extra-imports': ['tkinter', 'movie_user_classes', 'graph', 'instrumentation', 'doctest', 'random', 'csv',
+                          'typing'],
         'allowed-io': ['import_movies', 'import_ratings'],
         'max-line-length': 120
     })
@@ -0,0 +1,129 @@
+"""This Python module contains the on-disk cache of the compatibility scores and recommendations computed for the users
+of a graph, so that they are only recomputed when the datasets or the parameters they were computed with change.
+
+The cache is a single .npz file holding the results as flat arrays (like the snapshot in snapshot.py), with the
+fingerprint of the inputs they were computed from: a SHA-256 hash of the contents of the dataset files and of the
+parameters. The file is written to a temporary path and then moved over the previous one, so a reader never sees a
+partially written cache.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import hashlib
+import json
+import os
+import zipfile
+
+import numpy as np
+
+from graph import Graph
+
+CACHE_VERSION = 2
+_CHUNK_SIZE = 1 << 20
+_ARRAY_NAMES = ('user_ids', 'compat_ptr', 'compat_ids', 'compat_scores', 'rec_ptr', 'rec_ids', 'recommend_params')
+
+
+def fingerprint(files: list[str], params: dict) -> str:
+    """Return a hex SHA-256 hash of the contents of files and of params, a JSON-compatible dict
+
+    >>> fingerprint([], {'a': 1}) == fingerprint([], {'a': 1}) != fingerprint([], {'a': 2})
+    True
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps({'version': CACHE_VERSION, 'params': params}, sort_keys=True).encode('utf8'))
+    for path in files:
+        with open(path, 'rb') as file:
+            while chunk := file.read(_CHUNK_SIZE):
+                digest.update(chunk)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def load_results(cache_file: str, key: str, graph: Graph) -> bool:
+    """Set the user_compats and recommendations of the users of graph to the ones stored in cache_file, and the
+    parameters the recommendations were computed with, and return True, if cache_file was written with the same key.
+    Otherwise, return False and leave graph unchanged.
+
+    >>> import tempfile
+    >>> from movie_user_classes import Movie, genre_bits
+    >>> graphs = [Graph(), Graph()]
+    >>> for graph in graphs:
+    ...     graph.add_movie(Movie(1, 'Toy Story (1995)', genre_bits(['Comedy'])))
+    ...     graph.add_movie(Movie(2, 'Heat (1995)', genre_bits(['Action'])))
+    ...     graph.add_movie(Movie(3, 'GoldenEye (1995)', genre_bits(['Action'])))
+    ...     graph.add_ratings([(1, 1, 5.0), (2, 1, 4.5), (2, 2, 4.0)])
+    >>> graphs[0].process_compat_users()
+    >>> graphs[0].process_movie_recommends(4.0, 4.0, 10)
+    >>> cache_file = os.path.join(tempfile.mkdtemp(), 'results.npz')
+    >>> save_results(cache_file, 'key', graphs[0])
+    >>> graph = graphs[1]
+    >>> load_results(cache_file, 'key', graph)
+    True
+    >>> graph.get_recommend_params()
+    (4.0, 4.0, 10)
+    >>> graph.add_rating(graph.get_user(2), 3, 5.0)
+    >>> sorted(graph.get_stale_users())
+    [1, 2]
+    >>> graph.get_genre_recommendations(graph.get_user(1), 'Action')
+    [3, 2]
+    """
+    try:
+        with np.load(cache_file) as arrays:
+            if str(arrays['key']) != key:
+                return False
+            stored = {name: arrays[name].tolist() for name in _ARRAY_NAMES}
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return False
+    if not all(graph.user_exists(uid) for uid in stored['user_ids']):
+        return False
+
+    compat_ptr, rec_ptr = stored['compat_ptr'], stored['rec_ptr']
+    for i, user_id in enumerate(stored['user_ids']):
+        user = graph.get_user(user_id)
+        user.user_compats = dict(zip(stored['compat_ids'][compat_ptr[i]:compat_ptr[i + 1]],
+                                     stored['compat_scores'][compat_ptr[i]:compat_ptr[i + 1]]))
+        user.recommendations = stored['rec_ids'][rec_ptr[i]:rec_ptr[i + 1]]
+    min_score, min_rating, recommends_length = stored['recommend_params']
+    graph.set_recommend_params(min_score, min_rating, int(recommends_length))
+    return True
+
+
+def save_results(cache_file: str, key: str, graph: Graph) -> None:
+    """Write the user_compats and recommendations of every user of graph to cache_file, with key and the parameters
+    the recommendations were computed with
+
+    Preconditions:
+    - graph.get_recommend_params() is not None
+    """
+    users = graph.get_all_users()
+    compat_ptr = np.cumsum([0] + [len(user.user_compats) for user in users], dtype=np.int64)
+    rec_ptr = np.cumsum([0] + [len(user.recommendations) for user in users], dtype=np.int64)
+    arrays = {
+        'key': np.array(key),
+        'user_ids': np.array([user.user_id for user in users], dtype=np.int32),
+        'compat_ptr': compat_ptr,
+        'compat_ids': np.array([uid for user in users for uid in user.user_compats], dtype=np.int32),
+        'compat_scores': np.array([score for user in users for score in user.user_compats.values()], dtype=np.float64),
+        'rec_ptr': rec_ptr,
+        'rec_ids': np.array([movie_id for user in users for movie_id in user.recommendations], dtype=np.int32),
+        'recommend_params': np.array(graph.get_recommend_params(), dtype=np.float64),
+    }
+    directory = os.path.dirname(cache_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    partial_file = cache_file + '.partial'
+    with open(partial_file, 'wb') as file:
+        np.savez(file, **arrays)
+    os.replace(partial_file, cache_file)
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod()
+    python_ta.check_all(config={
+        'extra-imports': ['graph', 'movie_user_classes', 'doctest', 'tempfile', 'hashlib', 'json', 'os', 'zipfile',
+                          'numpy'],
+        'allowed-io': ['fingerprint', 'save_results'],
+        'max-line-length': 120
+    })
@@ -0,0 +1,248 @@
+"""This Python module contains a headless HTTP server that serves the recommendations and compatible users of the
+graph to other local services, as JSON:
+
+- GET /users/{id}/recommendations: the recommended movies of a user, best first
+- GET /users/{id}/compats: the compatible users of a user, most compatible first
+- POST /users/recommendations: the recommendations of many users at once, given a body {"user_ids": [...]}
+
+The graph is loaded once with the settings in pipeline.py. The server runs on asyncio, and every request that reads
+the graph is handed to a single worker thread, so the event loop never blocks on a computation and the graph (which
+recomputes the results of users whose ratings changed when they are read) is only used by one thread at a time.
+
+To serve from several processes, the loaded graph is published to shared memory (see shared_graph.py), and every
+worker process attaches to it and listens on the same port, the kernel spreading the connections between them. The
+workers share the pages of the graph, so each one adds little memory, and they start without loading anything.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import asyncio
+import json
+import multiprocessing
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional, Union
+
+from graph import Graph
+from instrumentation import Instrumentation, JsonLogSink
+from pipeline import load
+from shared_graph import SharedGraph, publish
+
+HOST = '127.0.0.1'
+PORT = 8080
+MAX_BODY_SIZE = 1 << 20
+MAX_BATCH_SIZE = 1000
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large'}
+
+
+class RecommendationServer:
+    """ A class that answers HTTP requests for the recommendations and compatible users of the users of a graph
+
+    Instance Attributes:
+    - graph:
+        The graph the requests are answered from, or a shared graph attached to by a worker process
+    - executor:
+        The single worker thread that reads graph
+    """
+    graph: Union[Graph, SharedGraph]
+    executor: ThreadPoolExecutor
+
+    def __init__(self, graph: Union[Graph, SharedGraph]) -> None:
+        self.graph = graph
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer the requests sent on one connection, keeping it open between requests until the client closes it
+        or asks for it to be closed
+        """
+        try:
+            await self._answer_all(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _answer_all(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer the requests read from reader until the client closes the connection or asks for it to be closed
+        """
+        while True:
+            request = await read_message(reader)
+            if request is None:
+                return
+            start_line, headers, body = request
+            status, payload = await self._answer(start_line, body)
+            # The rest of a body that is too large is not read, so the connection cannot be reused
+            keep_alive = headers.get('connection', '').lower() != 'close' and status != 413
+            writer.write(format_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                return
+
+    async def _answer(self, start_line: str, body: bytes) -> tuple[int, Any]:
+        """Return the (status code, JSON payload) of the response to a request with the given start line and body
+        """
+        parts = start_line.split()
+        if len(parts) != 3:
+            return 400, {'error': 'malformed request line'}
+        if len(body) > MAX_BODY_SIZE:
+            return 413, {'error': 'body too large'}
+        return await self.handle_request(parts[0], parts[1], body)
+
+    async def handle_request(self, method: str, path: str, body: bytes) -> tuple[int, Any]:
+        """Return the (status code, JSON payload) of the response to a request for path with the given method and
+        body
+        """
+        parts = path.split('?', 1)[0].strip('/').split('/')
+        loop = asyncio.get_running_loop()
+        if parts == ['users', 'recommendations']:
+            if method != 'POST':
+                return 405, {'error': 'use POST'}
+            try:
+                user_ids = json.loads(body)['user_ids']
+            except (ValueError, KeyError, TypeError):
+                return 400, {'error': 'expected a body {"user_ids": [...]}'}
+            if not isinstance(user_ids, list) or not all(isinstance(uid, int) for uid in user_ids):
+                return 400, {'error': 'user_ids must be a list of integers'}
+            if len(user_ids) > MAX_BATCH_SIZE:
+                return 400, {'error': f"at most {MAX_BATCH_SIZE} user ids per request"}
+            return 200, await loop.run_in_executor(self.executor, self.batch_recommendations, user_ids)
+
+        if len(parts) == 3 and parts[0] == 'users' and parts[1].isdigit() \
+                and parts[2] in ('recommendations', 'compats'):
+            if method != 'GET':
+                return 405, {'error': 'use GET'}
+            user_id = int(parts[1])
+            handler = self.recommendations if parts[2] == 'recommendations' else self.compats
+            payload = await loop.run_in_executor(self.executor, handler, user_id)
+            return (404, {'error': f"no user {user_id}"}) if payload is None else (200, payload)
+        return 404, {'error': f"no route {path}"}
+
+    def recommendations(self, user_id: int) -> Optional[dict]:
+        """Return the recommendations of the user with id user_id as a JSON payload, or None if there is no such user
+        """
+        if not self.graph.user_exists(user_id):
+            return None
+        return {'user_id': user_id, 'recommendations': self._movies(user_id)}
+
+    def compats(self, user_id: int) -> Optional[dict]:
+        """Return the compatible users of the user with id user_id as a JSON payload, or None if there is no such user
+        """
+        if not self.graph.user_exists(user_id):
+            return None
+        user_compats = self.graph.get_user_compats(self.graph.get_user(user_id))
+        ranked = sorted(user_compats.items(), key=lambda item: item[1], reverse=True)
+        return {'user_id': user_id, 'compats': [{'user_id': uid, 'score': score} for uid, score in ranked]}
+
+    def batch_recommendations(self, user_ids: list[int]) -> dict:
+        """Return the recommendations of every user in user_ids as a JSON payload, listing the ids of the users that
+        do not exist separately
+        """
+        results, missing = {}, []
+        for user_id in user_ids:
+            if self.graph.user_exists(user_id):
+                results[str(user_id)] = self._movies(user_id)
+            else:
+                missing.append(user_id)
+        return {'results': results, 'missing': missing}
+
+    def _movies(self, user_id: int) -> list[dict]:
+        """Return the recommended movies of the user with id user_id, with their titles
+        """
+        recommendations = self.graph.get_recommendations(self.graph.get_user(user_id))
+        return [{'movie_id': movie_id, 'title': self.graph.get_movie(movie_id).title} for movie_id in recommendations]
+
+
+async def read_message(reader: asyncio.StreamReader) -> Optional[tuple[str, dict[str, str], bytes]]:
+    """Read one HTTP message from reader, and return its (start line, headers, body), with the header names in lower
+    case. Return None if the connection was closed before a message started.
+    """
+    start_line = await reader.readline()
+    if not start_line:
+        return None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    body = await reader.readexactly(min(length, MAX_BODY_SIZE + 1)) if length > 0 else b''
+    return start_line.decode('latin-1').strip(), headers, body
+
+
+def format_response(status: int, payload: Any, keep_alive: bool = True) -> bytes:
+    """Return the bytes of an HTTP response with the given status code and JSON payload
+
+    >>> format_response(404, {'error': 'no user 0'}, keep_alive=False).split(b'\\r\\n')
+    [b'HTTP/1.1 404 Not Found', b'Content-Type: application/json', b'Content-Length: 22', b'Connection: close', \
+b'', b'{"error": "no user 0"}']
+    """
+    body = json.dumps(payload).encode('utf8')
+    head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: application/json\r\n" \
+           f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    return head.encode('latin-1') + body
+
+
+async def serve(graph: Union[Graph, SharedGraph], host: str = HOST, port: int = PORT,
+                reuse_port: bool = False) -> None:
+    """Serve the recommendations of graph on host and port until the task running this is cancelled. If reuse_port,
+    other processes may listen on the same port, and the connections are spread between them.
+    """
+    recommendation_server = RecommendationServer(graph)
+    server = await asyncio.start_server(recommendation_server.handle_connection, host, port, reuse_port=reuse_port)
+    async with server:
+        await server.serve_forever()
+
+
+def run(host: str = HOST, port: int = PORT, workers: int = 1) -> None:
+    """Load the graph with the settings in pipeline.py, logging each phase to standard error, then serve it on host
+    and port. The results of every user are computed up front rather than lazily, since the server runs for long
+    enough to be asked for most of them.
+
+    If workers > 1, the graph is published to shared memory and served by that many worker processes instead, until
+    they stop or this process is terminated. The shared memory is then unlinked.
+
+    Preconditions:
+    - workers > 0
+    """
+    graph = Graph()
+    load(graph, Instrumentation([JsonLogSink(sys.stderr)]), lazy=False)
+    if workers == 1:
+        asyncio.run(serve(graph, host, port))
+        return
+
+    block = publish(graph)
+    del graph
+    # Terminating the loader must still stop the workers and unlink the block, so SIGTERM exits through the finally
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    # Spawned workers start from a fresh interpreter rather than a copy of the loader, so they only hold the block
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=run_worker, args=(block.name, host, port)) for _ in range(workers)]
+    try:
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        block.close()
+        block.unlink()
+
+
+def run_worker(name: str, host: str, port: int) -> None:
+    """Attach to the graph published to the shared memory block with the given name, and serve it on host and port
+    alongside the other workers
+    """
+    graph = SharedGraph(name)
+    try:
+        asyncio.run(serve(graph, host, port, reuse_port=True))
+    finally:
+        graph.close()
+
+
+if __name__ == '__main__':
+    run(workers=int(sys.argv[1]) if len(sys.argv) > 1 else 1)
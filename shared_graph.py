@@ -0,0 +1,350 @@
+"""This Python module contains the shared-memory graph used to serve one loaded graph from many worker processes.
+
+A loader process loads the graph and computes its results once, then publishes it with publish: the ratings of every
+user and of every movie, the ids, titles and genres of the movies, and the compatible users and recommendations of
+every user are copied as flat arrays (like the snapshot in snapshot.py) into one multiprocessing.shared_memory block.
+The block starts with the length of a JSON manifest, followed by the manifest, which gives the type, offset and length
+of every array, and by the arrays themselves.
+
+A worker process attaches to the block by name with SharedGraph, a read-only view of the graph with the methods of
+Graph that read it. Users and movies are looked up by binary search in the sorted id arrays, and their ratings are
+read-only memoryviews of the block (see SortedRatings.view), so attaching copies nothing: every worker maps the same
+pages, and starts serving as soon as the manifest is read.
+
+The block outlives the processes attached to it until it is unlinked, so the loader unlinks it once its workers have
+stopped. Workers must be started by the loader with multiprocessing, so they share its resource tracker, which would
+otherwise unlink the block when the first worker exits.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import json
+from bisect import bisect_left
+from multiprocessing import shared_memory
+from typing import Optional
+
+import numpy as np
+
+from graph import Graph, compute_recommendations
+from movie_user_classes import Movie, SortedRatings, User, genre_bits
+from title_index import DEFAULT_LIMIT, TitleIndex
+
+SHARED_VERSION = 1
+_HEADER_SIZE = 8  # Bytes holding the length of the manifest
+_ALIGNMENT = 8  # Every array starts at a multiple of this many bytes
+
+
+class SharedGraph:
+    """ A class that is a read-only view of a graph published to shared memory by publish
+
+    Instance Attributes:
+    - name:
+        The name of the shared memory block this view is attached to
+
+    Representation Invariants:
+    - self._recommend_params is None or self._recommend_params[2] > 0
+    - all({len(self._arrays[a]) == len(self._arrays['user_ids']) + 1 for a in ('user_ptr', 'compat_ptr', 'rec_ptr')})
+
+    >>> graph = Graph()
+    >>> graph.add_movie(Movie(1, 'Toy Story (1995)', genre_bits(['Comedy'])))
+    >>> graph.add_movie(Movie(2, 'Heat (1995)', genre_bits(['Action'])))
+    >>> graph.add_ratings([(1, 1, 5.0), (2, 1, 4.5), (2, 2, 4.0)])
+    >>> graph.process_compat_users()
+    >>> graph.process_movie_recommends(4.0, 4.0, 10)
+    >>> block = publish(graph)
+    >>> view = SharedGraph(block.name)
+    >>> (view.get_user(2).movie_ratings[1], view.get_movie(2).title, view.get_user_compats(view.get_user(1)))
+    (4.5, 'Heat (1995)', {2: 4.5})
+    >>> (view.get_recommendations(view.get_user(1)), view.get_genre_movies('Action'), view.search_titles('toi'))
+    ([2], {2}, [1])
+    >>> view.close()
+    >>> block.close()
+    >>> block.unlink()
+    """
+    name: str
+    _block: shared_memory.SharedMemory
+    _buffer: memoryview
+    _arrays: dict[str, memoryview]
+    _recommend_params: Optional[tuple[float, float, int]]
+    _titles: Optional[TitleIndex]
+
+    def __init__(self, name: str) -> None:
+        """Attach to the shared memory block with the given name, published by publish
+
+        Preconditions:
+        - a block with the given name was returned by publish and is not unlinked yet
+        """
+        self.name = name
+        self._block = shared_memory.SharedMemory(name)
+        self._buffer = self._block.buf.toreadonly()
+        manifest_size = int.from_bytes(self._buffer[:_HEADER_SIZE], 'little')
+        manifest = json.loads(bytes(self._buffer[_HEADER_SIZE:_HEADER_SIZE + manifest_size]))
+        if manifest['version'] != SHARED_VERSION:
+            raise ValueError(f"shared graph version {manifest['version']} is not {SHARED_VERSION}")
+        start = _align(_HEADER_SIZE + manifest_size)
+        self._arrays = {}
+        for array_name, (typecode, offset, length) in manifest['arrays'].items():
+            offset += start
+            self._arrays[array_name] = self._buffer[offset:offset + length * np.dtype(typecode).itemsize].cast(typecode)
+        params = manifest['recommend_params']
+        self._recommend_params = None if params is None else (params[0], params[1], params[2])
+        self._titles = None
+
+    def close(self) -> None:
+        """Detach from the shared memory block. The users and movies returned by this view must have been released
+        first, since their ratings are read from the block.
+        """
+        for array in self._arrays.values():
+            array.release()
+        self._arrays.clear()
+        self._buffer.release()
+        self._block.close()
+
+    def get_all_users(self) -> list[User]:
+        """ Returns a list of all the users in this graph, by ascending id
+        """
+        return [self.get_user(user_id) for user_id in self._arrays['user_ids']]
+
+    def get_all_movies(self) -> list[Movie]:
+        """ Returns a list of all the movies in this graph, by ascending id
+        """
+        return [self.get_movie(movie_id) for movie_id in self._arrays['movie_ids']]
+
+    def get_user(self, user_id: int) -> User:
+        """ Returns the user in this graph with id == user_id, whose movie_ratings are read from the shared block.
+        Its user_compats and recommendations are copies, so changing them does not change this graph.
+
+        Preconditions:
+        - self.user_exists(user_id)
+        """
+        i = bisect_left(self._arrays['user_ids'], user_id)
+        user = User(user_id)
+        user.movie_ratings = self._slice_ratings('user', i)
+        compat_start, compat_stop = self._arrays['compat_ptr'][i], self._arrays['compat_ptr'][i + 1]
+        user.user_compats = dict(zip(self._arrays['compat_ids'][compat_start:compat_stop].tolist(),
+                                     self._arrays['compat_scores'][compat_start:compat_stop].tolist()))
+        rec_start, rec_stop = self._arrays['rec_ptr'][i], self._arrays['rec_ptr'][i + 1]
+        user.recommendations = self._arrays['rec_ids'][rec_start:rec_stop].tolist()
+        return user
+
+    def get_movie(self, movie_id: int) -> Movie:
+        """ Returns the movie in this graph with id == movie_id, whose user_ratings are read from the shared block
+
+        Preconditions:
+        - self.movie_exists(movie_id)
+        """
+        i = bisect_left(self._arrays['movie_ids'], movie_id)
+        title_start, title_stop = self._arrays['title_ptr'][i], self._arrays['title_ptr'][i + 1]
+        movie = Movie(movie_id, bytes(self._arrays['titles'][title_start:title_stop]).decode('utf8'),
+                      self._arrays['movie_genres'][i])
+        movie.user_ratings = self._slice_ratings('movie', i)
+        return movie
+
+    def user_exists(self, user_id: int) -> bool:
+        """ Returns whether the user with id == user_id is in this graph
+        """
+        return _contains(self._arrays['user_ids'], user_id)
+
+    def movie_exists(self, movie_id: int) -> bool:
+        """ Returns whether the movie with id == movie_id is in this graph
+        """
+        return _contains(self._arrays['movie_ids'], movie_id)
+
+    def get_genre_movies(self, genre: str) -> set[int]:
+        """ Returns the ids of the movies in this graph that are in genre
+
+        Preconditions:
+        - genre in GENRES
+        """
+        bit = genre_bits([genre])
+        movie_ids = np.frombuffer(self._arrays['movie_ids'], dtype=np.int32)
+        genres = np.frombuffer(self._arrays['movie_genres'], dtype=np.int32)
+        return set(movie_ids[(genres & bit) != 0].tolist())
+
+    def search_titles(self, query: str, limit: int = DEFAULT_LIMIT) -> list[int]:
+        """ Returns the ids of at most limit movies in this graph whose titles best match query, as Graph.search_titles
+        does. The title index is built by the first search, and kept by this process only.
+
+        Preconditions:
+        - limit > 0
+        """
+        if self._titles is None:
+            self._titles = TitleIndex()
+            for movie in self.get_all_movies():
+                self._titles.add(movie.movie_id, movie.title)
+        return self._titles.search(query, limit)
+
+    def get_user_compats(self, user: User) -> dict[int, float]:
+        """Returns the user_compats of user, as published
+        """
+        return user.user_compats
+
+    def get_recommendations(self, user: User) -> list[int]:
+        """Returns the recommendations of user, as published
+        """
+        return user.recommendations
+
+    def get_genre_recommendations(self, user: User, genre: str) -> list[int]:
+        """Returns the recommendations of user among the movies in genre only, computed like
+        Graph.get_genre_recommendations with the parameters the published recommendations were computed with
+
+        Preconditions:
+        - self.user_exists(user.user_id)
+        - self.get_recommend_params() is not None
+        - genre in GENRES
+        """
+        return compute_recommendations(user.user_compats, lambda uid: self.get_user(uid).movie_ratings,
+                                       user.get_movies(), self._recommend_params, self.get_genre_movies(genre))
+
+    def get_movie_users(self, movies: set[int]) -> set[int]:
+        """Returns a set of ids for users in graph who have a rating for at least one movie whose id is in movies
+
+        Preconditions:
+        - all({self.movie_exists(i) for i in movies})
+        """
+        user_ids_so_far = []
+        for movie_id in movies:
+            user_ids_so_far.extend(self.get_movie(movie_id).get_users())
+        return set(user_ids_so_far)
+
+    def get_recommend_params(self) -> Optional[tuple[float, float, int]]:
+        """Returns the (min_score, min_rating, recommends_length) the published recommendations were computed with, or
+        None if they were not computed
+        """
+        return self._recommend_params
+
+    def get_stale_users(self) -> set[int]:
+        """Returns an empty set: the published results were all up to date, and this graph never changes
+        """
+        return set()
+
+    def get_cache_stats(self) -> dict[str, int]:
+        """Returns an empty dict, since a shared graph is never in lazy mode
+        """
+        return {}
+
+    def _slice_ratings(self, kind: str, i: int) -> SortedRatings:
+        """Return a read-only view of the ratings of the user (if kind is 'user') or movie (if kind is 'movie') at
+        index i of the sorted ids
+        """
+        start, stop = self._arrays[f"{kind}_ptr"][i], self._arrays[f"{kind}_ptr"][i + 1]
+        other = 'movies' if kind == 'user' else 'users'
+        return SortedRatings.view(self._arrays[f"{kind}_{other}"][start:stop],
+                                  self._arrays[f"{kind}_scores"][start:stop])
+
+
+def publish(graph: Graph) -> shared_memory.SharedMemory:
+    """Copy graph into a new shared memory block, and return the block. Workers attach to it with
+    SharedGraph(block.name). The caller owns the block: it must close and unlink it once every worker has stopped.
+
+    The user_compats and recommendations of every user are read through graph.get_user_compats and
+    graph.get_recommendations, so a graph in lazy mode computes all of them first.
+    """
+    users = sorted(graph.get_all_users(), key=lambda u: u.user_id)
+    movies = sorted(graph.get_all_movies(), key=lambda m: m.movie_id)
+    arrays = {**_rating_arrays(users, movies), **_result_arrays(graph, users)}
+
+    # The offsets in the manifest are from the first aligned byte after it, so they do not depend on its length
+    layout, size = {}, 0
+    for name, values in arrays.items():
+        layout[name] = (values.dtype.char, size, len(values))
+        size += _align(values.nbytes)
+    manifest = json.dumps({'version': SHARED_VERSION, 'arrays': layout,
+                           'recommend_params': graph.get_recommend_params()}).encode('utf8')
+    start = _align(_HEADER_SIZE + len(manifest))
+
+    block = shared_memory.SharedMemory(create=True, size=start + max(size, 1))
+    block.buf[:_HEADER_SIZE] = len(manifest).to_bytes(_HEADER_SIZE, 'little')
+    block.buf[_HEADER_SIZE:_HEADER_SIZE + len(manifest)] = manifest
+    for name, values in arrays.items():
+        offset = start + layout[name][1]
+        block.buf[offset:offset + values.nbytes] = values.tobytes()
+    return block
+
+
+def _rating_arrays(users: list[User], movies: list[Movie]) -> dict[str, np.ndarray]:
+    """Return the arrays of the shared memory layout that hold the ids, ratings, genres and titles of users and
+    movies, both sorted by id
+    """
+    titles = [movie.title.encode('utf8') for movie in movies]
+    return {
+        'user_ids': np.array([user.user_id for user in users], dtype=np.int32),
+        'user_ptr': _pointers([len(user.movie_ratings) for user in users]),
+        'user_movies': _concatenate([user.movie_ratings.ids for user in users], np.int32),
+        'user_scores': _concatenate([user.movie_ratings.scores for user in users], np.float32),
+        'movie_ids': np.array([movie.movie_id for movie in movies], dtype=np.int32),
+        'movie_ptr': _pointers([len(movie.user_ratings) for movie in movies]),
+        'movie_users': _concatenate([movie.user_ratings.ids for movie in movies], np.int32),
+        'movie_scores': _concatenate([movie.user_ratings.scores for movie in movies], np.float32),
+        'movie_genres': np.array([movie.genres for movie in movies], dtype=np.int32),
+        'title_ptr': _pointers([len(title) for title in titles]),
+        'titles': np.frombuffer(b''.join(titles), dtype=np.uint8),
+    }
+
+
+def _result_arrays(graph: Graph, users: list[User]) -> dict[str, np.ndarray]:
+    """Return the arrays of the shared memory layout that hold the user_compats and recommendations of users, read
+    through graph.get_user_compats and graph.get_recommendations
+    """
+    compat_ids, compat_scores, rec_ids, compat_lengths, rec_lengths = [], [], [], [], []
+    for user in users:
+        user_compats = graph.get_user_compats(user)
+        compat_ids.extend(user_compats)
+        compat_scores.extend(user_compats.values())
+        compat_lengths.append(len(user_compats))
+        recommendations = graph.get_recommendations(user)
+        rec_ids.extend(recommendations)
+        rec_lengths.append(len(recommendations))
+    return {
+        'compat_ptr': _pointers(compat_lengths),
+        'compat_ids': np.array(compat_ids, dtype=np.int32),
+        'compat_scores': np.array(compat_scores, dtype=np.float64),
+        'rec_ptr': _pointers(rec_lengths),
+        'rec_ids': np.array(rec_ids, dtype=np.int32),
+    }
+
+
+def _align(size: int) -> int:
+    """Return the smallest multiple of _ALIGNMENT that is at least size
+
+    >>> (_align(0), _align(1), _align(8), _align(9))
+    (0, 8, 8, 16)
+    """
+    return -(-size // _ALIGNMENT) * _ALIGNMENT
+
+
+def _pointers(lengths: list[int]) -> np.ndarray:
+    """Return the offsets at which consecutive runs of the given lengths start in a flat array, followed by its length
+
+    >>> _pointers([2, 0, 3]).tolist()
+    [0, 2, 2, 5]
+    """
+    return np.cumsum([0] + lengths, dtype=np.int64)
+
+
+def _concatenate(parts: list, dtype: type) -> np.ndarray:
+    """Return the buffers in parts, arrays of the given numpy dtype, as one numpy array
+    """
+    return np.concatenate([np.zeros(0, dtype=dtype)] + [np.frombuffer(part, dtype=dtype) for part in parts])
+
+
+def _contains(ids: memoryview, value: int) -> bool:
+    """Return whether value is in ids, a memoryview of ids in ascending order
+
+    >>> _contains(memoryview(np.array([1, 3, 5], dtype=np.int32)), 3)
+    True
+    """
+    i = bisect_left(ids, value)
+    return i < len(ids) and ids[i] == value
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod()
+    python_ta.check_all(config={
+        'extra-imports': ['graph', 'movie_user_classes', 'title_index', 'doctest', 'json', 'bisect',
+                          'multiprocessing', 'typing', 'numpy'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
@@ -0,0 +1,209 @@
+"""This Python module contains the functions used to convert the datasets into a binary snapshot, and to populate
+a graph from that snapshot.
+
+A snapshot is a directory holding the columns of the ratings file as .npy arrays (int32 user and movie ids, float32
+ratings and int64 timestamps), the movie ids, titles and genres of the movies file (the titles as a single UTF-8
+string table with an array of offsets, the genres as int32 bitsets), and a meta.json file describing the files the
+snapshot was made from. The arrays are memory-mapped when the snapshot is loaded, so nothing is parsed on startup.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import csv
+import json
+import os
+from array import array
+from typing import Optional
+
+import numpy as np
+
+from graph import Graph
+from instrumentation import Instrumentation, ProgressFn
+from movie_user_classes import Movie, genre_bits
+from read_data import PROGRESS_ROWS, import_movies, import_ratings
+
+SNAPSHOT_VERSION = 2
+META_FILE = 'meta.json'
+
+
+def import_dataset(movie_file: str, rating_file: str, graph: Graph, snapshot_dir: str,
+                   instrumentation: Optional[Instrumentation] = None) -> None:
+    """Populates graph with the movies in movie_file and the ratings in rating_file, like import_movies and
+    import_ratings.
+
+    The data is loaded from the snapshot in snapshot_dir if it was made from the current movie_file and rating_file.
+    Otherwise, the snapshot is (re)written first. If it cannot be written, the csv files are read directly instead.
+    Each of these steps is measured as a phase of instrumentation, if it is not None.
+
+    Preconditions:
+    - movie_file and rating_file refer to csv files with the format as described in the handout
+    """
+    instrumentation = instrumentation or Instrumentation()
+    if not snapshot_is_fresh(movie_file, rating_file, snapshot_dir):
+        try:
+            with instrumentation.phase('write_snapshot') as progress:
+                write_snapshot(movie_file, rating_file, snapshot_dir, progress)
+        except OSError:
+            with instrumentation.phase('import_movies') as progress:
+                import_movies(movie_file, graph, progress)
+            with instrumentation.phase('import_ratings') as progress:
+                import_ratings(rating_file, graph, progress)
+            return
+    with instrumentation.phase('load_snapshot') as progress:
+        load_snapshot(snapshot_dir, graph, progress)
+
+
+def snapshot_is_fresh(movie_file: str, rating_file: str, snapshot_dir: str) -> bool:
+    """Returns whether snapshot_dir holds a complete snapshot made from the current movie_file and rating_file
+    """
+    try:
+        with open(os.path.join(snapshot_dir, META_FILE), 'r', encoding='utf8') as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return False
+    return meta.get('version') == SNAPSHOT_VERSION and meta.get('sources') == _source_stamps(movie_file, rating_file)
+
+
+def write_snapshot(movie_file: str, rating_file: str, snapshot_dir: str,
+                   progress: Optional[ProgressFn] = None) -> None:
+    """Reads movie_file and rating_file and writes them as a snapshot in snapshot_dir. meta.json is written last, so
+    an interrupted write leaves a snapshot that is not fresh. If progress is not None, it is called with the number of
+    ratings read so far.
+
+    Preconditions:
+    - movie_file and rating_file refer to csv files with the format as described in the handout
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    meta_path = os.path.join(snapshot_dir, META_FILE)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    columns, title_table = _read_movie_columns(movie_file)
+    columns.update(_read_rating_columns(rating_file, progress))
+    for name, values in columns.items():
+        np.save(os.path.join(snapshot_dir, name + '.npy'), values)
+    with open(os.path.join(snapshot_dir, 'titles.bin'), 'wb') as file:
+        file.write(title_table)
+
+    with open(meta_path, 'w', encoding='utf8') as file:
+        json.dump({'version': SNAPSHOT_VERSION, 'sources': _source_stamps(movie_file, rating_file)}, file)
+    if progress is not None:
+        progress(len(columns['users']), len(columns['users']))
+
+
+def _read_movie_columns(movie_file: str) -> tuple[dict[str, np.ndarray], bytes]:
+    """Return the columns of the snapshot read from movie_file (the movie ids, genres and title offsets), and the
+    titles of the movies as a single UTF-8 string table
+    """
+    movie_ids, movie_genres, titles = array('i'), array('i'), []
+    with open(movie_file, 'r', encoding='utf8') as file:
+        reader = csv.reader(file)
+        next(reader)
+        for row in reader:
+            movie_ids.append(int(row[0]))
+            titles.append(row[1].encode('utf8'))
+            movie_genres.append(genre_bits(row[2].split('|')))
+    title_offsets = np.zeros(len(titles) + 1, dtype=np.int64)
+    np.cumsum([len(title) for title in titles], out=title_offsets[1:])
+    columns = {'movie_ids': np.asarray(movie_ids, dtype=np.int32),
+               'movie_genres': np.asarray(movie_genres, dtype=np.int32), 'title_offsets': title_offsets}
+    return columns, b''.join(titles)
+
+
+def _read_rating_columns(rating_file: str, progress: Optional[ProgressFn]) -> dict[str, np.ndarray]:
+    """Return the columns of the snapshot read from rating_file: the user ids, movie ids, ratings and timestamps. If
+    progress is not None, it is called with the number of ratings read so far.
+    """
+    users, movies, ratings, timestamps = array('i'), array('i'), array('f'), array('q')
+    with open(rating_file, 'r', encoding='utf8') as file:
+        reader = csv.reader(file)
+        next(reader)
+        for row in reader:
+            users.append(int(row[0]))
+            movies.append(int(row[1]))
+            ratings.append(float(row[2]))
+            timestamps.append(int(row[3]))
+            if progress is not None and len(users) % PROGRESS_ROWS == 0:
+                progress(len(users), None)
+    return {'users': np.asarray(users, dtype=np.int32), 'movies': np.asarray(movies, dtype=np.int32),
+            'ratings': np.asarray(ratings, dtype=np.float32), 'timestamps': np.asarray(timestamps, dtype=np.int64)}
+
+
+def load_snapshot(snapshot_dir: str, graph: Graph, progress: Optional[ProgressFn] = None) -> None:
+    """Populates graph with the movies and ratings stored in the snapshot in snapshot_dir. The users are added in
+    the same order as import_ratings would add them. If progress is not None, it is called with the number of ratings
+    stored so far, each rating being stored twice: once by user and once by movie.
+
+    Preconditions:
+    - snapshot_dir holds a complete snapshot
+    """
+    columns = {name: np.load(os.path.join(snapshot_dir, name + '.npy'), mmap_mode='r')
+               for name in ('users', 'movies', 'ratings', 'movie_ids', 'movie_genres', 'title_offsets')}
+    _load_movies(snapshot_dir, columns, graph)
+
+    users, movies, ratings = columns['users'], columns['movies'], columns['ratings']
+    for user_id, movie_ids, scores in _group_by(users, movies, ratings):
+        graph.find_or_add_user(user_id).movie_ratings.assign_sorted(movie_ids, scores)
+    if progress is not None:
+        progress(len(ratings), 2 * len(ratings))
+    for movie_id, user_ids, scores in _group_by(movies, users, ratings):
+        graph.get_movie(movie_id).user_ratings.assign_sorted(user_ids, scores)
+    if progress is not None:
+        progress(2 * len(ratings), 2 * len(ratings))
+
+
+def _load_movies(snapshot_dir: str, columns: dict[str, np.ndarray], graph: Graph) -> None:
+    """Adds the movies stored in the snapshot in snapshot_dir to graph, where columns holds the memory-mapped
+    columns of the snapshot
+    """
+    with open(os.path.join(snapshot_dir, 'titles.bin'), 'rb') as file:
+        title_table = file.read()
+    offsets = columns['title_offsets'].tolist()
+    genres = columns['movie_genres'].tolist()
+    for i, movie_id in enumerate(columns['movie_ids'].tolist()):
+        graph.add_movie(Movie(movie_id, title_table[offsets[i]:offsets[i + 1]].decode('utf8'), genres[i]))
+
+
+def _group_by(keys: np.ndarray, ids: np.ndarray, ratings: np.ndarray) -> list[tuple[int, bytes, bytes]]:
+    """Return a list of (key, ids, ratings) tuples, one for each distinct key in keys, holding the raw int32 entries
+    of ids and float32 entries of ratings at the positions of that key, sorted by id. Keys are listed in order of
+    first appearance.
+
+    >>> groups = _group_by(np.array([2, 1, 2]), np.array([30, 20, 10]), np.array([1.0, 2.0, 3.0]))
+    >>> [(key, np.frombuffer(ids, np.int32).tolist(), np.frombuffer(scores, np.float32).tolist())
+    ...  for key, ids, scores in groups]
+    [(2, [10, 30], [3.0, 1.0]), (1, [20], [2.0])]
+    """
+    order = np.lexsort((ids, keys))
+    unique_keys, first_index, counts = np.unique(keys, return_index=True, return_counts=True)
+    bounds = np.zeros(len(unique_keys) + 1, dtype=np.int64)
+    np.cumsum(counts, out=bounds[1:])
+    sorted_ids = np.asarray(ids)[order].astype(np.int32)
+    sorted_ratings = np.asarray(ratings)[order].astype(np.float32)
+    unique_keys, bounds = unique_keys.tolist(), bounds.tolist()
+    return [(unique_keys[k], sorted_ids[bounds[k]:bounds[k + 1]].tobytes(),
+             sorted_ratings[bounds[k]:bounds[k + 1]].tobytes())
+            for k in np.argsort(first_index, kind='stable').tolist()]
+
+
+def _source_stamps(movie_file: str, rating_file: str) -> dict[str, list[int]]:
+    """Return the size and modification time of movie_file and rating_file, used to tell when a snapshot is stale
+    """
+    stamps = {}
+    for name, path in (('movies', movie_file), ('ratings', rating_file)):
+        stat = os.stat(path)
+        stamps[name] = [stat.st_size, stat.st_mtime_ns]
+    return stamps
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod()
+    python_ta.check_all(config={
+        'extra-imports': ['graph', 'instrumentation', 'movie_user_classes', 'read_data', 'doctest', 'csv', 'json',
+                          'os', 'array', 'numpy', 'typing'],
+        'allowed-io': ['snapshot_is_fresh', 'write_snapshot', '_read_movie_columns', '_read_rating_columns',
+                       '_load_movies'],
+        'max-line-length': 120
+    })
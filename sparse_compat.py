@@ -0,0 +1,351 @@
+"""This Python module contains the vectorized engine used to compute the compatibility scores between users.
+
+Instead of intersecting the rated-movie sets of every pair of users in pure Python, the ratings are packed once into a
+CSR (user x movie) matrix and a CSC copy of it. The absolute rating differences of every co-rated movie are then
+accumulated for a block of users at a time with NumPy.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+from __future__ import annotations
+from typing import Optional
+
+import numpy as np
+
+from instrumentation import ProgressFn
+from movie_user_classes import Movie, SortedRatings, User
+
+DEFAULT_BLOCK_SIZE = 256
+
+
+class RatingMatrix:
+    """ A class that represents the ratings of a list of users as a sparse matrix, stored in both CSR (row = user)
+    and CSC (column = movie) form.
+
+    Instance Attributes:
+    - user_ids:
+        The user id of each row of the matrix
+    - movie_ids:
+        The movie id of each column of the matrix, in ascending order
+    - indptr, indices, data:
+        The CSR form of the matrix. The ratings of the user in row i are data[indptr[i]:indptr[i + 1]], for the
+        movies in columns indices[indptr[i]:indptr[i + 1]]
+    - csc:
+        The CSC form of the matrix, as a tuple (colptr, col_rows, col_data). The ratings of the movie in column j are
+        col_data[colptr[j]:colptr[j + 1]], given by the users in rows col_rows[colptr[j]:colptr[j + 1]], in ascending
+        order of row
+    - _col_keys:
+        None until block_pair_stats is first called on a subset of the columns. Otherwise, the (column, row) key
+        column * len(user_ids) + row of each entry of the CSC form, used to find the rows of a column in that subset
+
+    Representation Invariants:
+    - len(self.indptr) == len(self.user_ids) + 1
+    - len(self.csc[0]) == len(self.movie_ids) + 1
+    - len(self.indices) == len(self.data) == len(self.csc[1]) == len(self.csc[2])
+    """
+    user_ids: np.ndarray
+    movie_ids: np.ndarray
+    indptr: np.ndarray
+    indices: np.ndarray
+    data: np.ndarray
+    csc: tuple[np.ndarray, np.ndarray, np.ndarray]
+    _col_keys: Optional[np.ndarray]
+
+    def __init__(self, users: list[User]) -> None:
+        """Build the matrix from the movie ratings of users. Row i of the matrix holds the ratings of users[i].
+        """
+        self._build([user.user_id for user in users], [user.movie_ratings for user in users])
+
+    @classmethod
+    def from_movies(cls, movies: list[Movie]) -> RatingMatrix:
+        """Return the transposed matrix, built from the user ratings of movies: row i holds the ratings of movies[i],
+        so user_ids holds the ids of the movies and movie_ids the ids of the users who rated them.
+        """
+        matrix = cls.__new__(cls)
+        matrix._build([movie.movie_id for movie in movies], [movie.user_ratings for movie in movies])
+        return matrix
+
+    def _build(self, row_ids: list[int], rows: list[SortedRatings]) -> None:
+        """Build the matrix from rows, where row i holds the ratings in rows[i] and has the id row_ids[i]
+        """
+        self.user_ids = np.array(row_ids, dtype=np.int64)
+        self._col_keys = None
+        row_lengths = np.array([len(ratings) for ratings in rows], dtype=np.int64)
+        self.indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(row_lengths, out=self.indptr[1:])
+
+        raw_movie_ids = np.concatenate([np.frombuffer(ratings.ids, dtype=np.int32) for ratings in rows]
+                                       + [np.zeros(0, dtype=np.int32)]).astype(np.int64)
+        self.data = np.concatenate([np.frombuffer(ratings.scores, dtype=np.float32) for ratings in rows]
+                                   + [np.zeros(0, dtype=np.float32)]).astype(np.float64)
+        self.movie_ids, self.indices = np.unique(raw_movie_ids, return_inverse=True)
+
+        entry_rows = np.repeat(np.arange(len(rows), dtype=np.int64), row_lengths)
+        order = np.argsort(self.indices, kind='stable')
+        colptr = np.zeros(len(self.movie_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=len(self.movie_ids)), out=colptr[1:])
+        self.csc = (colptr, entry_rows[order], self.data[order])
+
+    def num_users(self) -> int:
+        """Return the number of rows (users) in this matrix
+        """
+        return len(self.user_ids)
+
+    def block_pair_stats(self, block: tuple[int, int], col_block: Optional[tuple[int, int]] = None,
+                         max_expanded: Optional[int] = None) -> tuple[np.ndarray, np.ndarray]:
+        """Return a tuple (sums, counts) of (stop - start) x (col_stop - col_start) arrays, where block is
+        (start, stop) and col_block is (col_start, col_stop), or None for all the rows. For each user i in rows start
+        to stop - 1 and each user j in rows col_start to col_stop - 1, sums[i - start, j - col_start] is the sum of the
+        absolute differences between the ratings of users i and j over all the movies they have both rated, and
+        counts[i - start, j - col_start] is the number of such movies.
+
+        Each rating of the users in the block is expanded into one entry per user j who rated the same movie. If
+        max_expanded is not None, the ratings are expanded a chunk at a time, so that at most about max_expanded
+        entries are held at once.
+
+        Preconditions:
+        - 0 <= block[0] < block[1] <= self.num_users()
+        - col_block is None or 0 <= col_block[0] < col_block[1] <= self.num_users()
+        - max_expanded is None or max_expanded > 0
+
+        >>> u1, u2, u3 = User(1), User(2), User(3)
+        >>> u1.movie_ratings = {1: 4.0, 2: 3.0}
+        >>> u2.movie_ratings = {1: 5.0, 2: 1.0}
+        >>> u3.movie_ratings = {1: 2.0}
+        >>> RatingMatrix([u1, u2, u3]).block_pair_stats((0, 1), (1, 3), max_expanded=1)
+        (array([[3., 2.]]), array([[2, 1]]))
+        """
+        start, stop = block
+        col_block = (0, self.num_users()) if col_block is None else col_block
+        width = col_block[1] - col_block[0]
+        entries = self._block_entries(block, col_block)
+
+        size = (stop - start) * width
+        sums, counts = np.zeros(size), np.zeros(size, dtype=np.int64)
+        chunk_start = 0
+        for chunk_end in _chunk_ends(entries[3], max_expanded):
+            keys, diffs = self._expand_entries(entries, slice(chunk_start, chunk_end), col_block)
+            sums += np.bincount(keys, weights=diffs, minlength=size)
+            counts += np.bincount(keys, minlength=size)
+            chunk_start = chunk_end
+        return sums.reshape(stop - start, width), counts.reshape(stop - start, width)
+
+    def _block_entries(self, block: tuple[int, int], col_block: tuple[int, int]) \
+            -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Return a tuple (entry_rows, entry_ratings, col_starts, col_lengths) describing each rating of the users in
+        rows block[0] to block[1] - 1: its row relative to block[0], its value, and the position in the CSC form and
+        number of the ratings of the same movie given by the users in rows col_block[0] to col_block[1] - 1
+        """
+        (entry_rows, entry_cols), entry_ratings = self._block_ratings(*block)
+        colptr, col_rows, _ = self.csc
+        if col_block[1] - col_block[0] == self.num_users():
+            col_starts, col_ends = colptr[entry_cols], colptr[entry_cols + 1]
+        else:
+            # The rows of each column are in ascending order, so the rows col_block[0] to col_block[1] - 1 are a
+            # contiguous run of the column, found by binary search on (column, row) keys
+            if self._col_keys is None:
+                self._col_keys = np.repeat(np.arange(len(self.movie_ids), dtype=np.int64),
+                                           np.diff(colptr)) * self.num_users() + col_rows
+            col_starts = np.searchsorted(self._col_keys, entry_cols * self.num_users() + col_block[0])
+            col_ends = np.searchsorted(self._col_keys, entry_cols * self.num_users() + col_block[1])
+        return entry_rows, entry_ratings, col_starts, col_ends - col_starts
+
+    def _block_ratings(self, start: int, stop: int) -> tuple[tuple[np.ndarray, np.ndarray], np.ndarray]:
+        """Return the (row - start, column) cells of the ratings of the users in rows start to stop - 1, as a tuple of
+        two arrays, and the ratings, in the order of the CSR form
+        """
+        first, last = self.indptr[start], self.indptr[stop]
+        rows = np.repeat(np.arange(stop - start, dtype=np.int64), np.diff(self.indptr[start:stop + 1]))
+        return (rows, self.indices[first:last]), self.data[first:last]
+
+    def _expand_entries(self, entries: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray], chunk: slice,
+                        col_block: tuple[int, int]) -> tuple[np.ndarray, np.ndarray]:
+        """Expand every rating in the chunk of entries, as returned by _block_entries, into one entry per user in
+        rows col_block[0] to col_block[1] - 1 who rated the same movie. Return a tuple (keys, diffs) holding the index
+        of each expanded entry in the flattened (sums, counts) arrays of block_pair_stats, and the absolute difference
+        between the two ratings.
+        """
+        entry_rows, entry_ratings, col_starts, col_lengths = entries
+        _, col_rows, col_data = self.csc
+        expanded, positions = _expand_runs(col_starts[chunk], col_lengths[chunk])
+        expanded += chunk.start
+        return ((entry_rows[expanded] * (col_block[1] - col_block[0]) + col_rows[positions] - col_block[0]),
+                np.abs(entry_ratings[expanded] - col_data[positions]))
+
+    def pair_stats(self, rows1: np.ndarray, rows2: np.ndarray,
+                   block_size: int = DEFAULT_BLOCK_SIZE) -> tuple[np.ndarray, np.ndarray]:
+        """Return a tuple (sums, counts) of arrays of length len(rows1). For each k, sums[k] is the sum of the absolute
+        differences between the ratings of the users in rows rows1[k] and rows2[k] over all the movies they have both
+        rated, and counts[k] is the number of such movies.
+
+        The pairs are processed by blocks of block_size users: the ratings of the users in the block are written into a
+        dense block_size x len(movie_ids) array, and each rating of the other user of every pair with a user in the
+        block is looked up in it.
+
+        Preconditions:
+        - len(rows1) == len(rows2)
+        - all rows in rows1 and rows2 are in range(self.num_users())
+        - block_size > 0
+
+        >>> u1, u2, u3 = User(1), User(2), User(3)
+        >>> u1.movie_ratings = {1: 4.0, 2: 3.0, 5: 1.0}
+        >>> u2.movie_ratings = {1: 5.0, 2: 1.0}
+        >>> u3.movie_ratings = {3: 2.0}
+        >>> RatingMatrix([u1, u2, u3]).pair_stats(np.array([0, 0]), np.array([1, 2]))
+        (array([3., 0.]), array([2, 0]))
+        """
+        # Look up the ratings of the user with fewer ratings in each pair among those of the other one
+        swap = self._row_lengths(rows1) > self._row_lengths(rows2)
+        shorter, longer = np.where(swap, rows2, rows1), np.where(swap, rows1, rows2)
+
+        sums, counts = np.zeros(len(rows1)), np.zeros(len(rows1), dtype=np.int64)
+        dense = np.full((block_size, len(self.movie_ids)), np.nan, dtype=np.float32)
+        for start, pairs in zip(range(0, self.num_users(), block_size), _group_by_block(longer, block_size)):
+            if len(pairs) == 0:
+                continue
+            cells, ratings = self._block_ratings(start, min(start + block_size, self.num_users()))
+            dense[cells] = ratings
+            sums[pairs], counts[pairs] = self._lookup_pair_stats(dense, start, shorter[pairs], longer[pairs])
+            dense[cells] = np.nan
+        return sums, counts
+
+    def _row_lengths(self, rows: np.ndarray) -> np.ndarray:
+        """Return the number of ratings in each row of rows
+        """
+        return self.indptr[rows + 1] - self.indptr[rows]
+
+    def _lookup_pair_stats(self, dense: np.ndarray, start: int, shorter: np.ndarray,
+                           longer: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Return the (sums, counts) of pair_stats for the pairs of rows (shorter[k], longer[k]), where dense holds
+        the ratings of the users in rows start to start + len(dense) - 1 (NaN where they have no rating), which include
+        every row in longer
+        """
+        # Expand every pair into one entry per rating of its shorter row, at positions of the CSR arrays
+        lengths = self._row_lengths(shorter)
+        expanded, positions = _expand_runs(self.indptr[shorter], lengths)
+        cells = np.repeat((longer - start) * len(self.movie_ids), lengths) + self.indices[positions]
+        other_ratings = dense.ravel()[cells]
+        shared = np.flatnonzero(~np.isnan(other_ratings))
+        diffs = np.abs(self.data[positions[shared]] - other_ratings[shared])
+        return (np.bincount(expanded[shared], weights=diffs, minlength=len(shorter)),
+                np.bincount(expanded[shared], minlength=len(shorter)))
+
+
+def _expand_runs(starts: np.ndarray, lengths: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return a tuple (owners, positions) listing the positions starts[k] to starts[k] + lengths[k] - 1 of every run
+    k, in order, with the index k of the run each of them belongs to
+
+    >>> _expand_runs(np.array([10, 20, 30]), np.array([2, 0, 3]))
+    (array([0, 0, 2, 2, 2]), array([10, 11, 30, 31, 32]))
+    """
+    ends = np.cumsum(lengths)
+    owners = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+    positions = np.arange(len(owners), dtype=np.int64) + np.repeat(starts - ends + lengths, lengths)
+    return owners, positions
+
+
+def _chunk_ends(lengths: np.ndarray, max_expanded: Optional[int]) -> list[int]:
+    """Return the end of each chunk of consecutive runs, of the given lengths, so that the runs of a chunk hold at
+    most about max_expanded entries in total. All the runs are in one chunk if max_expanded is None.
+
+    >>> _chunk_ends(np.array([2, 2, 3, 1]), 4)
+    [2, 4]
+    """
+    if max_expanded is None:
+        return [len(lengths)]
+    total_lengths = np.cumsum(lengths)
+    return np.unique(np.append(np.searchsorted(
+        total_lengths, np.arange(max_expanded, total_lengths[-1] if len(total_lengths) else 0, max_expanded),
+        side='right'), len(lengths))).tolist()
+
+
+def _group_by_block(rows: np.ndarray, block_size: int) -> list[np.ndarray]:
+    """Return the indices of the entries of rows that fall in each block of block_size rows, in order of block
+
+    >>> _group_by_block(np.array([3, 0, 2, 3]), 2)
+    [array([1]), array([2, 0, 3])]
+    """
+    order = np.argsort(rows, kind='stable')
+    bounds = np.searchsorted(rows[order], np.arange(block_size, rows.max() + 1 if len(rows) else 0, block_size))
+    return np.split(order, bounds)
+
+
+def process_compat_users_sparse(users: list[User], block_size: int = DEFAULT_BLOCK_SIZE,
+                                max_neighbours: Optional[int] = None, min_shared: int = 1,
+                                progress: Optional[ProgressFn] = None) -> None:
+    """Calculate the compatibility score between every pair of users in users that have rated at least one common
+    movie, and update their user_compats attribute accordingly.
+
+    The score is the same as the one computed by Graph.process_compat_users: 5.0 minus the mean absolute difference
+    between the ratings of the two users over the movies they have both rated. Users are processed block_size rows
+    at a time, so the memory used is proportional to block_size * len(users). max_neighbours and min_shared limit
+    the users kept in user_compats, as in select_neighbours_sparse. If progress is not None, it is called with the
+    number of users processed after each block.
+
+    Preconditions:
+    - block_size > 0
+    - max_neighbours is None or max_neighbours > 0
+    - min_shared > 0
+
+    >>> u1, u2, u3 = User(1), User(2), User(3)
+    >>> u1.movie_ratings = {1: 4.0, 2: 3.0}
+    >>> u2.movie_ratings = {1: 5.0, 2: 1.0}
+    >>> u3.movie_ratings = {3: 2.0}
+    >>> process_compat_users_sparse([u1, u2, u3])
+    >>> u1.user_compats
+    {2: 3.5}
+    >>> u3.user_compats
+    {}
+    """
+    matrix = RatingMatrix(users)
+    for start in range(0, matrix.num_users(), block_size):
+        stop = min(start + block_size, matrix.num_users())
+        sums, counts = matrix.block_pair_stats((start, stop))
+        for i in range(start, stop):
+            counts[i - start, i] = 0
+            users[i].user_compats = select_neighbours_sparse(matrix.user_ids, sums[i - start], counts[i - start],
+                                                             max_neighbours, min_shared)
+        if progress is not None:
+            progress(stop, matrix.num_users())
+
+
+def select_neighbours_sparse(user_ids: np.ndarray, sums: np.ndarray, counts: np.ndarray,
+                             max_neighbours: Optional[int], min_shared: int) -> dict[int, float]:
+    """Return the user_compats of a user, given the sums and counts of the absolute rating differences between them
+    and each user in user_ids (a row of RatingMatrix.block_pair_stats, with the user's own count set to 0).
+
+    Only users that share at least min_shared movies are kept, and if max_neighbours is not None, only the
+    max_neighbours of them with the highest scores, in descending order of score. Ties are broken by lowest user id,
+    as in graph.select_neighbours.
+
+    Preconditions:
+    - len(user_ids) == len(sums) == len(counts)
+    - max_neighbours is None or max_neighbours > 0
+    - min_shared > 0
+
+    >>> select_neighbours_sparse(np.array([2, 3, 4, 5]), np.array([1.0, 0.0, 2.0, 0.0]), np.array([1, 2, 2, 2]), 2, 2)
+    {3: 5.0, 5: 5.0}
+    """
+    partners = np.flatnonzero(counts >= min_shared)
+    scores = 5.0 - sums[partners] / counts[partners]
+    partner_ids = user_ids[partners]
+    if max_neighbours is not None:
+        if len(partners) > max_neighbours:
+            top = np.argpartition(-scores, max_neighbours - 1)[:max_neighbours]
+            # Keep every partner tied with the lowest selected score, so ties are broken by id below
+            top = np.flatnonzero(scores >= scores[top].min())
+            scores, partner_ids = scores[top], partner_ids[top]
+        order = np.lexsort((partner_ids, -scores))[:max_neighbours]
+        scores, partner_ids = scores[order], partner_ids[order]
+    return dict(zip(partner_ids.tolist(), scores.tolist()))
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod()
+    python_ta.check_all(config={
+        'extra-imports': ['__future__', 'instrumentation', 'movie_user_classes', 'doctest', 'numpy', 'typing'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
@@ -0,0 +1,145 @@
+"""This Python module contains the functions used to generate synthetic datasets with the same shape as the MovieLens
+datasets used in this project, so that the performance of the project can be measured at larger scales.
+
+User activity and movie popularity both follow a power law (a few users rate many movies, and a few movies are rated
+by many users), as in the real datasets.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import os
+
+import numpy as np
+
+from graph import Graph
+from movie_user_classes import Movie
+
+DEFAULT_EXPONENT = 1.1
+START_TIMESTAMP = 946684800
+
+# The number of (users, movies) used for a dataset with the given number of ratings, following the MovieLens datasets
+SCALES = {
+    100_000: (610, 9_742),
+    1_000_000: (6_040, 3_706),
+    10_000_000: (69_878, 10_677),
+}
+
+
+def generate_ratings(num_ratings: int, num_users: int, num_movies: int, seed: int = 0,
+                     exponent: float = DEFAULT_EXPONENT) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return a tuple (user_ids, movie_ids, ratings) of parallel arrays holding about num_ratings distinct ratings,
+    sorted by user id then movie id. User ids range from 1 to num_users and movie ids from 1 to num_movies, and the
+    number of ratings of the user or movie of rank k is roughly proportional to 1 / k ** exponent. Ratings are
+    multiples of 0.5 between 0.5 and 5.0, drawn around a per-user bias plus a per-movie quality.
+
+    Preconditions:
+    - num_ratings > 0 and num_users > 0 and num_movies > 0
+    - num_ratings <= num_users * num_movies
+
+    >>> users, movies, ratings = generate_ratings(1000, 50, 100)
+    >>> len(users) == len(movies) == len(ratings) and len(users) <= 1000
+    True
+    >>> bool(((ratings * 2) % 1 == 0).all() and ratings.min() >= 0.5 and ratings.max() <= 5.0)
+    True
+    """
+    rng = np.random.default_rng(seed)
+    user_weights = _power_law_weights(num_users, exponent, rng)
+    movie_weights = _power_law_weights(num_movies, exponent, rng)
+
+    # Oversample, since drawing a (user, movie) pair twice only counts once
+    draws = int(num_ratings * 1.2) + 16
+    pairs = np.unique(rng.choice(num_users, size=draws, p=user_weights).astype(np.int64) * num_movies
+                      + rng.choice(num_movies, size=draws, p=movie_weights))
+    pairs = np.sort(rng.permutation(pairs)[:num_ratings])
+    user_index, movie_index = pairs // num_movies, pairs % num_movies
+    ratings = _draw_ratings(rng, user_index, movie_index, (num_users, num_movies))
+    return user_index + 1, movie_index + 1, ratings
+
+
+def _draw_ratings(rng: np.random.Generator, user_index: np.ndarray, movie_index: np.ndarray,
+                  shape: tuple[int, int]) -> np.ndarray:
+    """Return the ratings given by the users in user_index to the movies in movie_index, drawn with rng around a
+    per-user bias plus a per-movie quality, where shape is (num_users, num_movies)
+    """
+    user_bias = rng.normal(0.0, 0.5, size=shape[0])
+    movie_quality = rng.normal(3.5, 0.6, size=shape[1])
+    raw = movie_quality[movie_index] + user_bias[user_index] + rng.normal(0.0, 0.8, size=len(user_index))
+    return np.clip(np.round(raw * 2) / 2, 0.5, 5.0)
+
+
+def build_graph(num_ratings: int, num_users: int, num_movies: int, seed: int = 0,
+                exponent: float = DEFAULT_EXPONENT) -> Graph:
+    """Return a new graph holding num_movies movies and the ratings returned by generate_ratings with the same
+    arguments
+
+    >>> graph = build_graph(1000, 50, 100)
+    >>> len(graph.get_all_users()) <= 50
+    True
+    """
+    graph = Graph()
+    for movie_id in range(1, num_movies + 1):
+        graph.add_movie(Movie(movie_id, f"Movie {movie_id}"))
+    user_ids, movie_ids, ratings = generate_ratings(num_ratings, num_users, num_movies, seed, exponent)
+    graph.add_ratings(zip(user_ids.tolist(), movie_ids.tolist(), ratings.tolist()))
+    return graph
+
+
+def write_dataset(directory: str, num_ratings: int, seed: int = 0) -> tuple[str, str]:
+    """Write a synthetic movies.csv and ratings.csv with about num_ratings ratings into directory, in the format of the
+    MovieLens files read by import_movies and import_ratings, and return their paths. The number of users and movies
+    is taken from SCALES, or interpolated from its closest smaller entry for other sizes. Files that already exist
+    are not written again.
+
+    Preconditions:
+    - num_ratings >= 1000
+    """
+    os.makedirs(directory, exist_ok=True)
+    movie_file = os.path.join(directory, f"movies_{num_ratings}.csv")
+    rating_file = os.path.join(directory, f"ratings_{num_ratings}.csv")
+    num_users, num_movies = dataset_shape(num_ratings)
+    if not os.path.exists(movie_file):
+        with open(movie_file, 'w', encoding='utf8') as file:
+            file.write('movieId,title,genres\n')
+            file.writelines(f"{movie_id},Movie {movie_id} (2000),Drama\n" for movie_id in range(1, num_movies + 1))
+    if not os.path.exists(rating_file):
+        user_ids, movie_ids, ratings = generate_ratings(num_ratings, num_users, num_movies, seed)
+        timestamps = START_TIMESTAMP + np.sort(np.random.default_rng(seed).integers(0, 10 ** 9, size=len(ratings)))
+        partial_file = rating_file + '.partial'
+        np.savetxt(partial_file, np.column_stack((user_ids, movie_ids, ratings, timestamps)),
+                   fmt=['%d', '%d', '%.1f', '%d'], delimiter=',', header='userId,movieId,rating,timestamp',
+                   comments='')
+        os.replace(partial_file, rating_file)
+    return movie_file, rating_file
+
+
+def dataset_shape(num_ratings: int) -> tuple[int, int]:
+    """Return the (number of users, number of movies) of a synthetic dataset with num_ratings ratings
+
+    >>> dataset_shape(1_000_000)
+    (6040, 3706)
+    >>> dataset_shape(2_000_000)
+    (12080, 3706)
+    """
+    if num_ratings in SCALES:
+        return SCALES[num_ratings]
+    base = max([size for size in SCALES if size <= num_ratings], default=min(SCALES))
+    num_users, num_movies = SCALES[base]
+    return max(1, round(num_users * num_ratings / base)), num_movies
+
+
+def _power_law_weights(size: int, exponent: float, rng: np.random.Generator) -> np.ndarray:
+    """Return size probabilities proportional to 1 / rank ** exponent, assigned to random positions
+    """
+    weights = 1.0 / np.arange(1, size + 1) ** exponent
+    return rng.permutation(weights / weights.sum())
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod()
+    python_ta.check_all(config={
+        'extra-imports': ['graph', 'movie_user_classes', 'doctest', 'os', 'numpy'],
+        'allowed-io': ['write_dataset'],
+        'max-line-length': 120
+    })
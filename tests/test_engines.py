@@ -0,0 +1,95 @@
+"""Tests for the compat engines of graph.py and the parallel engine of parallel.py, checked against the python engine.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+from typing import Optional
+
+import pytest
+
+from graph import Graph
+from lsh import recall
+from parallel import process_compat_users_parallel, process_recommends_parallel
+from synthetic_data import build_graph
+
+NUM_RATINGS, NUM_USERS, NUM_MOVIES = 3000, 80, 300
+RECOMMEND_PARAMS = (3.5, 3.5, 10)
+# Small enough for the users to be split into several blocks, whose segments are spilled and merged
+MEMORY_BUDGET = 1 << 16
+# High enough to drop some of the compat scores kept by the neighbour limits of the tests
+MIN_SCORE = 4.25
+
+
+def computed(limits: tuple, engine: str = 'python', min_score: Optional[float] = None) -> Graph:
+    """Return the test graph with the compat scores of its users computed by engine with the neighbour limits limits
+    (keeping the ones of at least min_score, if the engine is 'out_of_core'), and their recommendations computed from
+    them
+    """
+    graph = build_graph(NUM_RATINGS, NUM_USERS, NUM_MOVIES)
+    graph.set_neighbour_limits(*limits)
+    graph.process_compat_users(engine, out_of_core_params=(MEMORY_BUDGET, min_score))
+    graph.process_movie_recommends(*RECOMMEND_PARAMS)
+    return graph
+
+
+def assert_same_results(graph: Graph, expected: Graph) -> None:
+    """Assert that every user of graph has the compat scores and recommendations of the same user in expected
+    """
+    for user in expected.get_all_users():
+        actual = graph.get_user(user.user_id)
+        assert actual.user_compats == pytest.approx(user.user_compats)
+        assert actual.recommendations == user.recommendations
+
+
+@pytest.mark.parametrize('limits', [(None, 1), (5, 2), (3, 1)])
+def test_sparse_matches_python(limits: tuple) -> None:
+    """The sparse engine computes the same compat scores as the python engine, under the same neighbour limits
+    """
+    assert_same_results(computed(limits, 'sparse'), computed(limits))
+
+
+@pytest.mark.parametrize('limits', [(5, 2), (3, 1)])
+@pytest.mark.parametrize('min_score', [None, MIN_SCORE])
+def test_out_of_core_matches_python(limits: tuple, min_score: Optional[float]) -> None:
+    """The out-of-core engine keeps the compat scores of the python engine of at least min_score, which give the same
+    recommendations when they are computed with min_score
+    """
+    graph = computed(limits, 'out_of_core', min_score)
+    expected = computed(limits)
+    if min_score is not None:
+        graph.process_movie_recommends(min_score, *RECOMMEND_PARAMS[1:])
+        expected.process_movie_recommends(min_score, *RECOMMEND_PARAMS[1:])
+    for user in expected.get_all_users():
+        actual = graph.get_user(user.user_id)
+        kept = {uid: score for uid, score in user.user_compats.items() if min_score is None or score >= min_score}
+        assert actual.user_compats == pytest.approx(kept)
+        assert actual.recommendations == user.recommendations
+
+
+def test_out_of_core_needs_neighbour_limit() -> None:
+    """The out-of-core engine refuses to keep the scores of every pair of users
+    """
+    graph = build_graph(NUM_RATINGS, NUM_USERS, NUM_MOVIES)
+    with pytest.raises(ValueError):
+        graph.process_compat_users('out_of_core')
+
+
+def test_lsh_scores_exact() -> None:
+    """The lsh engine finds most compatible users of the python engine, and gives each one found the exact score
+    """
+    graph, expected = computed((None, 1), 'lsh'), computed((None, 1))
+    for user in graph.get_all_users():
+        exact = expected.get_user(user.user_id).user_compats
+        assert user.user_compats == pytest.approx({uid: exact[uid] for uid in user.user_compats})
+    assert recall({user.user_id: user.user_compats for user in expected.get_all_users()},
+                  {user.user_id: user.user_compats for user in graph.get_all_users()}) >= 0.9
+
+
+@pytest.mark.parametrize('limits', [(None, 1), (5, 2)])
+def test_parallel_matches_python(limits: tuple) -> None:
+    """The parallel engine computes the same compat scores and recommendations as the python engine
+    """
+    graph = build_graph(NUM_RATINGS, NUM_USERS, NUM_MOVIES)
+    process_compat_users_parallel(graph, 2, *limits)
+    process_recommends_parallel(graph, RECOMMEND_PARAMS, 2)
+    assert_same_results(graph, computed(limits))
+    assert graph.get_recommend_params() == RECOMMEND_PARAMS
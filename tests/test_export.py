@@ -0,0 +1,96 @@
+"""Tests for the resumable bulk export of export.py, checked against an export run without interruption.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import gzip
+import os
+from typing import Optional
+
+import pytest
+
+import export
+from graph import Graph
+from instrumentation import ProgressFn
+from synthetic_data import build_graph
+
+NUM_RATINGS, NUM_USERS, NUM_MOVIES = 3000, 80, 300
+RECOMMEND_PARAMS = (3.5, 3.5, 10)
+CHECKPOINT_USERS = 20
+
+
+class Interrupted(Exception):
+    """Raised to stop an export part way through"""
+
+
+def lazy_graph() -> Graph:
+    """Return the test graph in lazy mode, as export.py loads it
+    """
+    graph = build_graph(NUM_RATINGS, NUM_USERS, NUM_MOVIES)
+    graph.set_neighbour_limits(5, 2)
+    graph.enable_lazy(*RECOMMEND_PARAMS, cache_size=CHECKPOINT_USERS)
+    return graph
+
+
+def contents(path: str, compress: bool) -> bytes:
+    """Return the uncompressed contents of the export written to path
+    """
+    with (gzip.open(path, 'rb') if compress else open(path, 'rb')) as file:
+        return file.read()
+
+
+def interrupt_after(chunks: int) -> ProgressFn:
+    """Return a progress function that stops an export once chunks chunks are written
+    """
+    def progress(done: int, _: int) -> None:
+        if done >= chunks * CHECKPOINT_USERS:
+            raise Interrupted
+
+    return progress
+
+
+@pytest.mark.parametrize('output_format', [('jsonl', False, 5), ('csv', True, 3)])
+def test_resume_matches_full_export(tmp_path, monkeypatch, output_format: tuple) -> None:
+    """An export interrupted after a chunk, with a partial chunk written after it, and then resumed writes the same
+    output as an export run without interruption
+    """
+    monkeypatch.setattr(export, 'CHECKPOINT_USERS', CHECKPOINT_USERS)
+    full, path = os.path.join(tmp_path, 'full'), os.path.join(tmp_path, 'resumed')
+    written = export.export_all(lazy_graph(), full, output_format)
+    assert written == len(lazy_graph().get_all_users()) and not os.path.exists(full + '.progress')
+
+    with pytest.raises(Interrupted):
+        export.export_all(lazy_graph(), path, output_format, progress=interrupt_after(2))
+    with open(path, 'ab') as file:
+        file.write(b'partial chunk')
+    assert export.export_all(lazy_graph(), path, output_format, resume=True) == written - 2 * CHECKPOINT_USERS
+    assert contents(path, output_format[1]) == contents(full, output_format[1])
+    assert not os.path.exists(path + '.progress')
+
+
+def test_resume_without_progress_starts_again(tmp_path) -> None:
+    """Resuming an export that has no progress file writes the whole output again
+    """
+    path = os.path.join(tmp_path, 'export.jsonl')
+    with open(path, 'wb') as file:
+        file.write(b'stale output\n')
+    written = export.export_all(lazy_graph(), path, resume=True)
+    with open(path, 'rb') as file:
+        assert len(file.read().splitlines()) == written == len(lazy_graph().get_all_users())
+
+
+@pytest.mark.parametrize('kept_bytes', [None, 10])
+def test_resume_without_output_starts_again(tmp_path, monkeypatch, kept_bytes: Optional[int]) -> None:
+    """Resuming an interrupted export whose output was removed, or cut shorter than its progress file says, writes the
+    whole output again
+    """
+    monkeypatch.setattr(export, 'CHECKPOINT_USERS', CHECKPOINT_USERS)
+    full, path = os.path.join(tmp_path, 'full'), os.path.join(tmp_path, 'resumed')
+    written = export.export_all(lazy_graph(), full)
+    with pytest.raises(Interrupted):
+        export.export_all(lazy_graph(), path, progress=interrupt_after(2))
+    if kept_bytes is None:
+        os.remove(path)
+    else:
+        os.truncate(path, kept_bytes)
+    assert export.export_all(lazy_graph(), path, resume=True) == written
+    assert contents(path, False) == contents(full, False)
@@ -0,0 +1,104 @@
+"""Tests for the incremental and lazy updates of graph.py, checked against a full recompute with the python engine.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import random
+
+import pytest
+
+from graph import Graph
+from synthetic_data import build_graph
+
+NUM_RATINGS, NUM_USERS, NUM_MOVIES = 3000, 80, 300
+RECOMMEND_PARAMS = (3.5, 3.5, 10)
+
+
+def new_ratings(count: int, seed: int) -> list[tuple[int, int, float]]:
+    """Return count random (user id, movie id, rating) ratings of the users and movies of the test graphs, some of
+    which rate again a movie rated before
+    """
+    rng = random.Random(seed)
+    return [(rng.randint(1, NUM_USERS), rng.randint(1, NUM_MOVIES // 5), rng.randint(1, 10) / 2)
+            for _ in range(count)]
+
+
+def recomputed(ratings: list[tuple[int, int, float]], limits: tuple) -> Graph:
+    """Return the test graph with ratings added, and the compat scores and recommendations of all its users computed
+    from scratch with the python engine
+    """
+    graph = build_graph(NUM_RATINGS, NUM_USERS, NUM_MOVIES)
+    graph.add_ratings(ratings)
+    graph.set_neighbour_limits(*limits)
+    graph.process_compat_users()
+    graph.process_movie_recommends(*RECOMMEND_PARAMS)
+    return graph
+
+
+@pytest.mark.parametrize('limits', [(None, 1), (5, 2), (3, 1)])
+def test_incremental_matches_recompute(limits: tuple) -> None:
+    """Ratings added with incremental updates enabled give the compat scores and recommendations of a full recompute
+    """
+    graph = build_graph(NUM_RATINGS, NUM_USERS, NUM_MOVIES)
+    graph.set_neighbour_limits(*limits)
+    graph.enable_incremental()
+    graph.process_movie_recommends(*RECOMMEND_PARAMS)
+    ratings = new_ratings(200, 1)
+    for i in range(0, len(ratings), 20):
+        graph.add_ratings(ratings[i:i + 20])
+        graph.refresh_recommendations()
+
+    expected = recomputed(ratings, limits)
+    for user in expected.get_all_users():
+        actual = graph.get_user(user.user_id)
+        assert actual.user_compats == pytest.approx(user.user_compats)
+        assert actual.recommendations == user.recommendations
+
+
+def test_neighbour_holder_marked_stale() -> None:
+    """A user who has the rater as a compatible user is marked as stale, even when the rater does not have them as
+    one because of the neighbour limits
+    """
+    graph = build_graph(NUM_RATINGS, NUM_USERS, NUM_MOVIES)
+    graph.set_neighbour_limits(3, 1)
+    graph.enable_incremental()
+    graph.process_movie_recommends(*RECOMMEND_PARAMS)
+    holder, rater = next((user, graph.get_user(uid)) for user in graph.get_all_users() for uid in user.user_compats
+                         if user.user_id not in graph.get_user(uid).user_compats)
+    movie_id = next(m.movie_id for m in graph.get_all_movies() if m.movie_id not in rater.movie_ratings)
+    graph.add_rating(rater, movie_id, 5.0)
+    assert holder.user_id in graph.get_stale_users()
+
+
+@pytest.mark.parametrize('limits', [(None, 1), (5, 2)])
+def test_lazy_matches_recompute(limits: tuple) -> None:
+    """In lazy mode, the cached results of a user are dropped when a rating changes them, even when the rater's own
+    results were never computed
+    """
+    graph = build_graph(NUM_RATINGS, NUM_USERS, NUM_MOVIES)
+    graph.set_neighbour_limits(*limits)
+    graph.enable_lazy(*RECOMMEND_PARAMS, cache_size=NUM_USERS // 2)
+    ratings = new_ratings(100, 2)
+    for i, (user_id, movie_id, rating) in enumerate(ratings):
+        graph.get_recommendations(graph.find_or_add_user(1 + i % NUM_USERS))
+        graph.add_rating(graph.find_or_add_user(user_id), movie_id, rating)
+
+    expected = recomputed(ratings, limits)
+    for user in expected.get_all_users():
+        actual = graph.get_user(user.user_id)
+        assert graph.get_recommendations(actual) == user.recommendations
+        assert graph.get_user_compats(actual) == pytest.approx(user.user_compats)
+
+
+def test_results_available_as_computed() -> None:
+    """While process_movie_recommends runs, has_results is True for exactly the users computed so far
+    """
+    graph = build_graph(NUM_RATINGS, NUM_USERS, NUM_MOVIES)
+    graph.process_compat_users()
+    users = graph.get_all_users()
+    assert not any(graph.has_results(user) for user in users)
+
+    def check(done: int, _: int) -> None:
+        assert [graph.has_results(user) for user in users] == [i < done for i in range(len(users))]
+
+    graph.process_movie_recommends(*RECOMMEND_PARAMS, progress=check)
+    assert all(graph.has_results(user) for user in users) and not graph.get_stale_users()
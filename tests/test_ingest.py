@@ -0,0 +1,72 @@
+"""Tests for the restarts of the RatingTailer of ingest.py.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import os
+
+from graph import Graph
+from ingest import LogCursor, RatingTailer
+from movie_user_classes import Movie
+
+DATASET_RATINGS = [(1, 1, 4.0), (2, 2, 3.0)]
+DATASET_MAX_TIMESTAMP = 100
+
+
+def dataset_graph() -> Graph:
+    """Return a new graph holding the ratings of the test dataset, whose largest timestamp is DATASET_MAX_TIMESTAMP
+    """
+    graph = Graph()
+    for movie_id in range(1, 4):
+        graph.add_movie(Movie(movie_id, f"Movie {movie_id}"))
+    graph.add_ratings(DATASET_RATINGS)
+    return graph
+
+
+def ratings_of(graph: Graph) -> dict[int, dict[int, float]]:
+    """Return the ratings of every user of graph
+    """
+    return {user.user_id: dict(user.movie_ratings.items()) for user in graph.get_all_users()}
+
+
+def append(log: str, rows: str) -> None:
+    """Append rows to the ratings log log
+    """
+    with open(log, 'a', encoding='utf8') as file:
+        file.write(rows)
+
+
+def test_restart_replays_log(tmp_path) -> None:
+    """A tailer restarted on a graph loaded again from the datasets applies again the ratings applied before the
+    restart, including a late one, and skips again the ones that were in the datasets
+    """
+    log, state = os.path.join(tmp_path, 'log.csv'), os.path.join(tmp_path, 'state.json')
+    append(log, 'userId,movieId,rating,timestamp\n1,1,4.0,90\n3,1,5.0,105\n')
+    graph = dataset_graph()
+    tailer = RatingTailer(graph, LogCursor(log, DATASET_MAX_TIMESTAMP, state), flush_interval=0.0)
+    assert tailer.poll() == 1
+    # A rating older than the datasets that arrives after the catch-up is applied
+    append(log, '3,2,2.0,95\n4,3,1.5,110\n')
+    assert tailer.poll() == 2
+
+    restarted = dataset_graph()
+    replay = RatingTailer(restarted, LogCursor(log, DATASET_MAX_TIMESTAMP, state, resume=False), flush_interval=0.0)
+    assert replay.poll() == 3
+    assert ratings_of(restarted) == ratings_of(graph)
+    assert replay.cursor.applied_offset == tailer.cursor.applied_offset == os.path.getsize(log)
+    assert replay.cursor.high_water_mark == tailer.cursor.high_water_mark == 110
+    assert replay.stats.rows_skipped == 1
+
+
+def test_restart_resumes_with_kept_graph(tmp_path) -> None:
+    """A tailer restarted on the graph the last one applied its ratings to resumes from the saved offset
+    """
+    log, state = os.path.join(tmp_path, 'log.csv'), os.path.join(tmp_path, 'state.json')
+    append(log, 'userId,movieId,rating,timestamp\n3,1,5.0,105\n')
+    graph = dataset_graph()
+    assert RatingTailer(graph, LogCursor(log, DATASET_MAX_TIMESTAMP, state), flush_interval=0.0).poll() == 1
+
+    append(log, '3,2,2.0,95\n')
+    resumed = RatingTailer(graph, LogCursor(log, state_file=state), flush_interval=0.0)
+    assert resumed.poll() == 1
+    assert resumed.stats.rows_skipped == 0
+    assert ratings_of(graph)[3] == {1: 5.0, 2: 2.0}
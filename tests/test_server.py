@@ -0,0 +1,108 @@
+"""Tests for the HTTP server of server.py, checked against the results of the graph it serves.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import asyncio
+import json
+from typing import Any, Optional
+
+import pytest
+
+from graph import Graph
+from server import MAX_BATCH_SIZE, RecommendationServer, read_message
+from shared_graph import SharedGraph, publish
+from synthetic_data import build_graph
+
+NUM_RATINGS, NUM_USERS, NUM_MOVIES = 3000, 80, 300
+RECOMMEND_PARAMS = (3.5, 3.5, 10)
+
+
+def computed_graph() -> Graph:
+    """Return the test graph with the compat scores and recommendations of its users computed
+    """
+    graph = build_graph(NUM_RATINGS, NUM_USERS, NUM_MOVIES)
+    graph.set_neighbour_limits(5, 2)
+    graph.process_compat_users()
+    graph.process_movie_recommends(*RECOMMEND_PARAMS)
+    return graph
+
+
+def request(server: RecommendationServer, method: str, path: str, body: Any = None) -> tuple[int, Any]:
+    """Return the (status code, JSON payload) server answers a request for path with the given method and body with,
+    where body is encoded as JSON unless it is None
+    """
+    return asyncio.run(server.handle_request(method, path, b'' if body is None else json.dumps(body).encode('utf8')))
+
+
+def assert_serves(server: RecommendationServer, graph: Graph) -> None:
+    """Assert that server answers with the recommendations and compatible users of every user of graph
+    """
+    user_ids = [user.user_id for user in graph.get_all_users()]
+    for user in graph.get_all_users():
+        status, payload = request(server, 'GET', f"/users/{user.user_id}/recommendations")
+        assert status == 200
+        assert [movie['movie_id'] for movie in payload['recommendations']] == user.recommendations
+        status, payload = request(server, 'GET', f"/users/{user.user_id}/compats")
+        scores = [compat['score'] for compat in payload['compats']]
+        assert status == 200 and scores == sorted(scores, reverse=True)
+        assert {compat['user_id']: compat['score'] for compat in payload['compats']} == pytest.approx(user.user_compats)
+    status, payload = request(server, 'POST', '/users/recommendations', {'user_ids': user_ids[:5] + [NUM_USERS + 1]})
+    assert status == 200 and payload['missing'] == [NUM_USERS + 1]
+    singles = {str(uid): request(server, 'GET', f"/users/{uid}/recommendations")[1]['recommendations']
+               for uid in user_ids[:5]}
+    assert payload['results'] == singles
+
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_serves_graph_results(shared: bool) -> None:
+    """The server answers with the results of the graph, or of a view of it published to shared memory
+    """
+    graph = computed_graph()
+    if not shared:
+        assert_serves(RecommendationServer(graph), graph)
+        return
+    block = publish(graph)
+    view = SharedGraph(block.name)
+    try:
+        assert_serves(RecommendationServer(view), graph)
+    finally:
+        view.close()
+        block.close()
+        block.unlink()
+
+
+@pytest.mark.parametrize('method, path, body, status', [
+    ('GET', f"/users/{NUM_USERS + 1}/recommendations", None, 404),
+    ('GET', '/movies/1', None, 404),
+    ('POST', '/users/1/compats', None, 405),
+    ('GET', '/users/recommendations', None, 405),
+    ('POST', '/users/recommendations', {'ids': [1]}, 400),
+    ('POST', '/users/recommendations', {'user_ids': ['1']}, 400),
+    ('POST', '/users/recommendations', {'user_ids': [1] * (MAX_BATCH_SIZE + 1)}, 400)])
+def test_rejects_bad_requests(method: str, path: str, body: Optional[dict], status: int) -> None:
+    """Requests for unknown users or routes, with the wrong method or with a malformed body are answered with an error
+    """
+    answer = request(RecommendationServer(computed_graph()), method, path, body)
+    assert answer[0] == status and 'error' in answer[1]
+
+
+def test_connection_kept_alive() -> None:
+    """Several requests are answered on one connection, which is closed once the client asks for it
+    """
+    graph = computed_graph()
+
+    async def exchange() -> list:
+        server = await asyncio.start_server(RecommendationServer(graph).handle_connection, '127.0.0.1', 0)
+        async with server:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            writer.write(b'GET /users/1/recommendations HTTP/1.1\r\n\r\n'
+                         b'GET /users/1/compats HTTP/1.1\r\nConnection: close\r\n\r\n')
+            responses = [await read_message(reader), await read_message(reader), await reader.read()]
+            writer.close()
+        return responses
+
+    first, second, rest = asyncio.run(exchange())
+    assert first[0] == 'HTTP/1.1 200 OK' and first[1]['connection'] == 'keep-alive'
+    assert json.loads(first[2]) == request(RecommendationServer(graph), 'GET', '/users/1/recommendations')[1]
+    assert second[1]['connection'] == 'close' and json.loads(second[2])['user_id'] == 1
+    assert rest == b''
@@ -0,0 +1,51 @@
+"""Tests for the graph published to shared memory by shared_graph.py, checked against the graph it was published from.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import pytest
+
+from graph import Graph
+from shared_graph import SharedGraph, publish
+from synthetic_data import build_graph
+
+NUM_RATINGS, NUM_USERS, NUM_MOVIES = 3000, 80, 300
+RECOMMEND_PARAMS = (3.5, 3.5, 10)
+
+
+def assert_same_graph(view: SharedGraph, graph: Graph) -> None:
+    """Assert that view holds the users, movies, ratings and results of graph. The users and movies read from view are
+    released before returning, so view can be closed afterwards.
+    """
+    assert [user.user_id for user in view.get_all_users()] == sorted(u.user_id for u in graph.get_all_users())
+    assert view.get_recommend_params() == graph.get_recommend_params()
+    for user in graph.get_all_users():
+        shared = view.get_user(user.user_id)
+        assert dict(shared.movie_ratings.items()) == user.movie_ratings
+        assert view.get_user_compats(shared) == pytest.approx(graph.get_user_compats(user))
+        assert view.get_recommendations(shared) == graph.get_recommendations(user)
+    for movie in graph.get_all_movies():
+        shared = view.get_movie(movie.movie_id)
+        assert (shared.title, dict(shared.user_ratings.items())) == (movie.title, movie.user_ratings)
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_view_matches_graph(lazy: bool) -> None:
+    """A view of a published graph holds the ratings and results of the graph, which are all computed when they are
+    published from a graph in lazy mode
+    """
+    graph = build_graph(NUM_RATINGS, NUM_USERS, NUM_MOVIES)
+    graph.set_neighbour_limits(5, 2)
+    if lazy:
+        graph.enable_lazy(*RECOMMEND_PARAMS, cache_size=NUM_USERS // 2)
+    else:
+        graph.process_compat_users()
+        graph.process_movie_recommends(*RECOMMEND_PARAMS)
+    block = publish(graph)
+    view = SharedGraph(block.name)
+    try:
+        assert_same_graph(view, graph)
+        assert not view.user_exists(NUM_USERS + 1) and not view.movie_exists(NUM_MOVIES + 1)
+    finally:
+        view.close()
+        block.close()
+        block.unlink()
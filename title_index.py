@@ -0,0 +1,287 @@
+"""This Python module contains the TitleIndex class used to search the movies of a graph by title.
+
+Titles are normalized into tokens: lowercase words and numbers, with accents removed, so "Amélie (2001)" has the
+tokens "amelie" and "2001". The distinct tokens are kept in a sorted list, in which all the tokens starting with a
+prefix are found by binary search, and every token is also indexed by its trigrams (its substrings of 3 characters,
+padded with spaces at both ends). The tokens sharing a trigram with a misspelled token are the candidates for what it
+was meant to be, and the ones within a few typos of it (see typo_distance) are its matches. Since a typo adds or
+removes at most 2 of the distinct characters of a token, most candidates are ruled out by comparing the sets of their
+characters, stored as bit masks, before their typos are counted.
+
+A query matches the movies whose title matches each of its tokens: exactly, as a prefix (so a query can be searched
+as it is typed), or as a token a typo or two away. Exact matches rank above prefix matches, which rank above typos.
+The matches of the query tokens searched recently are cached, since every keystroke searches the earlier tokens of the
+query again.
+
+This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
+"""
+import heapq
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain
+from typing import KeysView, Optional
+
+from lru import LRUCache
+
+DEFAULT_LIMIT = 10
+EXPANSION_CACHE_SIZE = 256  # Number of query tokens whose matches are kept, as a query is searched again as it is typed
+MIN_FUZZY_LENGTH = 3  # Shortest query token matched to the tokens spelled like it
+LONG_TOKEN = 10  # Length from which a query token may be matched to tokens 2 typos away instead of 1
+EXACT_WEIGHT = 1.0
+PREFIX_WEIGHT = 0.75
+FUZZY_WEIGHT = 0.5
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+class TitleIndex:
+    """ A class that indexes the titles of movies by their tokens and trigrams
+
+    Instance Attributes:
+    - titles:
+        A mapping from the id of each indexed movie to its title
+
+    Representation Invariants:
+    - all({m in self.titles for t in self._token_movies for m in self._token_movies[t]})
+    - all({normalize(self.titles[m]) == self._movie_tokens[m] for m in self.titles})
+    - self._sorted_tokens is None or self._sorted_tokens == sorted(self._token_movies)
+
+    >>> index = TitleIndex()
+    >>> index.add(1, 'Toy Story (1995)')
+    >>> index.add(2, 'Toy Soldiers (1991)')
+    >>> index.add(3, 'Story of Us, The (1999)')
+    >>> index.search('toy st')
+    [1]
+    >>> index.search('story')
+    [1, 3]
+    >>> index.search('toi sotry')
+    [1]
+    """
+    titles: dict[int, str]
+    _movie_tokens: dict[int, list[str]]
+    _token_movies: dict[str, set[int]]
+    _trigram_tokens: dict[str, set[str]]
+    _token_masks: dict[str, int]
+    _sorted_tokens: Optional[list[str]]
+    _expansions: LRUCache
+
+    def __init__(self) -> None:
+        self.titles = {}
+        self._movie_tokens = {}
+        self._token_movies = {}
+        self._trigram_tokens = {}
+        self._token_masks = {}
+        self._sorted_tokens = []
+        self._expansions = LRUCache(EXPANSION_CACHE_SIZE)
+
+    def add(self, movie_id: int, title: str) -> None:
+        """Index the movie with id movie_id under title, replacing the title it was indexed under before, if any
+        """
+        for token in self._movie_tokens.get(movie_id, []):
+            self._token_movies[token].discard(movie_id)
+        self.titles[movie_id] = title
+        self._movie_tokens[movie_id] = normalize(title)
+        for token in self._movie_tokens[movie_id]:
+            if token not in self._token_movies:
+                self._token_movies[token] = set()
+                for trigram in trigrams(token):
+                    self._trigram_tokens.setdefault(trigram, set()).add(token)
+                self._token_masks[token] = character_mask(token)
+                self._sorted_tokens = None
+            self._token_movies[token].add(movie_id)
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> list[int]:
+        """Return the ids of at most limit movies whose titles match every token of query, best match first. Each
+        title is scored by the sum over the query tokens of the weight of its best matching token, and ties are broken
+        by shortest title, then by lowest movie id.
+
+        The indexed tokens matching each query token are found first. The movies of the query token with the fewest
+        of them are then looked up, and only these movies are matched against the other query tokens: by their titles,
+        or by the movies of each token matched, whichever are fewer.
+
+        Preconditions:
+        - limit > 0
+        """
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self._token_movies)
+            self._expansions.clear()
+        token_matches = []
+        for token in set(normalize(query)):
+            matches = self._expansions.get(token)
+            if matches is None:
+                matches = self._expand(token)
+                self._expansions.put(token, matches)
+            token_matches.append(matches)
+        if not token_matches:
+            return []
+        token_matches.sort(key=lambda expansion: sum(len(self._token_movies[t]) for t in expansion))
+
+        scores = self._best_weights(token_matches[0])
+        for matches in token_matches[1:]:
+            if len(matches) > len(scores):
+                best = {movie_id: max(matches.get(title_token, 0.0) for title_token in self._movie_tokens[movie_id])
+                        for movie_id in scores}
+            else:
+                best = self._best_weights(matches, scores.keys())
+            scores = {movie_id: scores[movie_id] + weight for movie_id, weight in best.items() if weight > 0.0}
+
+        top = heapq.nsmallest(limit, ((-score, len(self.titles[movie_id]), movie_id)
+                                      for movie_id, score in scores.items()))
+        return [movie_id for _, _, movie_id in top]
+
+    def _best_weights(self, matches: dict[str, float], movie_ids: Optional[KeysView[int]] = None) -> dict[int, float]:
+        """Return the weight of the best of matches in the title of each movie whose title has any of them, among
+        movie_ids, or among all the movies if movie_ids is None. Intersecting movie_ids with the movies of each match
+        only walks the smaller of the two.
+        """
+        best = {}
+        for match, weight in matches.items():
+            movies = self._token_movies[match]
+            for movie_id in (movies if movie_ids is None else movie_ids & movies):
+                if weight > best.get(movie_id, 0.0):
+                    best[movie_id] = weight
+        return best
+
+    def _expand(self, token: str) -> dict[str, float]:
+        """Return the indexed tokens matching token, with the weight of each match (see match_weight): the tokens
+        starting with token, found by binary search, and if token has at least MIN_FUZZY_LENGTH characters, the
+        tokens within a few typos of it, found through the trigrams they share with it
+
+        Preconditions:
+        - self._sorted_tokens is not None
+        """
+        matches = self._fuzzy_matches(token) if len(token) >= MIN_FUZZY_LENGTH else {}
+        start = bisect_left(self._sorted_tokens, token)
+        # '{' comes right after 'z' and every digit, so it is past every token starting with token
+        stop = bisect_left(self._sorted_tokens, token + '{', start)
+        matches.update(dict.fromkeys(self._sorted_tokens[start:stop], PREFIX_WEIGHT))
+        if token in matches:
+            matches[token] = EXACT_WEIGHT
+        return matches
+
+    def _fuzzy_matches(self, token: str) -> dict[str, float]:
+        """Return the indexed tokens within a few typos of token, with the weight of each match (see match_weight)
+        """
+        # Each typo changes the length of token by at most 1, and at most 4 of its trigrams, so a match shares all
+        # of its other trigrams
+        max_typos = 2 if len(token) >= LONG_TOKEN else 1
+        min_shared = max(1, len(token) - 4 * max_typos)
+        shared = Counter(chain.from_iterable(self._trigram_tokens.get(trigram, ()) for trigram in trigrams(token)))
+        mask = character_mask(token)
+        matches = {}
+        for candidate, count in shared.items():
+            if count >= min_shared and abs(len(candidate) - len(token)) <= max_typos \
+                    and bin(self._token_masks[candidate] ^ mask).count('1') <= 2 * max_typos:
+                weight = match_weight(token, candidate)
+                if weight > 0.0:
+                    matches[candidate] = weight
+        return matches
+
+
+def match_weight(token: str, title_token: str) -> float:
+    """Return how well title_token, a token of a title, matches token, a token of a query: EXACT_WEIGHT if they are
+    equal, PREFIX_WEIGHT if title_token starts with token, FUZZY_WEIGHT scaled down by the number of typos between
+    them if there are at most 1 (2 for tokens of at least LONG_TOKEN characters), and 0.0 otherwise
+
+    >>> [match_weight('story', t) for t in ['story', 'storyteller', 'stroy', 'stone']]
+    [1.0, 0.75, 0.4, 0.0]
+    """
+    if title_token.startswith(token):
+        return EXACT_WEIGHT if len(title_token) == len(token) else PREFIX_WEIGHT
+    max_typos = 2 if len(token) >= LONG_TOKEN else 1
+    if abs(len(title_token) - len(token)) > max_typos:
+        return 0.0
+    distance = typo_distance(token, title_token, max_typos)
+    return FUZZY_WEIGHT * (1 - distance / len(token)) if distance <= max_typos else 0.0
+
+
+def normalize(text: str) -> list[str]:
+    """Return the tokens of text: its lowercase words and numbers, with accents removed
+
+    >>> normalize('Amélie (Fabuleux destin d\\'Amélie Poulain, Le) (2001)')
+    ['amelie', 'fabuleux', 'destin', 'd', 'amelie', 'poulain', 'le', '2001']
+    """
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def trigrams(token: str) -> set[str]:
+    """Return the trigrams of token, padded with a space at both ends
+
+    >>> sorted(trigrams('toy'))
+    [' to', 'oy ', 'toy']
+    """
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def character_mask(token: str) -> int:
+    """Return the set of the characters of token as a bit mask, with bit i set if chr(ord('0') + i) is in token
+
+    >>> character_mask('stone') == character_mask('notes') != character_mask('stones0')
+    True
+    >>> character_mask('0')
+    1
+    """
+    mask = 0
+    for character in token:
+        mask |= 1 << (ord(character) - ord('0'))
+    return mask
+
+
+def typo_distance(token1: str, token2: str, limit: int) -> int:
+    """Return the number of typos between token1 and token2: the fewest characters inserted, deleted, replaced, or
+    swapped with the next one, that turn token1 into token2. Once the distance is known to be over limit, limit + 1
+    is returned instead.
+
+    >>> typo_distance('sotry', 'story', 2)
+    1
+    >>> typo_distance('toy', 'the', 1)
+    2
+    """
+    # Typos are only needed where the tokens differ, so their common prefix and suffix are skipped
+    shortest = min(len(token1), len(token2))
+    start = 0
+    while start < shortest and token1[start] == token2[start]:
+        start += 1
+    end = 0
+    while end < shortest - start and token1[-1 - end] == token2[-1 - end]:
+        end += 1
+    token1, token2 = token1[start:len(token1) - end], token2[start:len(token2) - end]
+    if not token1 or not token2:
+        return min(len(token1) + len(token2), limit + 1)
+    if abs(len(token1) - len(token2)) > limit:
+        return limit + 1
+    if len(token1) == len(token2) == 1 or (len(token1) == len(token2) == 2 and token1 == token2[::-1]):
+        return min(1, limit + 1)
+    if limit <= 1:
+        # What is left differs at both ends, which no single typo does
+        return limit + 1
+
+    # Only the cells at most limit away from the diagonal can be within limit typos, so the others are left at limit + 1
+    over = limit + 1
+    previous, current = [], [min(n, over) for n in range(len(token2) + 1)]
+    for i in range(1, len(token1) + 1):
+        before, previous, current = previous, current, [min(i, over)] + [over] * len(token2)
+        for j in range(max(1, i - limit), min(len(token2), i + limit) + 1):
+            cost = token1[i - 1] != token2[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost, over)
+            if i > 1 and j > 1 and token1[i - 1] == token2[j - 2] and token1[i - 2] == token2[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return over
+    return current[-1]
+
+
+if __name__ == '__main__':
+    import doctest
+    import python_ta
+
+    doctest.testmod()
+    python_ta.check_all(config={
+        'extra-imports': ['lru', 'doctest', 'heapq', 're', 'unicodedata', 'bisect', 'collections', 'itertools',
+                          'typing'],
+        'allowed-io': [],
+        'max-line-length': 120
+    })
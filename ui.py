@@ -2,19 +2,46 @@
 
 This file is Copyright (c) 2023 Rohan Bhalla, Raghav Sinha, Grant Bogner, and Bora Celebi.
 """
+from __future__ import annotations
+import heapq
+import queue
+import threading
 import tkinter as tk
+from abc import ABC, abstractmethod
+from itertools import islice
 from tkinter import ttk
 from random import randint
-
-import doctest
-import python_ta
+from typing import Iterable, Iterator, Optional
 
 from graph import Graph
+from instrumentation import PhaseStats, QueueSink, Sink, replay
 from movie_user_classes import User
 
+PHASE_LABELS = {
+    'write_snapshot': 'Converting ratings',
+    'load_snapshot': 'Loading ratings',
+    'import_movies': 'Reading movies',
+    'import_ratings': 'Reading ratings',
+    'process_compat_users': 'Finding compatible users',
+    'process_movie_recommends': 'Computing recommendations',
+    'load_results': 'Loading saved results',
+    'save_results': 'Saving results',
+}
+# Phases that run once the datasets are loaded, so the user page can be opened when one of them starts
+RESULT_PHASES = {'load_results', 'process_compat_users', 'process_movie_recommends', 'save_results'}
+POLL_INTERVAL_MS = 50
+SEARCH_DELAY_MS = 150  # Milliseconds after the last keystroke before a movie search runs
+SEARCH_LIMIT = 50
+
 
 def ui_main(graph: Graph, load_fn: lambda _: _) -> None:
-    """ Starts UI and calls load_fn to load data for display
+    """ Starts UI and calls load_fn on a background thread to load data for display, so that the window stays
+    responsive. load_fn is given a Sink whose events are passed back to the loading page through a queue, which is
+    polled every POLL_INTERVAL_MS milliseconds.
+
+    The loading page is replaced by a UserPage as soon as the datasets are loaded: when one of RESULT_PHASES starts,
+    or when load_fn returns. While the results are still being computed, the page shows the results of a user as soon
+    as they are available, and a loading message for the users whose results are not.
     """
     root = tk.Tk()
 
@@ -24,35 +51,108 @@ def ui_main(graph: Graph, load_fn: lambda _: _) -> None:
     root.rowconfigure(1, weight=1)
     root.resizable(False, False)
     root.title("Loading...")
-    root.update()
-    load_fn()
-    loading_page.destroy()
-
-    # User page
-    user = graph.get_user(randint(1, len(graph.get_all_users())-1))
-    UserPage(root, graph, user)
-    root.title("ReelGenius")
+
+    events = queue.Queue()
+
+    def run_load() -> None:
+        # Any error ends this thread, so it is shown on the loading page instead of leaving it spinning
+        try:
+            load_fn(QueueSink(events))
+        except Exception as error:
+            events.put(('failed', f"{type(error).__name__}: {error}"))
+        else:
+            events.put(('ready',))
+
+    user_page = None
+
+    def open_user_page() -> None:
+        nonlocal user_page
+        # The loading page is only hidden, so it can show an error raised while the results are computed
+        loading_page.pack_forget()
+        user = graph.get_user(randint(1, len(graph.get_all_users()) - 1))
+        user_page = UserPage(root, graph, user)
+        root.title("ReelGenius")
+
+    def poll_events() -> None:
+        while not events.empty():
+            event = events.get()
+            if event[0] == 'failed':
+                if user_page is not None:
+                    user_page.destroy()
+                    loading_page.pack(fill=tk.BOTH, expand=True)
+                loading_page.show_error(event[1])
+                return
+            loaded = event[0] == 'ready' or (event[0] == 'phase_started' and event[1] in RESULT_PHASES)
+            if user_page is None and loaded:
+                open_user_page()
+            if event[0] == 'ready':
+                user_page.show_pending_results()
+                return
+            replay(event, loading_page)
+        if user_page is not None:
+            user_page.show_pending_results()
+        root.after(POLL_INTERVAL_MS, poll_events)
+
+    threading.Thread(target=run_load, daemon=True).start()
+    root.after(POLL_INTERVAL_MS, poll_events)
     root.mainloop()
 
 
-class LoadingPage(tk.Frame):
+class LoadingPage(tk.Frame, Sink):
     """ Page with loading progress indicator
     """
+    _label: ttk.Label
+    _progress_bar: ttk.Progressbar
 
     def __init__(self, root: tk.Tk) -> None:
-        tk.Frame.__init__(self, root, width=100)
+        tk.Frame.__init__(self, root, padx=20, pady=20)
+        self._label = ttk.Label(self, text="Loading...", width=40)
+        self._label.pack()
+        self._progress_bar = ttk.Progressbar(self, length=300, maximum=1.0)
+        self._progress_bar.pack(pady=10)
+        self.pack(fill=tk.BOTH, expand=True)
+
+    def phase_started(self, phase: str) -> None:
+        self._label.config(text=PHASE_LABELS.get(phase, phase) + "...")
+        self._progress_bar.config(mode='indeterminate', value=0)
+        self._progress_bar.start()
+
+    def progress(self, phase: str, done: int, total: Optional[int]) -> None:
+        label = PHASE_LABELS.get(phase, phase)
+        if total:
+            self._progress_bar.stop()
+            self._progress_bar.config(mode='determinate', value=done / total)
+            self._label.config(text=f"{label}: {done}/{total}")
+        else:
+            self._label.config(text=f"{label}: {done}")
+
+    def phase_finished(self, stats: PhaseStats) -> None:
+        self._progress_bar.stop()
+        self._progress_bar.config(mode='determinate', value=1.0)
+        self._label.config(text=f"{PHASE_LABELS.get(stats.name, stats.name)}: done in {stats.seconds:.1f}s")
+
+    def show_error(self, message: str) -> None:
+        """ Replaces the progress indicator with message, describing why the data could not be loaded
+        """
+        self._progress_bar.stop()
+        self._progress_bar.pack_forget()
+        self._label.config(text=f"Could not load the data: {message}", wraplength=300)
 
 
 class UserPage(tk.Frame):
     """ Page displaying the graph data for a user
+
+    The tabs are built when they are first opened, and are refilled in place when a different user is shown.
     """
-    _root: tk.Tk
     _graph: Graph
     _user: User
-    _search_entry: ttk.Entry
+    _user_label: ttk.Label
+    _count_label: ttk.Label
+    _notebook: ttk.Notebook
+    _tabs: list[PagedTreeFrame]
+    _stale_tabs: Optional[set[int]]
 
     def __init__(self, root: tk.Tk, graph: Graph, user: User) -> None:
-        self._root = root
         self._graph = graph
         self._user = user
 
@@ -60,26 +160,30 @@ class UserPage(tk.Frame):
 
         # Row 0
         ttk.Label(self, text="ReelGenius", font=(None, 15)).grid(row=0, column=0)
-        self._search_entry = ttk.Entry(self)
-        self._search_entry.grid(row=0, column=1)
-        ttk.Button(self, command=self._search, text="Search User").grid(row=0, column=2)
+        search_entry = ttk.Entry(self)
+        search_entry.grid(row=0, column=1)
+        ttk.Button(self, command=lambda: self._search(search_entry), text="Search User").grid(row=0, column=2)
 
         # User id
-        ttk.Label(self, text=f"User {user.user_id}", font=(None, 20), padding=10).grid(row=1, column=0)
+        self._user_label = ttk.Label(self, font=(None, 20), padding=10)
+        self._user_label.grid(row=1, column=0)
 
         # Counts
-        count_str = f"Recommendations: {len(user.recommendations)}" \
-                    f",  My Ratings: {len(user.movie_ratings)}" \
-                    f",  Compatible Users: {len(user.user_compats)}"
-        ttk.Label(self, text=count_str, font=(None, 12)).grid(row=2, column=0, columnspan=3)
+        self._count_label = ttk.Label(self, font=(None, 12))
+        self._count_label.grid(row=2, column=0, columnspan=3)
 
         # Tabs
-        notebook = ttk.Notebook(self)
-        notebook.add(RecommendationsFrame(notebook, graph, user), text="Recommendations")
-        notebook.add(MyRatingsFrame(notebook, graph, user), text="My Ratings")
-        notebook.add(CompatibleUsersFrame(notebook, user, self._user_link), text="Compatible Users")
-        notebook.grid(row=3, column=0, columnspan=3, sticky='nwes')
-
+        self._notebook = ttk.Notebook(self)
+        self._tabs = [RecommendationsFrame(self._notebook, graph), MyRatingsFrame(self._notebook, graph),
+                      CompatibleUsersFrame(self._notebook, graph, self._user_link),
+                      MovieSearchFrame(self._notebook, graph)]
+        for tab, text in zip(self._tabs, ("Recommendations", "My Ratings", "Compatible Users", "Find a Movie")):
+            self._notebook.add(tab, text=text)
+        self._notebook.grid(row=3, column=0, columnspan=3, sticky='nwes')
+        self._notebook.bind("<<NotebookTabChanged>>", lambda _: self._fill_selected_tab())
+        self._stale_tabs = set()
+
+        self._show_user()
         self.pack(fill=tk.BOTH, expand=True)
 
     def _user_link(self, user_id: int) -> None:
@@ -87,124 +191,255 @@ class UserPage(tk.Frame):
         """
         if self._graph.user_exists(user_id):
             self._user = self._graph.get_user(user_id)
-            self._reload()
+            self._show_user()
 
-    def _search(self) -> None:
+    def _search(self, search_entry: ttk.Entry) -> None:
         """ Parses the search bar and links to the user id
         """
-        entry_str = self._search_entry.get()
-        self._search_entry.delete(0, tk.END)
+        entry_str = search_entry.get()
+        search_entry.delete(0, tk.END)
         if entry_str.isdigit():
             new_user_id = int(entry_str)
             self._user_link(new_user_id)
 
-    def _reload(self) -> None:
-        """ Reloads the page
+    def show_pending_results(self) -> None:
+        """ Fills the page if it is waiting for the results of self._user and they are now available. Called
+        periodically while the results are computed on the loading thread.
         """
-        self.destroy()
-        self._root.update()
-        self.__init__(self._root, self._graph, self._user)
+        if self._stale_tabs is None:
+            self._show_user()
 
+    def _show_user(self) -> None:
+        """ Updates the labels of the page for self._user, and refills the selected tab. The other tabs are refilled
+        when they are next opened. If the results of self._user are not available yet, the tabs are emptied instead,
+        and _stale_tabs is set to None until show_pending_results finds them available.
+        """
+        user = self._user
+        self._user_label.config(text=f"User {user.user_id}")
+        if not self._graph.has_results(user):
+            self._count_label.config(text="Computing the results of this user...")
+            if self._stale_tabs is not None:
+                for tab in self._tabs:
+                    tab.clear()
+                self._stale_tabs = None
+            return
+        count_str = f"Recommendations: {len(self._graph.get_recommendations(user))}" \
+                    f",  My Ratings: {len(user.movie_ratings)}" \
+                    f",  Compatible Users: {len(self._graph.get_user_compats(user))}"
+        self._count_label.config(text=count_str)
+        self._stale_tabs = set(range(len(self._tabs)))
+        self._fill_selected_tab()
 
-class RecommendationsFrame(ttk.Frame):
-    """ Frame displaying list of movie recommendations
+    def _fill_selected_tab(self) -> None:
+        """ Fills the selected tab with the data of self._user, if it does not hold it already
+        """
+        index = self._notebook.index('current')
+        if self._stale_tabs is not None and index in self._stale_tabs:
+            self._stale_tabs.remove(index)
+            self._tabs[index].show_user(self._user)
+
+
+class PagedTreeFrame(ttk.Frame, ABC):
+    """ Frame displaying a list of rows in a Treeview with a scrollbar. Only the first PAGE_SIZE rows are inserted at
+    first, and the next PAGE_SIZE rows are inserted whenever the view is scrolled to the bottom, so showing a user
+    with thousands of rows only finds and formats the rows that are looked at.
+
+    Subclasses provide the keys of the rows of a user with _row_keys, and format the row of a key with _format_row.
     """
+    PAGE_SIZE: int = 50
+    _graph: Graph
+    _tree: ttk.Treeview
+    _scrollbar: ttk.Scrollbar
+    _keys: Optional[Iterator]
+    _inserted: int
 
-    def __init__(self, notebook: ttk.Notebook, graph: Graph, user: User) -> None:
+    def __init__(self, notebook: ttk.Notebook, graph: Graph, headings: tuple[str, str]) -> None:
         ttk.Frame.__init__(self, notebook)
+        self._graph = graph
+        self._keys = None
+        self._inserted = 0
 
         # Scrollbar
-        scrollbar = ttk.Scrollbar(self, orient='vertical')
-        scrollbar.pack(side=tk.RIGHT, fill=tk.BOTH)
+        self._scrollbar = ttk.Scrollbar(self, orient='vertical')
+        self._scrollbar.pack(side=tk.RIGHT, fill=tk.BOTH)
 
         # Treeview
-        tree = ttk.Treeview(self, column=("c1", "c2"), show='headings', height=10)
-        tree.column("# 1", anchor=tk.CENTER)
-        tree.heading("# 1", text="Title")
-        tree.column("# 2", anchor=tk.CENTER)
-        tree.heading("# 2", text="Rank")
+        self._tree = ttk.Treeview(self, column=("c1", "c2"), show='headings', height=10)
+        self._tree.column("# 1", anchor=tk.CENTER)
+        self._tree.heading("# 1", text=headings[0])
+        self._tree.column("# 2", anchor=tk.CENTER)
+        self._tree.heading("# 2", text=headings[1])
+        self._tree.pack()
+
+        self._tree.config(yscrollcommand=self._on_scroll)
+        self._scrollbar.config(command=self._tree.yview)
+
+    def show_user(self, user: User) -> None:
+        """ Replaces the rows of this frame with the rows of user
+        """
+        self._show_keys(self._row_keys(user))
 
-        for i, movie_id in enumerate(user.recommendations):
-            movie = graph.get_movie(movie_id)
-            cell_1 = movie.title
-            cell_2 = str(i + 1)
-            tree.insert('', 'end', text=cell_1, values=(cell_1, cell_2))
-        tree.pack()
+    def clear(self) -> None:
+        """ Removes every row of this frame
+        """
+        self._show_keys(())
 
-        tree.config(yscrollcommand=scrollbar.set)
-        scrollbar.config(command=tree.yview)
+    def _show_keys(self, keys: Iterable) -> None:
+        """ Replaces the rows of this frame with the rows of keys
+        """
+        self._tree.delete(*self._tree.get_children())
+        self._keys = iter(keys)
+        self._inserted = 0
+        self._insert_page()
+
+    @abstractmethod
+    def _row_keys(self, user: User) -> Iterable:
+        """ Returns the keys of the rows of user, in display order. Only the keys of the rows inserted are taken from
+        it, so the keys may be found as they are taken.
+        """
 
+    @abstractmethod
+    def _format_row(self, position: int, key: object) -> tuple[tuple[str, str], list]:
+        """ Returns the (cells, tags) of the row of key, shown at the given position (starting from 0)
+        """
 
-class MyRatingsFrame(ttk.Frame):
-    """ Frame displaying list of movie ratings
-    """
+    def _insert_page(self) -> None:
+        """ Inserts the next PAGE_SIZE rows that are not in the Treeview yet
+        """
+        stop = self._inserted + self.PAGE_SIZE
+        for key in islice(self._keys, self.PAGE_SIZE):
+            cells, tags = self._format_row(self._inserted, key)
+            self._tree.insert('', 'end', tags=tags, text=cells[0], values=cells)
+            self._inserted += 1
+        if self._inserted < stop:
+            self._keys = None
+
+    def _on_scroll(self, first: str, last: str) -> None:
+        """ Updates the scrollbar, and inserts more rows if the view reaches the last inserted row
+        """
+        self._scrollbar.set(first, last)
+        if float(last) >= 1.0 and self._keys is not None:
+            self._insert_page()
 
-    def __init__(self, notebook: ttk.Notebook, graph: Graph, user: User) -> None:
-        ttk.Frame.__init__(self, notebook)
 
-        # Scrollbar
-        scrollbar = ttk.Scrollbar(self, orient='vertical')
-        scrollbar.pack(side=tk.RIGHT, fill=tk.BOTH)
+class RecommendationsFrame(PagedTreeFrame):
+    """ Frame displaying list of movie recommendations
+    """
 
-        # Treeview
-        tree = ttk.Treeview(self, column=("c1", "c2"), show='headings', height=10)
-        tree.column("# 1", anchor=tk.CENTER)
-        tree.heading("# 1", text="Title")
-        tree.column("# 2", anchor=tk.CENTER)
-        tree.heading("# 2", text="Rating")
+    def __init__(self, notebook: ttk.Notebook, graph: Graph) -> None:
+        PagedTreeFrame.__init__(self, notebook, graph, ("Title", "Rank"))
 
-        for movie_id, rating in user.movie_ratings.items():
-            movie = graph.get_movie(movie_id)
-            cell_1 = movie.title
-            cell_2 = str(rating)
-            tree.insert('', 'end', text=cell_1, values=(cell_1, cell_2))
-        tree.pack()
+    def _row_keys(self, user: User) -> list[int]:
+        return self._graph.get_recommendations(user)
 
-        tree.config(yscrollcommand=scrollbar.set)
-        scrollbar.config(command=tree.yview)
+    def _format_row(self, position: int, key: int) -> tuple[tuple[str, str], list]:
+        return (self._graph.get_movie(key).title, str(position + 1)), []
 
 
-class CompatibleUsersFrame(ttk.Frame):
-    """ Frame displaying list of compatible users
+class MyRatingsFrame(PagedTreeFrame):
+    """ Frame displaying list of movie ratings
     """
 
-    def __init__(self, notebook: ttk.Notebook, user: User, user_link_fn: lambda _: None) -> None:
-        ttk.Frame.__init__(self, notebook)
+    def __init__(self, notebook: ttk.Notebook, graph: Graph) -> None:
+        PagedTreeFrame.__init__(self, notebook, graph, ("Title", "Rating"))
 
-        # Scrollbar
-        scrollbar = ttk.Scrollbar(self, orient='vertical')
-        scrollbar.pack(side=tk.RIGHT, fill=tk.BOTH)
+    def _row_keys(self, user: User) -> Iterable[tuple[int, float]]:
+        return user.movie_ratings.items()
+
+    def _format_row(self, position: int, key: tuple[int, float]) -> tuple[tuple[str, str], list]:
+        movie_id, rating = key
+        return (self._graph.get_movie(movie_id).title, str(rating)), []
 
-        # Treeview
-        tree = ttk.Treeview(self, column=("c1", "c2"), show='headings', height=10)
-        tree.column("# 1", anchor=tk.CENTER)
-        tree.heading("# 1", text="User")
-        tree.column("# 2", anchor=tk.CENTER)
-        tree.heading("# 2", text="Score")
-        tree.tag_configure('link', foreground='blue', font=(None, 13, 'underline'))
-
-        for user_id, score in sorted(user.user_compats.items(), key=lambda x: x[1], reverse=True):
-            cell_1 = 'User ' + str(user_id)
-            cell_2 = f"{score:.2f}"
-            tree.insert('', 'end', tags=[user_id, 'link'], text=cell_1, values=(cell_1, cell_2))
-        tree.pack()
+
+class CompatibleUsersFrame(PagedTreeFrame):
+    """ Frame displaying list of compatible users
+    """
+    _user_compats: dict[int, float]
+
+    def __init__(self, notebook: ttk.Notebook, graph: Graph, user_link_fn: lambda _: None) -> None:
+        PagedTreeFrame.__init__(self, notebook, graph, ("User", "Score"))
+        self._user_compats = {}
+        self._tree.tag_configure('link', foreground='blue', font=(None, 13, 'underline'))
 
         # Clickable user links
         def tree_press(_: tk.Event) -> None:
-            input_id = tree.selection()
-            selected_user_id = int(tree.item(input_id, 'tags')[0])
+            input_id = self._tree.selection()
+            selected_user_id = int(self._tree.item(input_id, 'tags')[0])
             user_link_fn(selected_user_id)
 
-        tree.bind("<Double-1>", tree_press)
+        self._tree.bind("<Double-1>", tree_press)
+
+    def _row_keys(self, user: User) -> Iterator[int]:
+        self._user_compats = self._graph.get_user_compats(user)
+        return descending_keys(self._user_compats)
 
-        tree.config(yscrollcommand=scrollbar.set)
-        scrollbar.config(command=tree.yview)
+    def _format_row(self, position: int, key: int) -> tuple[tuple[str, str], list]:
+        return ('User ' + str(key), f"{self._user_compats[key]:.2f}"), [key, 'link']
+
+
+class MovieSearchFrame(PagedTreeFrame):
+    """ Frame searching the movies by title as the query is typed in its entry.
+
+    The search runs SEARCH_DELAY_MS after the last keystroke, so typing a word only runs one search, and the Tk loop
+    is never held up by a search for every key pressed.
+    """
+    _query: tk.StringVar
+    _pending: Optional[str]
+    _results: list[int]
+
+    def __init__(self, notebook: ttk.Notebook, graph: Graph) -> None:
+        PagedTreeFrame.__init__(self, notebook, graph, ("Title", "Genres"))
+        self._pending = None
+        self._results = []
+        self._query = tk.StringVar(self)
+        ttk.Entry(self, textvariable=self._query).pack(side=tk.TOP, fill=tk.X, before=self._scrollbar)
+        self._query.trace_add('write', lambda *_: self._schedule_search())
+
+    def _schedule_search(self) -> None:
+        """ Runs the search SEARCH_DELAY_MS from now, instead of when it was scheduled before
+        """
+        if self._pending is not None:
+            self.after_cancel(self._pending)
+        self._pending = self.after(SEARCH_DELAY_MS, self._search)
+
+    def _search(self) -> None:
+        """ Shows the movies matching the query in the entry
+        """
+        self._pending = None
+        self._results = self._graph.search_titles(self._query.get(), SEARCH_LIMIT)
+        self._show_keys(self._results)
+
+    def _row_keys(self, user: User) -> list[int]:
+        return self._results
+
+    def _format_row(self, position: int, key: int) -> tuple[tuple[str, str], list]:
+        movie = self._graph.get_movie(key)
+        return (movie.title, ', '.join(movie.get_genres())), []
+
+
+def descending_keys(scores: dict[int, float]) -> Iterator[int]:
+    """ Yields the keys of scores in descending order of score, ties broken by lowest key. The keys are put in a heap
+    in linear time and popped as they are taken, so taking the first k of n keys takes O(n + k log n) time instead of
+    sorting all of them.
+
+    >>> list(descending_keys({1: 3.0, 2: 4.5, 3: 3.0}))
+    [2, 1, 3]
+    """
+    heap = [(-score, key) for key, score in scores.items()]
+    heapq.heapify(heap)
+    while heap:
+        yield heapq.heappop(heap)[1]
 
 
 if __name__ == '__main__':
+    import doctest
+    import python_ta
+
     doctest.testmod()
     python_ta.check_all(config={
-        'extra-imports': ['tkinter', 'movie_user_classes', 'graph', 'doctest', 'random'],
+        'extra-imports': ['__future__', 'tkinter', 'movie_user_classes', 'graph', 'instrumentation', 'doctest', 'abc',
+                          'heapq', 'itertools', 'queue', 'random', 'threading', 'typing'],
         'allowed-io': [],
+        'disable': ['W0703'],  # run_load shows any error raised while loading on the loading page
         'max-line-length': 120
     })